@@ -11,3 +11,4 @@ from .review import router as review
 from .history import router as history
 from .mindmap import router as mindmap
 from .deleteHistory import router as deleteHistory
+from .jobs import router as jobs
@@ -9,7 +9,8 @@
 from fastapi import APIRouter, Form, HTTPException
 from typing import Optional
 from backend.core.logger import Config, setup_logger
-from backend.database.sqlite_db import delete_review
+from backend.database.sqlite_db import delete_review, delete_reviews
+from datetime import datetime, timedelta
 
 # 加载配置和安装记录器
 config = Config("./config.yaml")
@@ -40,4 +41,39 @@ async def delete_history(data_id: str = Form("")):
             logger.info(f"记录{data_id} 删除成功")
 
     except Exception as err:
-        logger.info(f"删除记录出现错误，{err}")
\ No newline at end of file
+        logger.info(f"删除记录出现错误，{err}")
+
+
+@router.post("/bulk")
+async def delete_history_bulk(ids: str = Form(""), github_url: Optional[str] = Form(None), branch: Optional[str] = Form(None),
+                              older_than_days: Optional[float] = Form(None)):
+    """
+    批量删除记录，多个条件同时提供时取交集，在一个事务中完成
+
+    :param ids: 逗号分隔的记录行标
+    :param github_url: 删除该仓库的记录
+    :param branch: 与 github_url 一起使用，只删除该分支的记录
+    :param older_than_days: 删除早于指定天数的记录
+    :return: {"deleted": 删除的记录数}
+    """
+
+    try:
+        id_list = [int(item) for item in ids.split(",") if item.strip()]
+
+    except ValueError:
+        raise HTTPException(status_code=400, detail="记录行标格式错误")
+
+    if not id_list and not github_url and older_than_days is None:
+        logger.info("没有提供删除条件")
+        raise HTTPException(status_code=400, detail="请提供记录行标、仓库地址或保留天数")
+
+    before = (datetime.now() - timedelta(days=older_than_days)).isoformat() if older_than_days is not None else None
+
+    try:
+        deleted = delete_reviews(id_list, github_url, branch, before)
+
+    except Exception as err:
+        logger.info(f"批量删除记录出现错误，{err}")
+        raise HTTPException(status_code=500, detail="记录删除失败")
+
+    return {"deleted": deleted}
@@ -10,71 +10,261 @@
 from fastapi import APIRouter, HTTPException
 from github import Github, GithubException
 from backend.core.logger import Config, setup_logger
+from backend.core.languages import is_supported, language_for_path
+from backend.core.mirror import is_local_repository, is_valid_ref, sync_mirror, read_files, changed_paths
+from backend.core import mirror
 from dotenv import load_dotenv
+from typing import Dict, List, Optional, Set
+from io import BytesIO
+import asyncio
+import tarfile
+import time
+import httpx
 import os
 
 # 加载配置和安装记录器
 config = Config("./config.yaml")
 logger = setup_logger(config)
 GITHUB_TOKEN = config.get_nested("github_set", "token", default="")
+# 获取方式: auto 自动选择; tree 逐个下载文件; tarball 下载整个仓库压缩包
+FETCH_MODE = str(config.get_nested("github_set", "FETCH_MODE", default="auto")).lower()
+# 并发下载文件数
+FETCH_CONCURRENCY = max(1, int(config.get_nested("github_set", "FETCH_CONCURRENCY", default=8)))
+# auto 模式下文件数超过该值时改用压缩包下载
+TARBALL_THRESHOLD = int(config.get_nested("github_set", "TARBALL_THRESHOLD", default=200))
+# 是否允许读取服务器本地仓库（file:// 地址或本地路径），用于离线环境
+ALLOW_LOCAL_REPO = str(config.get_nested("github_set", "ALLOW_LOCAL_REPO", default="false")).lower() == "true"
+# 触发限流时最长等待秒数，超过则直接报错
+RATE_LIMIT_MAX_WAIT = 60
+
+GITHUB_API = "https://api.github.com"
 
 router = APIRouter(prefix="/api/github", tags=["github"])
 
 
+def in_path(file_path: str, path: str) -> bool:
+    """判断文件是否位于指定的文件或目录路径下"""
+
+    path = path.strip("/")
+    return not path or file_path == path or file_path.startswith(path + "/")
+
+
+def github_headers(accept: str = "application/vnd.github+json") -> Dict[str, str]:
+    return {
+        "Authorization": f"Bearer {GITHUB_TOKEN}",
+        "Accept": accept,
+        "X-GitHub-Api-Version": "2022-11-28"
+    }
+
+
+async def github_get(client: httpx.AsyncClient, url: str, **kwargs) -> httpx.Response:
+    """
+    发送GET请求，触发限流时按 Retry-After / X-RateLimit-Reset 等待后重试一次
+
+    :param client: httpx异步客户端
+    :param url: 请求地址
+    :return: 响应对象
+    """
+
+    for attempt in range(2):
+        response = await client.get(url, **kwargs)
+        if response.status_code not in (403, 429):
+            response.raise_for_status()
+            return response
+
+        if response.headers.get("Retry-After"):
+            wait = int(response.headers["Retry-After"])
+
+        elif response.headers.get("X-RateLimit-Remaining") == "0":
+            wait = int(response.headers.get("X-RateLimit-Reset", 0)) - int(time.time()) + 1
+
+        else:
+            response.raise_for_status()
+
+        if attempt or wait > RATE_LIMIT_MAX_WAIT:
+            raise HTTPException(status_code=429, detail=f"GitHub API 访问频次达到上限，请在 {max(wait, 0)} 秒后重试")
+
+        logger.warning(f"GitHub API 限流，{wait} 秒后重试")
+        await asyncio.sleep(max(wait, 0))
+
+
+async def fetch_blobs(client: httpx.AsyncClient, repo_name: str, entries: list) -> Dict[str, dict]:
+    """
+    并发下载文件内容
+
+    :param client: httpx异步客户端
+    :param repo_name: owner/repo
+    :param entries: git tree 中的文件条目
+    :return: {文件路径: {"language": str, "code": str}}
+    """
+
+    semaphore = asyncio.Semaphore(FETCH_CONCURRENCY)
+
+    async def fetch(entry) -> Optional[str]:
+        async with semaphore:
+            try:
+                response = await github_get(client, f"{GITHUB_API}/repos/{repo_name}/git/blobs/{entry.sha}",
+                                            headers=github_headers("application/vnd.github.raw+json"))
+                logger.info(f"获取文件: {entry.path}")
+                return response.content.decode("utf-8")
+
+            except HTTPException:
+                raise
+
+            except UnicodeDecodeError as e:
+                logger.warning(f"文件解码失败 {entry.path}: {str(e)}")
+                return None
+
+            except httpx.HTTPError as e:
+                # 下载失败时中止，避免把不完整的仓库当作完整结果审查
+                logger.error(f"文件下载失败 {entry.path}: {str(e)}")
+                raise
+
+    codes = await asyncio.gather(*(fetch(entry) for entry in entries))
+
+    return {
+        entry.path: {"language": language_for_path(entry.path), "code": code}
+        for entry, code in zip(entries, codes) if code is not None
+    }
+
+
+def extract_tarball(data: bytes, path: str) -> Dict[str, dict]:
+    """
+    在内存中解压仓库压缩包并筛选支持的文件
+
+    :param data: tar.gz 内容
+    :param path: 指定的文件或目录路径
+    :return: {文件路径: {"language": str, "code": str}}
+    """
+
+    code_files = {}
+    with tarfile.open(fileobj=BytesIO(data), mode="r:gz") as archive:
+        for member in archive:
+            # 压缩包内第一级目录为 owner-repo-sha
+            file_path = member.name.split("/", 1)[-1]
+            if not member.isfile() or not is_supported(file_path) or not in_path(file_path, path):
+                continue
+
+            try:
+                code = archive.extractfile(member).read().decode("utf-8")
+                code_files[file_path] = {"language": language_for_path(file_path), "code": code}
+                logger.info(f"获取文件: {file_path}")
+
+            except UnicodeDecodeError as e:
+                logger.warning(f"文件解码失败 {file_path}: {str(e)}")
+
+    return code_files
+
+
+async def fetch_tarball(client: httpx.AsyncClient, repo_name: str, branch: str, path: str) -> Dict[str, dict]:
+    """
+    通过一次压缩包下载获取整个仓库，只消耗一次API调用
+
+    :return: {文件路径: {"language": str, "code": str}}
+    """
+
+    buffer = bytearray()
+    async with client.stream("GET", f"{GITHUB_API}/repos/{repo_name}/tarball/{branch}", headers=github_headers()) as response:
+        response.raise_for_status()
+        async for chunk in response.aiter_bytes():
+            buffer.extend(chunk)
+
+    logger.info(f"仓库压缩包下载完成: {repo_name} ({len(buffer)} bytes)")
+    return await asyncio.get_running_loop().run_in_executor(None, extract_tarball, bytes(buffer), path)
+
+
+def fetch_mirror_code(github_url: str, branch: str, path: str) -> Dict[str, dict]:
+    """
+    从本地镜像读取代码，远程仓库首次浅克隆，之后只拉取增量；本地仓库直接读取
+
+    :return: {文件路径: {"language": str, "code": str}}
+    """
+
+    git_dir = sync_mirror(github_url, branch)
+    ref = branch if is_local_repository(github_url) else f"refs/heads/{branch}"
+    contents = read_files(git_dir, ref, lambda file_path: is_supported(file_path) and in_path(file_path, path))
+
+    code_files = {}
+    for file_path, content in contents.items():
+        try:
+            code_files[file_path] = {"language": language_for_path(file_path), "code": content.decode("utf-8")}
+            logger.info(f"获取文件: {file_path}")
+
+        except UnicodeDecodeError as e:
+            logger.warning(f"文件解码失败 {file_path}: {str(e)}")
+
+    return code_files
+
+
 async def fetch_github_code(github_url: str, branch: str = "main", path: str = "") -> dict:
     """
     从GitHub仓库获取代码，支持多种语言（.py、.cpp、.java、.js、.cs）。
+    通过一次递归的 git tree 请求列出全部文件，再并发下载文件内容；
+    文件较多或剩余API配额不足时改为下载仓库压缩包。
+    FETCH_MODE 为 mirror 或传入本地仓库时从本地镜像读取。
     参数:
-    github_url：存储库的URL（例如https://github.com/owner/repo）。
+    github_url：存储库的URL（例如https://github.com/owner/repo），或本地仓库路径/file:// 地址。
     branch：目标分支（默认：main）。
     path：指定的文件或目录路径（默认为root）。
     返回：包含语言和代码字符串的字典。
     """
 
-    if not GITHUB_TOKEN:
+    local = is_local_repository(github_url)
+    if local and not ALLOW_LOCAL_REPO:
+        logger.error("未允许读取本地仓库")
+        raise HTTPException(status_code=400, detail="未允许读取本地仓库，请检查配置文件 github_set.ALLOW_LOCAL_REPO")
+
+    if not GITHUB_TOKEN and not local and FETCH_MODE != "mirror":
         logger.error("GitHub token not configured")
         raise HTTPException(status_code=500, detail="GitHub token不存在，请检查配置文件")
 
     try:
+        loop = asyncio.get_running_loop()
+
+        if use_mirror(github_url):
+            if not is_valid_ref(branch):
+                raise HTTPException(status_code=400, detail="无效的分支名称")
+
+            logger.info(f"Fetching code from mirror: {github_url}, branch: {branch}, path: {path}")
+            code_files = await loop.run_in_executor(None, fetch_mirror_code, github_url, branch, path)
+
+            if not code_files:
+                logger.warning(f"在存储库中没有找到支持的文件: {github_url}")
+                raise HTTPException(status_code=404, detail="不支持代码文件 (.py, .cpp, .java, .js, .cs) found")
+
+            return code_files
+
         g = Github(GITHUB_TOKEN)
         # 提取存储库名称（格式：https://github.com/owner/repo）
         repo_name = github_url.split("github.com/")[1].rstrip("/")
         logger.info(f"Fetching code from GitHub repository: {repo_name}, branch: {branch}, path: {path}")
-        repo = g.get_repo(repo_name)
-
-        # 从指定的路径和分支获取内容
-        contents = repo.get_contents(path, ref=branch)
-        if not isinstance(contents, list):
-            contents = [contents]
-
-        # 支持的文件扩展名
-        supported_extensions = (".py", ".cpp", ".java", ".js", ".cs")
-        code_files = {}
-
-        for content in contents:
-            if content.type == "file" and content.path.endswith(supported_extensions):
-                try:
-                    lang = content.path.split(".")[-1]  # e.g., "py" for Python
-                    code = content.decoded_content.decode("utf-8")
-                    code_files[content.path] = {"language": lang, "code": code}
-                    logger.info(f"获取文件: {content.path}")
-
-                except Exception as e:
-                    logger.warning(f"文件解码失败 {content.path}: {str(e)}")
-
-            elif content.type == "dir":
-                # 递归地获取子目录中的文件
-                sub_contents = repo.get_contents(content.path, ref=branch)
-                for sub_content in sub_contents:
-                    if sub_content.path.endswith(supported_extensions):
-                        try:
-                            lang = sub_content.path.split(".")[-1]
-                            code = sub_content.decoded_content.decode("utf-8")
-                            code_files[sub_content.path] = {"language": lang, "code": code}
-                            logger.info(f"获取文件: {sub_content.path}")
-
-                        except Exception as e:
-                            logger.warning(f"文件解码失败 {sub_content.path}: {str(e)}")
+
+        async with httpx.AsyncClient(timeout=60, follow_redirects=True) as client:
+            mode = FETCH_MODE
+            entries: List = []
+
+            if mode != "tarball":
+                repo = await loop.run_in_executor(None, g.get_repo, repo_name)
+                tree = await loop.run_in_executor(None, lambda: repo.get_git_tree(branch, recursive=True))
+                entries = [
+                    entry for entry in tree.tree
+                    if entry.type == "blob" and is_supported(entry.path) and in_path(entry.path, path)
+                ]
+
+                remaining, _ = g.rate_limiting
+                if tree.truncated:
+                    logger.info("git tree 结果被截断，改为下载仓库压缩包")
+                    mode = "tarball"
+
+                elif mode == "auto" and (len(entries) > TARBALL_THRESHOLD or len(entries) >= remaining):
+                    logger.info(f"文件数 {len(entries)}，剩余API配额 {remaining}，改为下载仓库压缩包")
+                    mode = "tarball"
+
+            if mode == "tarball":
+                code_files = await fetch_tarball(client, repo_name, branch, path)
+
+            else:
+                code_files = await fetch_blobs(client, repo_name, entries)
 
         if not code_files:
             logger.warning(f"在存储库中没有找到支持的文件: {repo_name}")
@@ -82,15 +272,104 @@ async def fetch_github_code(github_url: str, branch: str = "main", path: str = "
 
         return code_files
 
+    except HTTPException:
+        raise
+
     except GithubException as e:
         logger.error(f"GitHub API错误: {str(e)}")
         raise HTTPException(status_code=400, detail=f"无法访问GitHub仓库: {str(e)}")
 
+    except httpx.HTTPStatusError as e:
+        logger.error(f"GitHub API错误: {str(e)}")
+        raise HTTPException(status_code=400, detail=f"无法访问GitHub仓库: {str(e)}")
+
+    except httpx.HTTPError as e:
+        logger.error(f"下载仓库文件失败: {str(e)}")
+        raise HTTPException(status_code=502, detail=f"下载仓库文件失败: {str(e)}")
+
+    except RuntimeError as e:
+        logger.error(f"镜像同步失败: {str(e)}")
+        raise HTTPException(status_code=400, detail=f"无法访问仓库: {str(e)}")
+
     except Exception as e:
         logger.error(f"获取代码失败: {str(e)}")
         raise HTTPException(status_code=500, detail=f"获取代码失败: {str(e)}")
 
 
+def use_mirror(github_url: str) -> bool:
+    """是否通过本地镜像访问该仓库"""
+
+    return FETCH_MODE == "mirror" or (ALLOW_LOCAL_REPO and is_local_repository(github_url))
+
+
+async def resolve_commit(github_url: str, branch: str) -> Optional[str]:
+    """
+    获取分支当前指向的提交
+
+    :param github_url: 仓库地址
+    :param branch: 分支
+    :return: 提交sha，获取失败返回None
+    """
+
+    loop = asyncio.get_running_loop()
+
+    try:
+        if use_mirror(github_url):
+            git_dir = await loop.run_in_executor(None, sync_mirror, github_url, branch)
+            ref = branch if is_local_repository(github_url) else f"refs/heads/{branch}"
+            return await loop.run_in_executor(None, mirror.resolve_commit, git_dir, ref)
+
+        repo_name = github_url.split("github.com/")[1].rstrip("/")
+        repo = await loop.run_in_executor(None, Github(GITHUB_TOKEN).get_repo, repo_name)
+        return await loop.run_in_executor(None, lambda: repo.get_branch(branch).commit.sha)
+
+    except Exception as e:
+        logger.warning(f"获取分支提交失败 {github_url} ({branch}): {str(e)}")
+        return None
+
+
+async def get_changed_paths(github_url: str, branch: str, base: str, head: str) -> Optional[Set[str]]:
+    """
+    获取两个提交之间变化的文件路径
+
+    :param github_url: 仓库地址
+    :param branch: 分支（镜像模式下用于定位镜像）
+    :param base: 基准提交或引用
+    :param head: 目标提交
+    :return: 变化的文件路径集合，无法比较时返回None
+    """
+
+    loop = asyncio.get_running_loop()
+
+    try:
+        if use_mirror(github_url):
+            git_dir = await loop.run_in_executor(None, sync_mirror, github_url, branch)
+            url = None if is_local_repository(github_url) else github_url
+            return set(await loop.run_in_executor(None, changed_paths, git_dir, base, head, url))
+
+        repo_name = github_url.split("github.com/")[1].rstrip("/")
+        repo = await loop.run_in_executor(None, Github(GITHUB_TOKEN).get_repo, repo_name)
+        comparison = await loop.run_in_executor(None, repo.compare, base, head)
+        files = comparison.files
+
+        # compare 接口最多返回300个文件，超出时无法得到完整列表
+        if len(files) >= 300:
+            logger.info("变化文件过多，无法增量审查")
+            return None
+
+        paths = set()
+        for item in files:
+            paths.add(item.filename)
+            if item.previous_filename:
+                paths.add(item.previous_filename)
+
+        return paths
+
+    except Exception as e:
+        logger.warning(f"比较提交失败 {base}..{head}: {str(e)}")
+        return None
+
+
 @router.get("/fetch")
 async def get_github_code(github_url: str, branch: str = "main", path: str = ""):
     """
@@ -103,11 +382,11 @@ async def get_github_code(github_url: str, branch: str = "main", path: str = "")
     """
 
     # 验证github_url格式
-    if not github_url.startswith("https://github.com/"):
+    if not github_url.startswith("https://github.com/") and not (ALLOW_LOCAL_REPO and is_local_repository(github_url)):
         return {"error": "Invalid GitHub URL. Must start with 'https://github.com/'"}
 
     # 验证branch/path非恶意输入（简单示例）
-    if ".." in branch or ".." in path:
+    if ".." in branch or ".." in path or not is_valid_ref(branch):
         return {"error": "Invalid branch or path parameter"}
 
     try:
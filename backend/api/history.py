@@ -6,13 +6,13 @@
 # @File : history.py
 # @desc : 历史节点，返回数据库中保存的历史数据
 
-from fastapi import APIRouter, Form, HTTPException
+from fastapi import APIRouter, Form, HTTPException, Query
 from typing import Optional
 from backend.core.parser import CodeTree
 from backend.core.analyzer import Analyzer
 from backend.core.model import send_message
 from backend.core.logger import Config, setup_logger
-from backend.database.sqlite_db import save_review, get_reviews
+from backend.database.sqlite_db import save_review, get_reviews, get_review_summaries, get_review_detail
 
 # 加载配置和安装记录器
 config = Config("./config.yaml")
@@ -20,6 +20,9 @@ logger = setup_logger(config)
 
 router = APIRouter(prefix="/api/history", tags=["history"])
 
+# 分页接口单页最大条数
+MAX_PAGE_SIZE = 200
+
 
 @router.get("/")
 async def history_data():
@@ -42,3 +45,44 @@ async def history_data():
     return get_reviews()
 
 
+@router.get("/summary")
+async def history_summary(limit: int = Query(50, ge=1, le=MAX_PAGE_SIZE), cursor: Optional[str] = None,
+                          github_url: Optional[str] = None, branch: Optional[str] = None, language: Optional[str] = None,
+                          file: Optional[str] = None, since: Optional[str] = None, until: Optional[str] = None,
+                          q: Optional[str] = None):
+    """
+    分页返回历史记录摘要（id、文件、语言、时间、仓库、分支），不包含代码等大字段
+    :param limit: 每页条数
+    :param cursor: 上一页返回的 next_cursor
+    :param github_url: 仓库地址
+    :param branch: 分支
+    :param language: 语言
+    :param file: 文件路径中包含的文本
+    :param since: 起始时间（ISO格式，包含）
+    :param until: 结束时间（ISO格式，不包含）
+    :param q: 在审查问题和文档中全文检索的关键词
+    :return:
+        {
+            "items": [{"id": "12", "file": "main.py", "language": "python", "timestamp": "...", "github_url": "...", "branch": "main"}],
+            "next_cursor": "3"
+        }
+    """
+
+    if cursor is not None and not cursor.isdigit():
+        raise HTTPException(status_code=400, detail="无效的分页游标")
+
+    return get_review_summaries(limit, int(cursor) if cursor is not None else None, github_url=github_url, branch=branch,
+                                language=language, file=file, since=since, until=until, query=q)
+
+
+@router.get("/{review_id}")
+async def history_detail(review_id: int):
+    """
+    返回单条历史记录的完整内容，格式与 /api/history/ 中的单条记录相同
+    """
+
+    record = get_review_detail(review_id)
+    if record is None:
+        raise HTTPException(status_code=404, detail="记录不存在")
+
+    return record
@@ -0,0 +1,212 @@
+#!/usr/bin/env python
+# _*_ coding: utf-8 _*_
+# @Time : 2026/10/18 上午11:50
+# @Author : Huzhaojun
+# @Version：V 1.0
+# @File : jobs.py
+# @desc : 后台审查任务，大型仓库的审查在后台执行，客户端通过任务id查询进度和部分结果
+
+import asyncio
+from uuid import uuid4
+from typing import Optional, List
+
+from fastapi import APIRouter, Form, HTTPException
+from backend.core.logger import Config, setup_logger
+from backend.api.review import load_code_files, create_pipeline
+from backend.database.sqlite_db import (create_job, get_job, find_active_job, get_unfinished_jobs, update_job,
+                                        save_job_files, get_job_files, save_job_file_result)
+
+# 加载配置和安装记录器
+config = Config("./config.yaml")
+logger = setup_logger(config)
+
+# 同时执行的任务数
+WORKERS = max(1, int(config.get_nested("job_set", "WORKERS", default=2)))
+
+_queue: Optional[asyncio.Queue] = None
+_workers: List[asyncio.Task] = []
+
+
+def get_queue() -> asyncio.Queue:
+    """获取任务队列，延迟到事件循环中创建"""
+
+    global _queue
+    if _queue is None:
+        _queue = asyncio.Queue()
+
+    return _queue
+
+
+async def in_thread(func, *args, **kwargs):
+    """在线程中执行阻塞的数据库操作，避免写入竞争时阻塞事件循环"""
+
+    return await asyncio.get_running_loop().run_in_executor(None, lambda: func(*args, **kwargs))
+
+
+async def run_job(job_id: str):
+    """
+    执行审查任务，已完成的文件会被跳过，因此中断后重新执行即可从断点继续
+
+    :param job_id: 任务id
+    :return: None
+    """
+
+    job = await in_thread(get_job, job_id)
+    if not job or job["status"] not in ("queued", "running"):
+        return
+
+    await in_thread(update_job, job_id, status="running")
+    logger.info(f"开始执行审查任务 {job_id}")
+
+    try:
+        files = await in_thread(get_job_files, job_id)
+
+        # 首次执行时获取文件列表并持久化
+        if not files:
+            code_files = await load_code_files(job["code"], job["github_url"], job["branch"], job["path"])
+            await in_thread(save_job_files, job_id, code_files)
+            files = await in_thread(get_job_files, job_id)
+
+        pending = [item for item in files if item["status"] != "done"]
+        logger.info(f"审查任务 {job_id}: 共 {len(files)} 个文件，待处理 {len(pending)} 个")
+
+        process = await create_pipeline(job["github_url"], job["branch"], bool(job["bypass_cache"]))
+
+        async def run(item: dict):
+            result = await process(item["file"], {"language": item["language"], "code": item["code"]})
+            if result is None:
+                result = {"file": item["file"], "language": item["language"], "error": "Error Server reply"}
+
+            await in_thread(save_job_file_result, job_id, item["idx"], result)
+
+        await asyncio.gather(*(run(item) for item in pending))
+        await in_thread(update_job, job_id, status="completed")
+        logger.info(f"审查任务完成 {job_id}")
+
+    except asyncio.CancelledError:
+        # 服务退出，保持running状态以便下次启动时恢复
+        raise
+
+    except Exception as err:
+        logger.error(f"审查任务失败 {job_id}: {err}", exc_info=True)
+        await in_thread(update_job, job_id, status="failed", error=str(err))
+
+
+async def _worker():
+    queue = get_queue()
+    while True:
+        job_id = await queue.get()
+        try:
+            await run_job(job_id)
+
+        except asyncio.CancelledError:
+            raise
+
+        except Exception as err:
+            logger.error(f"审查任务异常 {job_id}: {err}")
+
+        finally:
+            queue.task_done()
+
+
+def ensure_workers() -> None:
+    """任务执行器尚未启动时启动（例如应用挂载方式不同，路由的启动事件没有执行）"""
+
+    if not _workers:
+        for _ in range(WORKERS):
+            _workers.append(asyncio.ensure_future(_worker()))
+
+
+async def start_workers():
+    """启动任务执行器，并恢复上次退出时未完成的任务"""
+
+    ensure_workers()
+
+    unfinished = await in_thread(get_unfinished_jobs)
+    for job_id in unfinished:
+        get_queue().put_nowait(job_id)
+
+    if unfinished:
+        logger.info(f"恢复未完成的审查任务 {len(unfinished)} 个")
+
+
+async def stop_workers():
+    """停止任务执行器"""
+
+    for task in _workers:
+        task.cancel()
+
+    await asyncio.gather(*_workers, return_exceptions=True)
+    _workers.clear()
+
+
+router = APIRouter(prefix="/api/review/jobs", tags=["review"], on_startup=[start_workers], on_shutdown=[stop_workers])
+
+
+@router.post("/")
+async def submit_review_job(code: Optional[str] = Form(None), github_url: Optional[str] = Form(None), branch: str = Form("main"),
+                            path: str = Form(""), bypass_cache: bool = Form(False)):
+    """
+    提交后台审查任务，参数与 /api/review 相同，立即返回任务id。
+    同一仓库、分支和路径已有未完成的任务时返回该任务的id。
+
+    :return: {"id": 任务id, "status": 任务状态}
+    """
+
+    if not code and not github_url:
+        logger.info("没有提供代码或GitHub URL")
+        raise HTTPException(status_code=400, detail="请提供代码或GitHub网址")
+
+    if github_url:
+        job_id = await in_thread(find_active_job, github_url, branch, path)
+        if job_id:
+            logger.info(f"复用未完成的审查任务 {job_id}")
+            return {"id": job_id, "status": (await in_thread(get_job, job_id))["status"]}
+
+    job_id = uuid4().hex
+    await in_thread(create_job, {
+        "id": job_id,
+        "github_url": github_url,
+        "branch": branch,
+        "path": path,
+        "code": None if github_url else code,
+        "bypass_cache": bypass_cache
+    })
+    ensure_workers()
+    get_queue().put_nowait(job_id)
+    logger.info(f"提交审查任务 {job_id}")
+
+    return {"id": job_id, "status": "queued"}
+
+
+@router.get("/{job_id}")
+async def get_review_job(job_id: str, include_results: bool = True):
+    """
+    查询审查任务的进度和已完成文件的结果
+
+    :param job_id: 任务id
+    :param include_results: 是否返回已完成文件的审查结果
+    :return: {"id", "status", "total", "completed", "error", "created", "updated", "results"}
+    """
+
+    job = await in_thread(get_job, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="任务不存在")
+
+    response = {
+        "id": job["id"],
+        "status": job["status"],
+        "github_url": job["github_url"],
+        "branch": job["branch"],
+        "total": job["total"],
+        "completed": job["completed"],
+        "error": job["error"],
+        "created": job["created"],
+        "updated": job["updated"]
+    }
+
+    if include_results:
+        files = await in_thread(get_job_files, job_id, with_code=False)
+        response["results"] = [item["result"] for item in files if item["result"]]
+
+    return response
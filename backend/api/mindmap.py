@@ -5,18 +5,18 @@
 # @Version：V 1.0
 # @File : mindmap.py
 # @desc : README.md
-import os.path
-from os import listdir
-from json import dumps, loads
-
+import asyncio
+import threading
+from collections import OrderedDict
+from hashlib import sha256
 from fastapi import APIRouter, Form, HTTPException
 from pydantic import BaseModel
-from typing import List, Dict, Optional, Tuple
-from tree_sitter import Language, Parser
-from backend.core.parser import CodeTree
+from typing import Dict, Iterable, List, Optional, Tuple
+from backend.core.callgraph import SymbolIndex, extract_symbols
 from backend.core.logger import Config, setup_logger
-from backend.core.model import send_message
-from backend.database.sqlite_db import save_review
+from backend.core.summarizer import summarize_functions
+from backend.core.languages import language_for_path
+from backend.database.sqlite_db import get_graph, save_graph, save_map
 
 # 加载配置和安装记录器
 config = Config("./config.yaml")
@@ -24,6 +24,15 @@ logger = setup_logger(config)
 
 router = APIRouter(prefix="/api/mindmap", tags=["mindmap"])
 
+# 默认是否只返回图结构，节点的代码与概括在点击时通过 /api/mindmap/node 获取
+LAZY_DETAILS = str(config.get_nested("mindmap_set", "LAZY_DETAILS", default="False")).lower() == "true"
+# 内存中保留节点代码的图数，其余从历史数据库读取
+GRAPH_MEMORY_ENTRIES = max(1, int(config.get_nested("mindmap_set", "GRAPH_MEMORY_ENTRIES", default=8)))
+
+# 图id -> {节点id: {"label", "kind", "code"}}，按最近使用排序
+_graphs: "OrderedDict[str, Dict[str, dict]]" = OrderedDict()
+_graphs_lock = threading.Lock()
+
 
 class FileInput(BaseModel):
     path: str
@@ -34,6 +43,8 @@ class MindmapRequest(BaseModel):
     files: List[FileInput]
     github_url: Optional[str] = None
     branch: Optional[str] = "main"
+    # 为空时使用 mindmap_set.LAZY_DETAILS
+    lazy: Optional[bool] = None
 
 
 class Node(BaseModel):
@@ -51,215 +62,146 @@ class Edge(BaseModel):
 class MindmapResponse(BaseModel):
     nodes: List[Node]
     edges: List[Edge]
+    # 只返回图结构时，按节点获取详情所需的图id
+    graph_id: Optional[str] = None
 
 
-async def call_llm(content: str) -> str:
-    """
-    简单概括函数作用，返回指定数量的简介
+def graph_key(files: List[Tuple[str, str, str]]) -> str:
+    """按文件路径和内容计算图id，相同的输入得到相同的图"""
 
-    :param content: 函数内容
-    :return: str
-    """
+    digest = sha256()
+    for file_path, file_content, code_type in sorted(files):
+        for part in (file_path, code_type, file_content):
+            digest.update(part.encode("utf-8"))
+            digest.update(b"\0")
 
-    reply = send_message(message=f"请简要描述函数作用，80字以内：{content}", join=False, clean_data=False)
+    return digest.hexdigest()
 
-    return reply['message']
 
+def remember_graph(graph_id: str, nodes: list) -> None:
+    """保存节点代码到内存和历史数据库，响应与 reviews 记录中只保留图结构"""
 
-def ask_suffix(language: str, prompt: str = False) -> str:
-    """
-    询问指定语言的文件后缀
+    graph = {node["id"]: {"label": node["label"], "kind": node["kind"], "code": node["code"]} for node in nodes}
+    with _graphs_lock:
+        _graphs[graph_id] = graph
+        _graphs.move_to_end(graph_id)
+        while len(_graphs) > GRAPH_MEMORY_ENTRIES:
+            _graphs.popitem(last=False)
 
-    :param prompt: 额外的提示词
-    :param language: 语言名称
-    :return: str
-    """
+    save_graph(graph_id, graph)
 
-    # 这里感觉怪怪的，下次优化把这里改一下，Ciallo~
-    if prompt:
-        reply = send_message(message=f"{prompt}", join=False, clean_data=False)
 
-    else:
-        reply = send_message(message=f"请直接返回{language}语言的文件后缀名，不带点号", join=False, clean_data=False)
+def lookup_graph(graph_id: str) -> Optional[Dict[str, dict]]:
+    """获取图的节点代码，内存中没有时从历史数据库加载"""
+
+    with _graphs_lock:
+        graph = _graphs.get(graph_id)
+        if graph is not None:
+            _graphs.move_to_end(graph_id)
+            return graph
+
+    graph = get_graph(graph_id)
+    if graph is not None:
+        with _graphs_lock:
+            _graphs[graph_id] = graph
+            while len(_graphs) > GRAPH_MEMORY_ENTRIES:
+                _graphs.popitem(last=False)
 
-    return str(reply['message'])
+    return graph
 
 
-def create_language_dict(file_path: str = "./language.json") -> Dict:
+def build_graph(files: List[Tuple[str, str, str]]) -> Tuple[list, list]:
     """
-    初始化语言后缀映射表，判断当前存在的是否与语言库一一对应，有缺漏或者文件不存在则尝试修复
+    提取多个文件的类、函数（带限定名，如 Class.method）及其调用关系。
+    先为全部文件建立符号表，再逐个调用点查表解析目标，调用可以跨文件连接
 
-    :param file_path: 数据文件保存位置
-    :return: Dict
+    :param files: [(文件路径, 源代码, 语言名称)]
+    :return: (nodes, edges)，edges 包含类到成员的归属边和调用边
     """
 
-    language_dict = {}
-    language_dict_ = {}
-    try:
-        logger.info(f"初始化语言后缀表")
+    index = SymbolIndex()
+    nodes = []
+    edges = []
+    file_calls = []
 
-        if os.path.isfile(file_path):
-            with open(file_path, "r", encoding='utf-8') as file:
-                language_dict_ = loads(file.read())
+    for file_path, file_content, code_type in files:
+        logger.info(f"提取函数特征并分析调用关系: {file_path}, {code_type}")
 
-        # 剔除项目前缀 tree-sitter-
-        language_list = [item[12:] for item in listdir("./backend/core/vendor")]
+        try:
+            definitions, calls, imports = extract_symbols(file_content, file_path, code_type)
 
-        for language_project in language_list:
-                language = language_project
-                if language_dict.get(language, False):
-                    continue
+        except Exception as e:
+            logger.error(f"解析 {file_path} 失败: {str(e)}")
+            continue
 
-                pattern = config.get_nested("model_set", "PATTERN", default=False)
-                if pattern == "local":
-                    # 这里留一个中间变量为以后的返回内容验证做准备
-                    language_suffix = ask_suffix(language)
-                    language_dict[language] = language_suffix
-                    logger.info(f"询问本地模型后缀回复 {language}: {language_suffix}")
+        index.add_file(file_path, definitions, imports)
+        file_calls.append((file_path, calls))
 
-                elif pattern == "cloud":
-                    language_suffix = ask_suffix(prompt = f"请按顺序返回{'、'.join(language_list)}语言的文件后缀名，不带点号且以空格分割，例如cpp py java")
-                    for i in range(len(language_list)):
-                        language_dict[language_list[i]] = language_suffix.split()[i]
+        nodes.extend({
+            "id": definition["id"],
+            "label": definition["qualified"],
+            "kind": definition["kind"],
+            "details": "",
+            "code": definition["code"]
+        } for definition in definitions)
 
-                    break
+        # 类到其成员的归属边
+        edges.extend({"from_": definition["parent"], "to": definition["id"]}
+                     for definition in definitions if definition["parent"])
 
-    except Exception as err:
-        logger.info(f"initial language dict error: {err}")
+    # 调用边
+    seen = set()
+    for file_path, calls in file_calls:
+        for call in calls:
+            target = index.resolve(call, file_path)
+            if target is None:
+                continue
 
-    # 反转，使用后缀作为key， 语言名称作为value
-    if not language_dict_:
-        for key in language_dict:
-            language_dict_[language_dict[key]] = key.replace('-', "_")
+            edge = (call["caller"], target["id"])
+            if edge not in seen:
+                seen.add(edge)
+                edges.append({"from_": edge[0], "to": edge[1]})
 
-        # 保存
-        with open(file_path, "w", encoding='utf-8') as file:
-            file.write(dumps(language_dict_, ensure_ascii=False))
+    logger.info(f"处理完成，nodes: {len(nodes)} 个, edges: {len(edges)} 条")
+    return nodes, edges
 
-    return language_dict_
 
+def summary_source(node_id: str, kind: Optional[str], code: str, node_ids: Iterable[str]) -> str:
+    """
+    生成发送给模型概括的代码：函数使用完整代码；类只使用声明行和直接成员名称，
+    成员方法各自单独概括，避免同一段代码发送两次
+
+    :param node_id: 节点id
+    :param kind: 节点类型（class、function）
+    :param code: 节点代码
+    :param node_ids: 同一张图中全部节点id
+    :return: 概括使用的代码
+    """
 
-def extract_functions(file_content: str, file_path: str, code_type: str) -> Tuple[list, list]:
-    """使用 CodeTree 提取函数及其调用关系"""
+    if kind != "class":
+        return code
 
-    logger.info(f"提取函数特征并分析调用关系: {file_content[:10]}, {file_path}, {code_type}")
-    nodes = []
-    edges = []
+    prefix = f"{node_id}."
+    members = [item[len(prefix):] for item in node_ids
+               if item.startswith(prefix) and "." not in item[len(prefix):]]
 
-    try:
-        # 初始化 CodeTree
-        code_tree = CodeTree()
-
-        # 验证代码类型
-        if code_type not in code_tree.name_mapping_table:
-            logger.warning(f"不支持的语言: {code_type} ({file_path})")
-            return [], []
-
-        # 解析语法树
-        parser = Parser()
-        parser.set_language(code_tree.name_mapping_table[code_type])
-        tree = parser.parse(bytes(file_content, "utf-8"))
-        root_node = tree.root_node
-
-        # 存储函数和调用关系
-        function_nodes = []
-        function_calls = {}
-
-        def get_identifier(node: Node) -> str:
-            """从节点提取标识符（如函数名）"""
-            if node.type == 'identifier':
-                identifier = code_tree.index_to_code_token(
-                    (node.start_point, node.end_point), file_content.split("\n")
-                )
-                logger.debug(f"提取 identifier: {identifier}")
-                return identifier
-            elif node.type == 'attribute':
-                # 处理 self.method 的情况
-                identifiers = []
-                for child in node.children:
-                    if child.type == 'identifier':
-                        identifiers.append(code_tree.index_to_code_token(
-                            (child.start_point, child.end_point), file_content.split("\n")
-                        ))
-                # 返回最后一个 identifier（如 _live2d_）
-                if identifiers:
-                    identifier = identifiers[-1]
-                    logger.debug(f"提取 attribute identifier: {identifier}")
-                    return identifier
-            for child in node.children:
-                result = get_identifier(child)
-                if result:
-                    logger.debug(f"递归提取 identifier: {result}")
-                    return result
-            return ""
-
-        def traverse_node(node: Node, current_function: str = None):
-            """递归遍历语法树，提取函数定义和调用"""
-            nonlocal function_nodes, function_calls
-
-            if node.type == 'function_definition':
-                func_name = get_identifier(node)
-                if func_name:
-                    func_id = f"{file_path}:{func_name}"
-                    func_code = code_tree.index_to_code_token(
-                        (node.start_point, node.end_point), file_content.split("\n")
-                    )
-                    function_nodes.append({
-                        "id": func_id,
-                        "label": func_name,
-                        "details": "",
-                        "code": func_code
-                    })
-                    function_calls[func_id] = set()
-                    current_function = func_id
-                    logger.debug(f"定义函数: {func_id}")
-
-            elif node.type == 'call':
-                # 提取被调用函数名
-                func_name = None
-                for child in node.children:
-                    if child.type in ('identifier', 'attribute'):
-                        func_name = get_identifier(child)
-                        break
-
-                if func_name and current_function:
-                    called_func_id = f"{file_path}:{func_name}"
-                    function_calls[current_function].add(called_func_id)
-                    logger.debug(f"检测到调用: {current_function} -> {called_func_id}")
-
-            # 递归遍历子节点
-            for child in node.children:
-                traverse_node(child, current_function)
-
-        # 遍历语法树
-        traverse_node(root_node)
-
-        # 生成节点和边
-        nodes.extend(function_nodes)
-        for caller, callees in function_calls.items():
-            logger.info(f"caller: {caller}, callees: {callees}")
-            for callee in callees:
-                if any(node["id"] == callee for node in nodes):
-                    edges.append({"from_": caller, "to": callee})
-                    logger.info(f"添加边: {caller} -> {callee}")
-
-        logger.info(f"处理完成，nodes: {len(nodes)} 个, edges: {len(edges)} 条")
-        return nodes, edges
-
-    except Exception as e:
-        logger.error(f"解析 {file_path} 失败: {str(e)}")
-        return [], []
+    header = code.split("\n", 1)[0]
+    return f"{header}\n    # 成员: {', '.join(members) or '无'}"
+
+
+def extract_functions(file_content: str, file_path: str, code_type: str) -> Tuple[list, list]:
+    """提取单个文件的函数及其调用关系，见 build_graph"""
+
+    return build_graph([(file_path, file_content, code_type)])
 
 
 @router.post("/")
 async def generate_mindmap(request: MindmapRequest):
-    nodes = []
-    edges = []
+    files = []
+    code_type = ""
 
     for file in request.files:
         # 推断代码类型
-        extension = file.path.split('.')[-1]
-
         # code_type = {
         #     'py': 'python',
         #     'js': 'javascript',
@@ -268,26 +210,41 @@ async def generate_mindmap(request: MindmapRequest):
         #     'cs': 'c_sharp'
         # }.get(extension, '')
 
-        code_type = create_language_dict().get(extension, '')
+        # 启动时加载的后缀表，不再逐个文件读取 language.json 或询问模型
+        code_type = language_for_path(file.path) or ''
 
         if code_type:
-            file_nodes, file_edges = extract_functions(file.content, file.path, code_type)
+            files.append((file.path, file.content, code_type))
 
-            # 为节点添加大模型生成的描述
-            for node in file_nodes:
-                llm_description = await call_llm(node["code"])
-                node["details"] = llm_description
-
-            nodes.extend(file_nodes)
-            edges.extend(file_edges)
+    # 整个请求共用一个符号表，调用可以跨文件解析；解析整个项目耗时较长，放到线程中执行，不阻塞事件循环
+    nodes, edges = await asyncio.get_running_loop().run_in_executor(None, build_graph, files)
 
     if not nodes:
         raise HTTPException(status_code=400, detail="未找到可解析的函数")
 
+    lazy = LAZY_DETAILS if request.lazy is None else request.lazy
+    graph_id = None
+
+    if lazy:
+        # 只返回图结构，节点代码保存在服务端，点击节点时再获取代码和概括
+        graph_id = graph_key(files)
+        await asyncio.get_running_loop().run_in_executor(None, remember_graph, graph_id, nodes)
+        nodes = [{"id": node["id"], "label": node["label"], "details": "", "code": ""} for node in nodes]
+
+    else:
+        # 为节点添加大模型生成的描述，多个函数合并为一次调用，未变化的函数直接使用缓存
+        node_ids = [node["id"] for node in nodes]
+        summaries = await summarize_functions([(node["id"], summary_source(node["id"], node["kind"], node["code"], node_ids))
+                                               for node in nodes])
+        for node in nodes:
+            node["details"] = summaries.get(node["id"], "")
+
     _map = {
         'nodes': nodes,
         'edges': edges
     }
+    if graph_id:
+        _map['graph_id'] = graph_id
 
     results = {
         "file": "project",
@@ -303,9 +260,33 @@ async def generate_mindmap(request: MindmapRequest):
         "map": _map
     }
 
-    save_review(results)
+    save_map(results)
+
+    return MindmapResponse(nodes=nodes, edges=edges, graph_id=graph_id)
+
+
+@router.get("/node")
+async def get_node_details(graph_id: str, node_id: str):
+    """
+    获取单个节点的代码和概括，概括按函数体缓存，同一函数只调用一次模型
+
+    :param graph_id: 生成思维导图时返回的图id
+    :param node_id: 节点id
+    :return: Node
+    """
+
+    # 内存中没有时需要读取历史数据库，放到线程中执行
+    graph = await asyncio.get_running_loop().run_in_executor(None, lookup_graph, graph_id)
+    if graph is None:
+        raise HTTPException(status_code=404, detail="思维导图已过期，请重新生成")
+
+    node = graph.get(node_id)
+    if node is None:
+        raise HTTPException(status_code=404, detail="节点不存在")
+
+    summaries = await summarize_functions([(node_id, summary_source(node_id, node.get("kind"), node["code"], graph))])
 
-    return MindmapResponse(nodes=nodes, edges=edges)
+    return Node(id=node_id, label=node["label"], details=summaries.get(node_id, ""), code=node["code"])
 
 
 if __name__ == '__main__':
@@ -316,4 +297,4 @@ if __name__ == '__main__':
     edges = []
     """
 
-    print(ask_suffix(language="python"))
+    print(extract_functions(code, "demo.py", language_for_path("demo.py")))
@@ -7,12 +7,18 @@
 # @desc    : 使用大型语言模型的代码审查和API重构
 
 from fastapi import APIRouter, Form, HTTPException
-from typing import Optional
-from backend.core.parser import CodeTree
-from backend.core.analyzer import Analyzer
-from backend.core.model import send_message
+from fastapi.responses import StreamingResponse
+from typing import Optional, Dict, Any, Callable, Awaitable, Tuple
+from json import dumps
+import asyncio
+from backend.core.analysis import analyze_file, create_batch_analyzer
+from backend.core.languages import resolve_language
+from backend.core.mirror import is_valid_ref
+from backend.core.model import async_send_message, async_stream_message, return_template, model_identity, PROMPT_VERSION
 from backend.core.logger import Config, setup_logger
-from backend.database.sqlite_db import save_review
+from backend.database.sqlite_db import create_run, get_last_reviewed_commit, get_latest_file_reviews
+from backend.database.writer import submit_review
+from backend.database.review_cache import cache_key, get_cached_review, save_cached_review
 
 # 加载配置和安装记录器
 config = Config("./config.yaml")
@@ -20,12 +26,278 @@ logger = setup_logger(config)
 
 router = APIRouter(prefix="/api/review", tags=["review"])
 
+# 单次请求与全局的模型调用并发上限
+MAX_CONCURRENCY = max(1, int(config.get_nested("review_set", "MAX_CONCURRENCY", default=4)))
+GLOBAL_MAX_CONCURRENCY = max(1, int(config.get_nested("review_set", "GLOBAL_MAX_CONCURRENCY", default=8)))
+
+# 全局信号量，延迟到事件循环中创建，避免绑定到错误的循环
+_global_semaphore: Optional[asyncio.Semaphore] = None
+
+
+def get_global_semaphore() -> asyncio.Semaphore:
+    """获取所有审查请求共享的模型调用信号量"""
+
+    global _global_semaphore
+    if _global_semaphore is None:
+        _global_semaphore = asyncio.Semaphore(GLOBAL_MAX_CONCURRENCY)
+
+    return _global_semaphore
+
+
+def refine_language(file_path: str, code: str, language: str) -> str:
+    """
+    直接输入的代码默认按Python处理，这里根据内容做一次简单的语言推断
+
+    :param file_path: 文件路径，仅用于日志
+    :param code: 源代码
+    :param language: 初始语言
+    :return: 推断后的语言
+    """
+
+    if language == "python" and not code.strip().endswith(".py") and "def " not in code:
+        # Simple heuristic for other languages
+        if "class " in code and "{" in code:
+            language = "java" if "public" in code else "cs"
+        elif "function " in code or "=>" in code:
+            language = "js"
+        elif "#include" in code or "int main" in code:
+            language = "cpp"
+        logger.info(f"Refined language for {file_path}: {language}")
+
+    return language
+
+
+async def prepare_file(file_path: str, file_data: dict,
+                       analyze: Callable[[str, str, str], Awaitable[Dict[str, Any]]] = analyze_file) -> Dict[str, Any]:
+    """
+    单个文件的本地处理阶段：语言推断，然后在分析进程池中完成Tree-sitter解析和Lizard复杂度分析
+
+    :param file_path: 文件路径
+    :param file_data: {"language": str, "code": str}
+    :param analyze: 分析函数，流水线中使用 create_batch_analyzer 合并提交
+    :return: 处理结果，失败时包含error字段
+    """
+
+    code = file_data["code"]
+    # 统一为语法名称（py -> python），与思维导图使用同一张后缀表
+    language = resolve_language(refine_language(file_path, code, file_data["language"]))
+
+    analyzed = await analyze(file_path, language, code)
+    if "error" in analyzed:
+        return analyzed
+
+    return {
+        "file": file_path,
+        "language": language,
+        "code": code,
+        "tokens": analyzed["tokens"],
+        "complexity": analyzed["complexity"]
+    }
+
+
+async def review_file(prepared: Dict[str, Any], github_url: Optional[str], branch: str,
+                      semaphore: asyncio.Semaphore, bypass_cache: bool = False,
+                      on_delta: Optional[Callable[[str], Awaitable[None]]] = None,
+                      commit_sha: Optional[str] = None, run_id: Optional[int] = None) -> Optional[Dict[str, Any]]:
+    """
+    单个文件的模型审查阶段，受单次请求与全局两级信号量限制，优先使用审查缓存
+
+    :param prepared: prepare_file 的返回结果
+    :param github_url: 仓库地址
+    :param branch: 分支
+    :param semaphore: 单次请求的模型调用信号量
+    :param bypass_cache: 跳过缓存读取，强制调用模型（结果仍会写入缓存）
+    :param on_delta: 提供时以流式方式调用模型，并将增量文本传给该回调
+    :param commit_sha: 审查时分支指向的提交，随结果保存，作为下次增量审查的基准
+    :param run_id: 历史记录中所属的运行
+    :return: 审查结果；模型回复格式异常时返回None
+    """
+
+    if "error" in prepared:
+        return prepared
+
+    file_path = prepared["file"]
+    code = prepared["code"]
+    model = model_identity()
+    key = cache_key(code, prepared["language"], PROMPT_VERSION, model)
+    loop = asyncio.get_running_loop()
+
+    # 缓存读写与淘汰均为阻塞的SQLite操作，放到线程中执行
+    cached = None if bypass_cache else await loop.run_in_executor(None, get_cached_review, key)
+    if cached is not None:
+        logger.info(f"命中审查缓存 {file_path}")
+        grok_response = return_template(state=200, message=cached)
+
+    else:
+        async with semaphore, get_global_semaphore():
+            logger.info(f"向API发送提示 {file_path}")
+            if on_delta is None:
+                grok_response = await async_send_message(code)
+
+            else:
+                grok_response = await async_stream_message(code, on_delta)
+
+    # 检查API响应
+    logger.info(f"API 回复: {grok_response}")
+    try:
+        if grok_response["state"] == 500:
+            logger.error(f"API 失败 {file_path}: {grok_response['message']}")
+            return {
+                "file": file_path,
+                "language": prepared["language"],
+                "error": grok_response["message"],
+                "tokens": prepared["tokens"],
+                "complexity": prepared["complexity"]
+            }
+
+    except TypeError as e:
+        logger.info(f"API 回复参数state参数异常 {e}")
+        return None
+
+    # 只缓存成功解析的回复
+    if cached is None and grok_response["state"] == 200 and isinstance(grok_response["message"], dict):
+        await loop.run_in_executor(None, save_cached_review, key, model, prepared["language"], grok_response["message"])
+
+    # 解析响应（假设API返回带有问题、optimized_code、文档的JSON）
+    result = {
+        "file": file_path,
+        "language": prepared["language"],
+        "code": code,
+        "issues": grok_response["message"].get("issues", "No issues detected"),
+        "optimized_code": grok_response["message"].get("optimized_code", code),
+        "documentation": grok_response["message"].get("documentation", "# No documentation"),
+        "complexity": prepared["complexity"],
+        "github_url": github_url,
+        "branch": branch,
+        "tokens": prepared["tokens"],
+        "cached": cached is not None,
+        "commit_sha": commit_sha
+    }
+
+    # 将评论保存到数据库，由写入线程批量提交
+    submit_review(result, run_id)
+    # logger.info(f"评审结果保存于 {file_path}")
+
+    return result
+
+
+async def load_code_files(code: Optional[str], github_url: Optional[str], branch: str, path: str) -> Dict[str, dict]:
+    """
+    获取需要审查的文件
+
+    :return: {文件路径: {"language": str, "code": str}}
+    """
+
+    # 处理GitHub输入
+    if github_url:
+        from backend.api.github import fetch_github_code
+        code_files = await fetch_github_code(github_url, branch, path)
+        logger.info(f"Fetched {len(code_files)} files from GitHub")
+
+    else:
+        # 单一代码输入，假设基于内容的语言，或者默认为Python
+        language = "python"  # 默认值，将在prepare_file中进行细化
+        code_files = {"input": {"language": language, "code": code}}
+
+    return code_files
+
+
+async def create_pipeline(github_url: Optional[str], branch: str, bypass_cache: bool,
+                          commit_sha: Optional[str] = None) -> Callable[..., Awaitable[Optional[Dict[str, Any]]]]:
+    """
+    创建单次请求的审查流水线
+
+    :return: process(file_path, file_data, on_delta=None) 协程函数
+    """
+
+    # 同一次审查的结果保存在同一个运行下，创建运行需要写入数据库，放到线程中执行
+    run_id = await asyncio.get_running_loop().run_in_executor(None, create_run, "review", github_url, branch, commit_sha)
+
+    # 模型调用并发上限
+    llm_semaphore = asyncio.Semaphore(MAX_CONCURRENCY)
+    # 流水线窗口：允许在模型调用进行时提前解析后续文件，同时限制驻留内存的文件数量
+    window = asyncio.Semaphore(MAX_CONCURRENCY * 2)
+    # 窗口内同时到达的文件合并后分组提交到分析进程池
+    analyze = create_batch_analyzer()
+
+    async def process(file_path: str, file_data: dict,
+                      on_delta: Optional[Callable[[str], Awaitable[None]]] = None) -> Optional[Dict[str, Any]]:
+        async with window:
+            prepared = await prepare_file(file_path, file_data, analyze)
+            return await review_file(prepared, github_url, branch, llm_semaphore, bypass_cache, on_delta, commit_sha, run_id)
+
+    return process
+
+
+async def plan_incremental(code_files: Dict[str, dict], github_url: Optional[str], branch: str,
+                           incremental: bool, base_ref: Optional[str]) -> Tuple[Optional[str], Dict[str, Dict[str, Any]]]:
+    """
+    增量审查：比较基准提交与当前提交，未变化且已有对应审查记录的文件直接沿用历史结果。
+    未指定 base_ref 时以该分支最近一次审查记录的提交作为基准；无法比较时退回全量审查。
+
+    :param code_files: load_code_files 的返回结果
+    :param github_url: 仓库地址
+    :param branch: 分支
+    :param incremental: 是否启用增量审查
+    :param base_ref: 基准提交或引用
+    :return: (当前提交, {文件路径: 沿用的审查结果})
+    """
+
+    if not github_url:
+        return None, {}
+
+    # base_ref 会作为git参数使用，拒绝以 - 开头等不合法的引用
+    if base_ref and not is_valid_ref(base_ref):
+        raise HTTPException(status_code=400, detail="无效的基准提交或引用")
+
+    from backend.api.github import resolve_commit, get_changed_paths
+    head = await resolve_commit(github_url, branch)
+
+    if not head or not (incremental or base_ref):
+        return head, {}
+
+    # 历史记录查询为阻塞的SQLite操作，放到线程中执行
+    loop = asyncio.get_running_loop()
+    base = base_ref or await loop.run_in_executor(None, get_last_reviewed_commit, github_url, branch)
+    if not base:
+        logger.info(f"没有历史审查提交，执行全量审查: {github_url} ({branch})")
+        return head, {}
+
+    changed = await get_changed_paths(github_url, branch, base, head)
+    if changed is None:
+        return head, {}
+
+    # 历史结果不一定是在基准提交时审查的（按 path 审查的运行、模型调用失败未保存的文件），
+    # 只有内容与当前文件相同，或确实在基准提交时审查且之后未变化的结果才能沿用
+    previous = await loop.run_in_executor(None, get_latest_file_reviews, github_url, branch)
+    carried = {
+        file_path: {**previous[file_path], "tokens": [], "cached": True, "carried_forward": True}
+        for file_path, file_data in code_files.items()
+        if file_path in previous and (
+            previous[file_path]["code"] == file_data["code"]
+            or (file_path not in changed and previous[file_path]["commit_sha"] == base)
+        )
+    }
+    logger.info(f"增量审查 {base[:12]}..{head[:12]}: 变化 {len(changed)} 个文件，沿用 {len(carried)} 个文件的历史结果")
+
+    return head, carried
+
+
+def sse_event(event: str, data: Any) -> str:
+    """按 Server-Sent Events 格式编码一条事件"""
+
+    return f"event: {event}\ndata: {dumps(data, ensure_ascii=False)}\n\n"
+
 
 @router.post("/")
-async def review_code(code: Optional[str] = Form(None), github_url: Optional[str] = Form(None), branch: str = Form("main"), path: str = Form("")):
+async def review_code(code: Optional[str] = Form(None), github_url: Optional[str] = Form(None), branch: str = Form("main"), path: str = Form(""),
+                      bypass_cache: bool = Form(False), incremental: bool = Form(False), base_ref: Optional[str] = Form(None)):
     """
     审查和重构代码，支持直接代码输入或GitHub URL。
     支持多种语言（Python, c++, Java, JavaScript, c#）。
+    各文件的解析、复杂度分析与模型调用以有界并发的流水线方式执行，结果顺序与文件顺序一致。
+    未变化的文件直接使用审查缓存，bypass_cache 为 True 时强制重新调用模型。
+    incremental 为 True 或提供 base_ref 时只审查两次提交之间变化的文件，其余文件沿用历史结果（carried_forward 为 True）。
     返回：每个文件的问题、优化代码、文档和复杂性指标。
     """
 
@@ -34,113 +306,101 @@ async def review_code(code: Optional[str] = Form(None), github_url: Optional[str
         raise HTTPException(status_code=400, detail="请提供代码或GitHub网址")
 
     try:
-        # 初始化解析器和分析器
-        code_tree = CodeTree()
-        analyzer = Analyzer()
-
-        # 存储多个文件的结果
-        results = []
-
-        # 处理GitHub输入
-        if github_url:
-            from backend.api.github import fetch_github_code
-            code_files = await fetch_github_code(github_url, branch, path)
-            logger.info(f"Fetched {len(code_files)} files from GitHub")
-
-        else:
-            # 单一代码输入，假设基于内容的语言，或者默认为Python
-            language = "python"  # 默认值，将在下面进行细化
-            code_files = {"input": {"language": language, "code": code}}
-
-        for file_path, file_data in code_files.items():
-            code = file_data["code"]
-            language = file_data["language"]
-
-            # 如果需要，优化语言检测（例如，直接输入）
-            if language == "python" and not code.strip().endswith(".py") and "def " not in code:
-                # Simple heuristic for other languages
-                if "class " in code and "{" in code:
-                    language = "java" if "public" in code else "cs"
-                elif "function " in code or "=>" in code:
-                    language = "js"
-                elif "#include" in code or "int main" in code:
-                    language = "cpp"
-                logger.info(f"Refined language for {file_path}: {language}")
-
-            # 使用Tree-sitter解析代码
-            try:
-                tokens = code_tree.processing_coed(language, code)
-                if not tokens:
-                    logger.error(f"Code parsing failed for {file_path}: No tokens generated")
-                    results.append({
-                        "file": file_path,
-                        "language": language,
-                        "error": "Code parsing failed",
-                        "tokens": []
-                    })
-                    continue
-            except Exception as e:
-                logger.error(f"Parsing failed for {file_path}: {str(e)}")
-                results.append({
-                    "file": file_path,
-                    "language": language,
-                    "error": f"Parsing failed: {str(e)}",
-                    "tokens": []
-                })
-                continue
-
-            # 用Lizard分析复杂度
-            try:
-                complexity_data = analyzer.analyze_source_code(f".{language}", code)
-                logger.info(f"Complexity analysis for {file_path}: {complexity_data}")
-            except Exception as e:
-                logger.warning(f"Complexity analysis failed for {file_path}: {str(e)}")
-                complexity_data = {"error": str(e)}
+        code_files = await load_code_files(code, github_url, branch, path)
+        commit_sha, carried = await plan_incremental(code_files, github_url, branch, incremental, base_ref)
+        process = await create_pipeline(github_url, branch, bypass_cache, commit_sha)
 
-            logger.info(f"向API发送提示 {file_path}")
-            grok_response = send_message(code)
+        # gather 按提交顺序返回，保证结果顺序稳定
+        pending = [(file_path, file_data) for file_path, file_data in code_files.items() if file_path not in carried]
+        reviewed = await asyncio.gather(*(process(file_path, file_data) for file_path, file_data in pending))
 
-            # 检查API响应
-            logger.info(f"API 回复: {grok_response}")
-            try:
-                if grok_response["state"] == 500:
-                    logger.error(f"API 失败 {file_path}: {grok_response['message']}")
-                    results.append({
-                        "file": file_path,
-                        "language": language,
-                        "error": grok_response["message"],
-                        "tokens": tokens,
-                        "complexity": complexity_data
-                    })
-                    continue
-            except TypeError as e:
-                logger.info(f"API 回复参数state参数异常 {e}")
-                return {"results": "Error Server reply"}
-
-            # 解析响应（假设API返回带有问题、optimized_code、文档的JSON）
-            result = {
-                "file": file_path,
-                "language": language,
-                "code": code,
-                "issues": grok_response["message"].get("issues", "No issues detected"),
-                "optimized_code": grok_response["message"].get("optimized_code", code),
-                "documentation": grok_response["message"].get("documentation", "# No documentation"),
-                "complexity": complexity_data,
-                "github_url": github_url,
-                "branch": branch,
-                "tokens": tokens
-            }
+        if any(result is None for result in reviewed):
+            return {"results": "Error Server reply"}
 
-            print(result)
+        reviewed = dict(zip((file_path for file_path, _ in pending), reviewed))
+        results = [carried.get(file_path) or reviewed[file_path] for file_path in code_files]
 
-            # 将评论保存到数据库
-            save_review(result)
-            # logger.info(f"评审结果保存于 {file_path}")
+        return {"results": results}
 
-            results.append(result)
+    except HTTPException:
+        raise
 
-        return {"results": results}
+    except Exception as e:
+        logger.error(f"评论失败: {str(e)}", exc_info=True)
+        raise HTTPException(status_code=500, detail=f"评论失败: {str(e)}")
+
+
+@router.post("/stream")
+async def review_code_stream(code: Optional[str] = Form(None), github_url: Optional[str] = Form(None), branch: str = Form("main"),
+                             path: str = Form(""), bypass_cache: bool = Form(False), stream_tokens: bool = Form(False),
+                             incremental: bool = Form(False), base_ref: Optional[str] = Form(None)):
+    """
+    审查接口的流式版本，以 Server-Sent Events 返回，每个文件审查完成后立即推送。
+    事件类型：
+        start:  {"total": 文件数}
+        delta:  {"index": 文件序号, "file": 文件路径, "content": 模型增量文本}，仅 stream_tokens 为 True 时推送
+        result: {"index": 文件序号, ...与 /api/review 中单个文件相同的结果}
+        done:   {"total": 文件数}
+    增量审查时沿用历史结果的文件在开始后立即以 result 事件推送。
+    """
+
+    if not code and not github_url:
+        logger.info("没有提供代码或GitHub URL")
+        raise HTTPException(status_code=400, detail="请提供代码或GitHub网址")
+
+    try:
+        code_files = await load_code_files(code, github_url, branch, path)
+        commit_sha, carried = await plan_incremental(code_files, github_url, branch, incremental, base_ref)
+
+    except HTTPException:
+        raise
 
     except Exception as e:
         logger.error(f"评论失败: {str(e)}", exc_info=True)
-        raise HTTPException(status_code=500, detail=f"评论失败: {str(e)}")
\ No newline at end of file
+        raise HTTPException(status_code=500, detail=f"评论失败: {str(e)}")
+
+    async def event_stream():
+        process = await create_pipeline(github_url, branch, bypass_cache, commit_sha)
+        queue: asyncio.Queue = asyncio.Queue()
+
+        async def run(index: int, file_path: str, file_data: dict) -> None:
+            async def on_delta(delta: str) -> None:
+                await queue.put(("delta", {"index": index, "file": file_path, "content": delta}))
+
+            try:
+                result = await process(file_path, file_data, on_delta if stream_tokens else None)
+                if result is None:
+                    result = {"file": file_path, "error": "Error Server reply"}
+
+            except Exception as e:
+                logger.error(f"评论失败 {file_path}: {str(e)}", exc_info=True)
+                result = {"file": file_path, "error": f"评论失败: {str(e)}"}
+
+            await queue.put(("result", {"index": index, **result}))
+
+        total = len(code_files)
+        yield sse_event("start", {"total": total})
+
+        for index, file_path in enumerate(code_files):
+            if file_path in carried:
+                yield sse_event("result", {"index": index, **carried[file_path]})
+
+        tasks = [asyncio.ensure_future(run(index, file_path, file_data))
+                 for index, (file_path, file_data) in enumerate(code_files.items()) if file_path not in carried]
+        try:
+            finished = len(carried)
+            while finished < total:
+                event, data = await queue.get()
+                if event == "result":
+                    finished += 1
+                yield sse_event(event, data)
+
+            yield sse_event("done", {"total": total})
+
+        finally:
+            # 客户端断开时取消未完成的文件
+            for task in tasks:
+                task.cancel()
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
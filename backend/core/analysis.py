@@ -0,0 +1,259 @@
+#!/usr/bin/env python
+# _*_ coding: utf-8 _*_
+# @Time : 2026/10/18 下午5:10
+# @Author : Huzhaojun
+# @Version：V 1.0
+# @File : analysis.py
+# @desc : 代码解析与复杂度分析的进程池，Tree-sitter 与 Lizard 均为CPU密集型，放到多个进程中并行执行
+
+import asyncio
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+from backend.core.analysis_cache import get_complexity, get_tokens
+from backend.core.logger import Config, setup_logger
+from backend.core.parser import CodeTree
+
+# 加载配置和安装记录器
+config = Config("./config.yaml")
+logger = setup_logger(config)
+
+# 分析进程数，auto 为CPU核数；0 或 1 表示不使用进程池，在线程池中执行
+_workers = str(config.get_nested("review_set", "ANALYZE_WORKERS", default="auto")).lower()
+ANALYZE_WORKERS = (os.cpu_count() or 1) if _workers == "auto" else max(0, int(_workers))
+# 批量分析时每次提交给子进程的文件数
+ANALYZE_CHUNK_SIZE = 8
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+# 进行中的批量提交任务，保持引用避免被垃圾回收
+_batch_tasks: Set[asyncio.Task] = set()
+
+
+def _init_worker() -> None:
+    """子进程启动时加载语言库"""
+
+    CodeTree.load_languages()
+
+
+def analyze_source(file_path: str, language: str, code: str) -> Dict[str, Any]:
+    """
+    解析单个文件并分析复杂度，相同内容的结果取自分析缓存
+
+    :param file_path: 文件路径
+    :param language: 语言名称
+    :param code: 源代码
+    :return: {"file", "language", "tokens", "complexity"}，解析失败时包含error字段
+    """
+
+    # 使用Tree-sitter解析代码
+    try:
+        tokens = get_tokens(language, code)
+        if not tokens:
+            logger.error(f"Code parsing failed for {file_path}: No tokens generated")
+            return {
+                "file": file_path,
+                "language": language,
+                "error": "Code parsing failed",
+                "tokens": []
+            }
+
+    except Exception as e:
+        logger.error(f"Parsing failed for {file_path}: {str(e)}")
+        return {
+            "file": file_path,
+            "language": language,
+            "error": f"Parsing failed: {str(e)}",
+            "tokens": []
+        }
+
+    # 用Lizard分析复杂度
+    try:
+        complexity_data = get_complexity(language, code)
+        logger.info(f"Complexity analysis for {file_path}: {complexity_data}")
+
+    except Exception as e:
+        logger.warning(f"Complexity analysis failed for {file_path}: {str(e)}")
+        complexity_data = {"error": str(e)}
+
+    return {
+        "file": file_path,
+        "language": language,
+        "tokens": tokens,
+        "complexity": complexity_data
+    }
+
+
+def analyze_chunk(items: List[Tuple[str, str, str]]) -> List[Dict[str, Any]]:
+    """在同一进程中依次分析多个 (path, language, code)，减少进程间通信次数"""
+
+    return [analyze_source(*item) for item in items]
+
+
+def get_process_pool() -> Optional[ProcessPoolExecutor]:
+    """
+    获取分析进程池，首次调用时创建；未启用进程池时返回None
+
+    :return: ProcessPoolExecutor 或 None
+    """
+
+    global _pool
+
+    if ANALYZE_WORKERS <= 1:
+        return None
+
+    with _pool_lock:
+        if _pool is None:
+            # 支持 fork 的平台直接复制已加载语言库的进程；spawn 会重新执行启动脚本（main.py）的顶层代码
+            method = "fork" if "fork" in multiprocessing.get_all_start_methods() else "spawn"
+            _pool = ProcessPoolExecutor(max_workers=ANALYZE_WORKERS,
+                                        mp_context=multiprocessing.get_context(method),
+                                        initializer=_init_worker)
+            logger.info(f"分析进程池已启动，进程数: {ANALYZE_WORKERS}")
+
+    return _pool
+
+
+def discard_process_pool(pool: Optional[ProcessPoolExecutor]) -> None:
+    """
+    丢弃已损坏的进程池（子进程异常退出，例如解析异常输入时崩溃），下次调用 get_process_pool 时重新创建
+
+    :param pool: 损坏的进程池
+    :return: None
+    """
+
+    global _pool
+
+    if pool is None:
+        return
+
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+            logger.error("分析进程异常退出，重新创建进程池")
+
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+async def start_process_pool() -> None:
+    """服务启动时创建进程池并启动子进程，在后台线程和连接创建前完成 fork"""
+
+    pool = get_process_pool()
+    if pool is not None:
+        await asyncio.get_running_loop().run_in_executor(pool, _init_worker)
+
+
+async def analyze_file(file_path: str, language: str, code: str) -> Dict[str, Any]:
+    """
+    在进程池中分析单个文件，不阻塞事件循环
+
+    :return: 同 analyze_source
+    """
+
+    loop = asyncio.get_running_loop()
+
+    # 进程池可能因其他文件导致的崩溃而损坏，换新的进程池重试一次；再次崩溃说明是该文件本身的问题
+    for _ in range(2):
+        pool = get_process_pool()
+        try:
+            return await loop.run_in_executor(pool, analyze_source, file_path, language, code)
+
+        except BrokenProcessPool:
+            discard_process_pool(pool)
+
+    logger.error(f"分析进程在处理 {file_path} 时异常退出")
+    return {
+        "file": file_path,
+        "language": language,
+        "error": "Analysis process crashed",
+        "tokens": []
+    }
+
+
+async def analyze_batch(items: List[Tuple[str, str, str]]) -> List[Dict[str, Any]]:
+    """
+    并行分析一批文件，按进程数均分后分组提交到进程池，每组最多 ANALYZE_CHUNK_SIZE 个文件
+
+    :param items: [(path, language, code)]
+    :return: 与 items 顺序一致的分析结果，格式同 analyze_source
+    """
+
+    loop = asyncio.get_running_loop()
+    pool = get_process_pool()
+    # 文件较少时按进程数均分，保证每个进程都有任务
+    size = max(1, min(ANALYZE_CHUNK_SIZE, -(-len(items) // max(1, ANALYZE_WORKERS))))
+    chunks = [items[start:start + size] for start in range(0, len(items), size)]
+    try:
+        results = await asyncio.gather(*(loop.run_in_executor(pool, analyze_chunk, chunk) for chunk in chunks))
+
+    except BrokenProcessPool:
+        # 无法确定是哪个文件导致崩溃，重建进程池后依次逐个文件重新分析，崩溃只影响出问题的文件
+        discard_process_pool(pool)
+        return [await analyze_file(*item) for item in items]
+
+    return [result for chunk in results for result in chunk]
+
+
+def create_batch_analyzer() -> Callable[[str, str, str], Awaitable[Dict[str, Any]]]:
+    """
+    创建合并提交的分析函数，必须在事件循环中调用。
+    同一轮事件循环中到达的文件合并为一批，通过 analyze_batch 按 ANALYZE_CHUNK_SIZE 分组提交到进程池
+
+    :return: analyze(file_path, language, code) 协程函数，返回值同 analyze_source
+    """
+
+    loop = asyncio.get_running_loop()
+    pending: List[Tuple[Tuple[str, str, str], asyncio.Future]] = []
+
+    async def run(batch: List[Tuple[Tuple[str, str, str], asyncio.Future]]) -> None:
+        try:
+            results = await analyze_batch([item for item, _ in batch])
+            for (_, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+
+        except asyncio.CancelledError:
+            for _, future in batch:
+                future.cancel()
+            raise
+
+        except Exception as err:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(err)
+
+    def flush() -> None:
+        if pending:
+            batch = pending[:]
+            pending.clear()
+            task = asyncio.ensure_future(run(batch))
+            _batch_tasks.add(task)
+            task.add_done_callback(_batch_tasks.discard)
+
+    async def analyze(file_path: str, language: str, code: str) -> Dict[str, Any]:
+        future = loop.create_future()
+        pending.append(((file_path, language, code), future))
+
+        # 第一个文件到达时安排提交，同一轮中到达的其他文件会一起提交
+        if len(pending) == 1:
+            loop.call_soon(flush)
+
+        return await future
+
+    return analyze
+
+
+def close_process_pool() -> None:
+    """关闭分析进程池，在服务退出时调用"""
+
+    global _pool
+
+    with _pool_lock:
+        pool, _pool = _pool, None
+
+    if pool is not None:
+        pool.shutdown(wait=True)
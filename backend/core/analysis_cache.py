@@ -0,0 +1,154 @@
+#!/usr/bin/env python
+# _*_ coding: utf-8 _*_
+# @Time : 2026/10/18 下午5:40
+# @Author : Huzhaojun
+# @Version：V 1.0
+# @File : analysis_cache.py
+# @desc : 解析与分析结果缓存，按内容哈希和语言保存语法树、token偏移和复杂度数据，同一进程内相同代码只计算一次
+
+import threading
+from collections import OrderedDict
+from hashlib import sha256
+from typing import Any, Dict, List, Tuple
+
+from tree_sitter import Tree
+
+from backend.core.analyzer import Analyzer
+from backend.core.languages import extension_for
+from backend.core.logger import Config, setup_logger
+from backend.core.parser import CodeTree, get_code_tree
+from backend.database.review_cache import get_cached_analysis, save_cached_analysis
+
+# 加载配置和安装记录器
+config = Config("./config.yaml")
+logger = setup_logger(config)
+
+# 内存中保留的文件数，0 表示不缓存
+MEMORY_ENTRIES = max(0, int(config.get_nested("cache_set", "ANALYSIS_MEMORY_ENTRIES", default=256)))
+# 是否将token偏移和复杂度数据保存到磁盘（语法树只保存在内存中）
+DISK_ENABLED = str(config.get_nested("cache_set", "ANALYSIS_DISK", default="True")).lower() == "true"
+
+# 缓存键 -> {"tree": Tree, "offsets": [(start, end)], "complexity": dict}，按最近使用排序。
+# 缓存属于各个进程：审查在分析进程池的子进程中解析，思维导图在主进程中解析，语法树不会在进程之间共享，
+# 同一文件在每个处理过它的进程中各解析一次；token偏移和复杂度数据可通过磁盘缓存在进程之间复用
+_entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+_lock = threading.Lock()
+_analyzer = Analyzer()
+
+
+def analysis_key(language: str, source: bytes) -> str:
+    """
+    计算缓存键
+
+    :param language: 语言名称
+    :param source: utf-8 编码的源代码
+    :return: sha256 十六进制字符串
+    """
+
+    digest = sha256(language.encode("utf-8"))
+    digest.update(b"\0")
+    digest.update(source)
+    return digest.hexdigest()
+
+
+def _entry(language: str, code: str) -> Tuple[str, Dict[str, Any], bytes]:
+    """取得缓存条目，不存在时创建并尝试从磁盘加载"""
+
+    source = code.encode("utf-8")
+    key = analysis_key(language, source)
+
+    with _lock:
+        entry = _entries.get(key)
+        if entry is not None:
+            _entries.move_to_end(key)
+            return key, entry, source
+
+        entry = {}
+        if MEMORY_ENTRIES:
+            _entries[key] = entry
+            while len(_entries) > MEMORY_ENTRIES:
+                _entries.popitem(last=False)
+
+    if DISK_ENABLED:
+        entry.update(get_cached_analysis(key))
+
+    return key, entry, source
+
+
+def get_tree(language: str, code: str) -> Tree:
+    """
+    获取语法树，同一进程内相同内容只解析一次
+
+    :param language: 语言名称
+    :param code: 源代码
+    :return: 语法树
+    """
+
+    _, entry, source = _entry(language, code)
+    tree = entry.get("tree")
+    if tree is None:
+        tree = entry["tree"] = CodeTree.parse(language, source)
+
+    return tree
+
+
+def get_token_offsets(language: str, code: str) -> List[Tuple[int, int]]:
+    """
+    获取非注释token的字节偏移
+
+    :param language: 语言名称
+    :param code: 源代码
+    :return: [(起始字节, 结束字节)]
+    """
+
+    key, entry, source = _entry(language, code)
+    offsets = entry.get("offsets")
+    if offsets is None:
+        tree = entry.get("tree")
+        if tree is None:
+            tree = entry["tree"] = CodeTree.parse(language, source)
+
+        offsets = entry["offsets"] = list(get_code_tree().iter_tokens(tree.root_node, source, offsets_only=True))
+        if DISK_ENABLED:
+            save_cached_analysis(key, language, offsets=offsets)
+
+    return offsets
+
+
+def get_tokens(language: str, code: str) -> List[str]:
+    """
+    获取非注释token文本
+
+    :param language: 语言名称
+    :param code: 源代码
+    :return: token文本列表
+    """
+
+    view = memoryview(code.encode("utf-8"))
+    return [str(view[start:end], "utf-8", "replace") for start, end in get_token_offsets(language, code)]
+
+
+def get_complexity(language: str, code: str) -> dict:
+    """
+    获取 Lizard 复杂度数据，分析失败时抛出异常且不缓存
+
+    :param language: 语言名称
+    :param code: 源代码
+    :return: Analyzer.data_clean 格式的复杂度数据
+    """
+
+    key, entry, _ = _entry(language, code)
+    complexity = entry.get("complexity")
+    if complexity is None:
+        complexity = entry["complexity"] = _analyzer.analyze_source_code(f".{extension_for(language)}", code)
+        if DISK_ENABLED:
+            save_cached_analysis(key, language, complexity=complexity)
+
+    return complexity
+
+
+def clear_analysis_cache() -> None:
+    """清空内存中的缓存"""
+
+    with _lock:
+        _entries.clear()
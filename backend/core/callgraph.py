@@ -0,0 +1,489 @@
+#!/usr/bin/env python
+# _*_ coding: utf-8 _*_
+# @Time : 2026/10/18 下午6:10
+# @Author : Huzhaojun
+# @Version：V 1.0
+# @File : callgraph.py
+# @desc : 基于 Tree-sitter 查询的多语言调用关系提取，一次遍历得到类、函数定义及其中的调用
+
+import posixpath
+import threading
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from tree_sitter import Query
+
+from backend.core.analysis_cache import get_tree
+from backend.core.logger import Config, setup_logger
+from backend.core.parser import CodeTree
+
+# 加载配置和安装记录器
+config = Config("./config.yaml")
+logger = setup_logger(config)
+
+# 各语言的查询模式，捕获名约定：
+#   @class / @function  定义节点，@name 定义名称，@scope 类外定义的所属类（C++ A::f）
+#   @call  被调用的名称，@receiver  调用对象（obj.f() 中的 obj）
+#   @import  导入语句，@module 模块，@name 导入的名称，@alias 别名，@wildcard 导入全部名称
+# 不同版本语法的节点名称可能不同，每条模式单独校验，不可用的模式会被跳过
+QUERY_PATTERNS: Dict[str, List[str]] = {
+    "python": [
+        "(class_definition name: (identifier) @name) @class",
+        "(function_definition name: (identifier) @name) @function",
+        "(call function: (identifier) @call)",
+        "(call function: (attribute object: (_) @receiver attribute: (identifier) @call))",
+        "(import_statement name: (dotted_name) @module) @import",
+        "(import_statement name: (aliased_import name: (dotted_name) @module alias: (identifier) @alias)) @import",
+        "(import_from_statement module_name: (_) @module name: (dotted_name) @name) @import",
+        "(import_from_statement module_name: (_) @module name: (aliased_import name: (dotted_name) @name alias: (identifier) @alias)) @import",
+        "(import_from_statement module_name: (_) @module (wildcard_import) @wildcard) @import",
+    ],
+    "java": [
+        "(class_declaration name: (identifier) @name) @class",
+        "(interface_declaration name: (identifier) @name) @class",
+        "(enum_declaration name: (identifier) @name) @class",
+        "(record_declaration name: (identifier) @name) @class",
+        "(method_declaration name: (identifier) @name) @function",
+        "(constructor_declaration name: (identifier) @name) @function",
+        "(method_invocation name: (identifier) @call)",
+        "(method_invocation object: (_) @receiver name: (identifier) @call)",
+        "(object_creation_expression type: (type_identifier) @call)",
+        "(import_declaration (scoped_identifier scope: (_) @module name: (identifier) @name)) @import",
+        "(import_declaration (scoped_identifier) @module (asterisk) @wildcard) @import",
+    ],
+    "cpp": [
+        "(class_specifier name: (type_identifier) @name body: (_)) @class",
+        "(struct_specifier name: (type_identifier) @name body: (_)) @class",
+        "(function_definition declarator: (function_declarator declarator: (identifier) @name)) @function",
+        "(function_definition declarator: (function_declarator declarator: (field_identifier) @name)) @function",
+        "(function_definition declarator: (function_declarator declarator: "
+        "(qualified_identifier scope: (_) @scope name: (identifier) @name))) @function",
+        "(call_expression function: (identifier) @call)",
+        "(call_expression function: (field_expression argument: (_) @receiver field: (field_identifier) @call))",
+        "(call_expression function: (qualified_identifier scope: (_) @receiver name: (identifier) @call))",
+        "(preproc_include path: (string_literal) @module) @import",
+    ],
+    "c_sharp": [
+        "(class_declaration name: (identifier) @name) @class",
+        "(interface_declaration name: (identifier) @name) @class",
+        "(struct_declaration name: (identifier) @name) @class",
+        "(record_declaration name: (identifier) @name) @class",
+        "(method_declaration name: (identifier) @name) @function",
+        "(constructor_declaration name: (identifier) @name) @function",
+        "(local_function_statement name: (identifier) @name) @function",
+        "(invocation_expression function: (identifier) @call)",
+        "(invocation_expression function: (member_access_expression expression: (_) @receiver name: (identifier) @call))",
+        "(object_creation_expression type: (identifier) @call)",
+    ],
+    "javascript": [
+        "(class_declaration name: (identifier) @name) @class",
+        "(function_declaration name: (identifier) @name) @function",
+        "(generator_function_declaration name: (identifier) @name) @function",
+        "(method_definition name: (property_identifier) @name) @function",
+        "(variable_declarator name: (identifier) @name value: (arrow_function)) @function",
+        "(variable_declarator name: (identifier) @name value: (function_expression)) @function",
+        "(variable_declarator name: (identifier) @name value: (function)) @function",
+        "(call_expression function: (identifier) @call)",
+        "(call_expression function: (member_expression object: (_) @receiver property: (property_identifier) @call))",
+        "(new_expression constructor: (identifier) @call)",
+        "(import_statement (import_clause (identifier) @alias) source: (string) @module) @import",
+        "(import_statement (import_clause (named_imports (import_specifier name: (identifier) @name))) source: (string) @module) @import",
+        "(import_statement (import_clause (named_imports (import_specifier name: (identifier) @name alias: (identifier) @alias)))"
+        " source: (string) @module) @import",
+        "(import_statement (import_clause (namespace_import (identifier) @alias)) source: (string) @module) @import",
+    ],
+}
+
+DEFINITION_KINDS = ("class", "function")
+
+# 语言名称 -> 合并后的查询，None 表示该语言不支持
+_queries: Dict[str, Optional[Query]] = {}
+_lock = threading.Lock()
+
+
+def get_query(language: str) -> Optional[Query]:
+    """
+    获取语言的合并查询，首次使用时逐条校验模式后编译一次
+
+    :param language: 语言名称
+    :return: Query，语言不支持或没有可用模式时返回None
+    """
+
+    with _lock:
+        if language in _queries:
+            return _queries[language]
+
+        query = None
+        target = CodeTree.load_languages().get(language)
+        if target is not None and language in QUERY_PATTERNS:
+            valid = []
+            for pattern in QUERY_PATTERNS[language]:
+                try:
+                    target.query(pattern)
+                    valid.append(pattern)
+
+                except Exception as err:
+                    logger.debug(f"跳过 {language} 查询模式 {pattern}: {err}")
+
+            if valid:
+                query = target.query("\n".join(valid))
+
+        _queries[language] = query
+        return query
+
+
+def extract_symbols(code: str, file_path: str, language: str) -> Tuple[List[dict], List[dict], List[dict]]:
+    """
+    提取文件中的类、函数定义、调用点和导入，按位置排序后一次扫描确定所属作用域
+
+    :param code: 源代码
+    :param file_path: 文件路径，作为定义id的前缀
+    :param language: 语言名称
+    :return: (definitions, calls, imports)
+        definitions: [{"id", "name", "qualified", "kind", "parent", "code", "start_line", "end_line"}]
+        calls: [{"caller": 所在定义id, "name": 被调用名称, "receiver": 调用对象文本或None}]
+        imports: [{"module": 模块, "name": 导入的名称或None, "alias": 本地名称或None, "wildcard": 是否导入全部名称}]
+    """
+
+    query = get_query(language)
+    if query is None:
+        logger.warning(f"不支持提取调用关系的语言: {language} ({file_path})")
+        return [], [], []
+
+    tree = get_tree(language, code)
+    view = memoryview(code.encode("utf-8"))
+
+    def text(node) -> str:
+        return str(view[node.start_byte:node.end_byte], "utf-8", "replace")
+
+    # (起始字节, -结束字节, 类型序号, 类型, 节点, 捕获)，外层定义排在内层之前，同位置的定义排在调用之前
+    items = []
+    # (导入语句起始字节, 名称起始字节) -> 导入，同一名称被多条模式匹配时保留带别名的结果
+    imports_at: Dict[Tuple[int, int], dict] = {}
+    wildcard_at: Set[int] = set()
+    for _, captures in query.matches(tree.root_node):
+        statement = captures.get("import")
+        if statement is not None:
+            module, name, alias = captures.get("module"), captures.get("name"), captures.get("alias")
+            if module is None:
+                continue
+
+            entry = {
+                "module": text(module).strip("\"'<>"),
+                "name": text(name) if name is not None else None,
+                "alias": text(alias) if alias is not None else None,
+                "wildcard": "wildcard" in captures
+            }
+            if entry["wildcard"]:
+                wildcard_at.add(statement.start_byte)
+
+            # 没有别名时以导入的名称（或 import a.b 中的模块）作为本地名称
+            if entry["alias"] is None and not entry["wildcard"]:
+                entry["alias"] = entry["name"] or (entry["module"] if language == "python" else None)
+
+            key = (statement.start_byte, (name or alias or module).start_byte)
+            if key not in imports_at or alias is not None:
+                imports_at[key] = entry
+            continue
+
+        for kind in DEFINITION_KINDS:
+            node = captures.get(kind)
+            if node is not None and "name" in captures:
+                items.append((node.start_byte, -node.end_byte, 0, kind, node, captures))
+                break
+
+        else:
+            node = captures.get("call")
+            if node is not None:
+                items.append((node.start_byte, 0, 1, "call", node, captures))
+
+    items.sort(key=lambda item: item[:3])
+
+    definitions: List[dict] = []
+    calls: List[dict] = []
+    # 当前所在的定义 [(结束字节, 定义)]
+    stack: List[Tuple[int, dict]] = []
+    seen_ranges = set()
+    used_ids: Dict[str, int] = {}
+    calls_at: Dict[int, dict] = {}
+
+    for start, negative_end, _, kind, node, captures in items:
+        while stack and stack[-1][0] <= start:
+            stack.pop()
+
+        parent = stack[-1][1] if stack else None
+        receiver = captures.get("receiver")
+
+        if kind == "call":
+            # 不在任何定义内的调用（模块顶层）不产生边
+            if parent is None:
+                continue
+
+            # 同一调用点可能被带对象和不带对象的两条模式同时匹配
+            existing = calls_at.get(start)
+            if existing is not None:
+                if existing["receiver"] is None and receiver is not None:
+                    existing["receiver"] = text(receiver)
+                continue
+
+            call = calls_at[start] = {
+                "caller": parent["id"],
+                "name": text(node),
+                "receiver": text(receiver) if receiver is not None else None
+            }
+            calls.append(call)
+            continue
+
+        if (start, negative_end) in seen_ranges:
+            continue
+
+        seen_ranges.add((start, negative_end))
+        name = text(captures["name"])
+        scope = captures.get("scope")
+        if scope is not None:
+            qualified = f"{text(scope).replace('::', '.')}.{name}"
+
+        elif parent is not None:
+            qualified = f"{parent['qualified']}.{name}"
+
+        else:
+            qualified = name
+
+        # 重载或重复定义使用序号区分
+        func_id = f"{file_path}:{qualified}"
+        count = used_ids.get(func_id, 0)
+        used_ids[func_id] = count + 1
+        if count:
+            func_id = f"{func_id}#{count + 1}"
+
+        definition = {
+            "id": func_id,
+            "name": name,
+            "qualified": qualified,
+            "kind": kind,
+            "parent": parent["id"] if parent is not None else None,
+            "code": text(node),
+            "start_line": node.start_point[0] + 1,
+            "end_line": node.end_point[0] + 1
+        }
+        definitions.append(definition)
+        stack.append((node.end_byte, definition))
+
+    # 通配导入（Java import a.b.*）也会被普通导入模式匹配，只保留通配结果
+    imports = [entry for (start, _), entry in sorted(imports_at.items(), key=lambda item: item[0])
+               if entry["wildcard"] or start not in wildcard_at]
+
+    return definitions, calls, imports
+
+
+# 指向当前对象的调用对象
+SELF_RECEIVERS = {"self", "cls", "this", "base", "super", "super()"}
+# 各语言源文件的扩展名，用于由路径推导模块名
+SOURCE_EXTENSIONS = (".py", ".js", ".mjs", ".cjs", ".jsx", ".java", ".cs", ".cpp", ".cc", ".cxx", ".hpp", ".hh", ".h", ".c")
+
+
+def module_names(file_path: str) -> List[str]:
+    """
+    由文件路径推导模块名，返回全部后缀形式，a/b/c.py -> ["a.b.c", "b.c", "c"]；
+    a/b/__init__.py 与 a/b/index.js 同时对应包名 a.b
+
+    :param file_path: 文件路径
+    :return: 模块名列表
+    """
+
+    path = file_path.replace("\\", "/")
+    for extension in SOURCE_EXTENSIONS:
+        if path.endswith(extension):
+            path = path[:-len(extension)]
+            break
+
+    parts = [part for part in path.split("/") if part not in ("", ".", "..")]
+    if len(parts) > 1 and parts[-1] in ("__init__", "index"):
+        parts = parts[:-1]
+
+    return [".".join(parts[start:]) for start in range(len(parts))]
+
+
+class SymbolIndex:
+    """
+    项目级符号表，按名称、模块和导入别名索引定义，调用目标通过字典查找解析
+
+    用法：先对所有文件调用 add_file，再对每个调用点调用 resolve
+    """
+
+    def __init__(self):
+        # 定义id -> 定义
+        self.by_id: Dict[str, dict] = {}
+        # 名称 -> 全部同名定义
+        self.by_name: Dict[str, List[dict]] = {}
+        # 文件 -> {限定名: 定义}
+        self.by_file: Dict[str, Dict[str, dict]] = {}
+        # 模块名（含后缀形式） -> 文件集合
+        self.modules: Dict[str, Set[str]] = {}
+        # 文件 -> {本地名称: 导入}
+        self.aliases: Dict[str, Dict[str, dict]] = {}
+        # 文件 -> 通配导入
+        self.wildcards: Dict[str, List[dict]] = {}
+
+    def add_file(self, file_path: str, definitions: List[dict], imports: Iterable[dict] = ()) -> None:
+        """
+        登记一个文件的定义和导入
+
+        :param file_path: 文件路径
+        :param definitions: extract_symbols 返回的定义
+        :param imports: extract_symbols 返回的导入
+        :return: None
+        """
+
+        symbols = self.by_file.setdefault(file_path, {})
+        for definition in definitions:
+            self.by_id[definition["id"]] = definition
+            self.by_name.setdefault(definition["name"], []).append(definition)
+            symbols.setdefault(definition["qualified"], definition)
+
+        for module in module_names(file_path):
+            self.modules.setdefault(module, set()).add(file_path)
+
+        aliases = self.aliases.setdefault(file_path, {})
+        wildcards = self.wildcards.setdefault(file_path, [])
+        for entry in imports:
+            if entry["wildcard"] or entry["alias"] is None:
+                # C++ #include 与通配导入一样，使被导入文件的顶层名称可见
+                wildcards.append(entry)
+
+            else:
+                aliases[entry["alias"]] = entry
+
+    def module_files(self, module: str, from_file: str) -> Set[str]:
+        """
+        查找模块对应的文件，支持 Python 相对导入（.a、..a）与 JavaScript/C++ 相对路径（./a、../a）
+
+        :param module: 导入语句中的模块
+        :param from_file: 导入所在的文件
+        :return: 文件集合
+        """
+
+        directory = posixpath.dirname(from_file.replace("\\", "/"))
+
+        if module.startswith("."):
+            if "/" in module or module in (".", ".."):
+                # ./a、../a 相对路径
+                key = posixpath.normpath(posixpath.join(directory, module))
+
+            else:
+                # .a、..a 相对导入：一个点表示当前包，每多一个点上移一级
+                dots = len(module) - len(module.lstrip("."))
+                base = directory
+                for _ in range(dots - 1):
+                    base = posixpath.dirname(base)
+                rest = module[dots:].replace(".", "/")
+                key = posixpath.join(base, rest) if rest else base
+
+            module = ".".join(part for part in key.split("/") if part not in ("", ".", ".."))
+
+        else:
+            module = module.replace("/", ".").replace("::", ".")
+
+        for extension in SOURCE_EXTENSIONS:
+            if module.endswith(extension):
+                module = module[:-len(extension)]
+                break
+
+        return self.modules.get(module, set())
+
+    def lookup(self, files: Iterable[str], qualified: str) -> Optional[dict]:
+        """在给定文件中查找限定名对应的定义"""
+
+        for file_path in files:
+            definition = self.by_file.get(file_path, {}).get(qualified)
+            if definition is not None:
+                return definition
+
+        return None
+
+    def _owner(self, definition: dict) -> Optional[dict]:
+        """定义所属的类（自身为类时返回自身）"""
+
+        while definition is not None and definition["kind"] != "class":
+            definition = self.by_id.get(definition["parent"]) if definition["parent"] else None
+
+        return definition
+
+    def _imported(self, entry: dict, from_file: str, member: Optional[str] = None) -> Optional[dict]:
+        """
+        解析导入的名称：member 为 None 时解析名称本身，否则解析名称下的成员（模块中的函数或类中的方法）
+        """
+
+        files = self.module_files(entry["module"], from_file)
+        name = entry["name"]
+
+        if member is None:
+            return self.lookup(files, name) if name else None
+
+        if name:
+            # from a import Class -> Class.member；from a import module -> module 中的 member（Java 中类即文件）
+            return (self.lookup(files, f"{name}.{member}")
+                    or self.lookup(self.module_files(f"{entry['module']}.{name}", from_file), member)
+                    or self.lookup(self.module_files(f"{entry['module']}.{name}", from_file), f"{name}.{member}"))
+
+        # import a.b 或 import * as ns
+        return self.lookup(files, member)
+
+    def resolve(self, call: dict, file_path: str) -> Optional[dict]:
+        """
+        解析调用目标，依次尝试：所属类的成员、本文件顶层定义、导入的名称、通配导入的模块，
+        最后在本文件内按名称匹配，或在全项目中唯一同名时使用该定义
+
+        :param call: extract_symbols 返回的调用
+        :param file_path: 调用所在的文件
+        :return: 目标定义，无法确定时返回None
+        """
+
+        name, receiver = call["name"], call["receiver"]
+        caller = self.by_id.get(call["caller"])
+        local = self.by_file.get(file_path, {})
+        aliases = self.aliases.get(file_path, {})
+
+        if receiver is None or receiver in SELF_RECEIVERS:
+            owner = self._owner(caller)
+            if owner is not None:
+                target = local.get(f"{owner['qualified']}.{name}")
+                if target is not None:
+                    return target
+
+        if receiver is None:
+            target = local.get(name)
+            if target is not None:
+                return target
+
+            entry = aliases.get(name)
+            if entry is not None:
+                target = self._imported(entry, file_path)
+                if target is not None:
+                    return target
+
+            for entry in self.wildcards.get(file_path, ()):
+                target = self.lookup(self.module_files(entry["module"], file_path), name)
+                if target is not None:
+                    return target
+
+        elif receiver not in SELF_RECEIVERS:
+            entry = aliases.get(receiver)
+            if entry is not None:
+                target = self._imported(entry, file_path, name)
+                if target is not None:
+                    return target
+
+            # 本文件中的类：Class.method()
+            target = local.get(f"{receiver}.{name}")
+            if target is not None:
+                return target
+
+        candidates = self.by_name.get(name)
+        if not candidates:
+            return None
+
+        same_file = [item for item in candidates if local.get(item["qualified"]) is item]
+        if same_file:
+            return next((item for item in same_file if item["parent"] is None), same_file[0])
+
+        return candidates[0] if len(candidates) == 1 else None
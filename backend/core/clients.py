@@ -0,0 +1,188 @@
+#!/usr/bin/env python
+# _*_ coding: utf-8 _*_
+# @Time : 2026/10/18 上午10:40
+# @Author : Huzhaojun
+# @Version：V 1.0
+# @File : clients.py
+# @desc : 模型客户端注册表，按服务商复用长连接池
+
+import threading
+from typing import Any, Dict, Optional, Tuple
+
+import httpx
+from openai import OpenAI, AsyncOpenAI, DefaultHttpxClient, DefaultAsyncHttpxClient
+from ollama import Client, AsyncClient
+
+from backend.core.logger import Config, setup_logger
+
+# 加载配置和安装记录器
+config = Config("./config.yaml")
+logger = setup_logger(config)
+
+# 连接池参数
+MAX_CONNECTIONS = int(config.get_nested("client_set", "MAX_CONNECTIONS", default=20))
+MAX_KEEPALIVE_CONNECTIONS = int(config.get_nested("client_set", "MAX_KEEPALIVE_CONNECTIONS", default=10))
+KEEPALIVE_EXPIRY = float(config.get_nested("client_set", "KEEPALIVE_EXPIRY", default=60))
+HTTP2 = str(config.get_nested("client_set", "HTTP2", default="True")).lower() == "true"
+OLLAMA_HOST = config.get_nested("client_set", "OLLAMA_HOST", default="") or None
+
+# HTTP/2 依赖 h2 库，未安装时回退到 HTTP/1.1
+try:
+    import h2  # noqa: F401
+
+except ImportError:
+    if HTTP2:
+        logger.info("未安装 h2，模型客户端使用 HTTP/1.1 (pip install httpx[http2] 以启用 HTTP/2)")
+    HTTP2 = False
+
+# (服务商键, 是否异步) -> 客户端实例
+_clients: Dict[Tuple[str, bool], Any] = {}
+# 服务商键 -> 连接复用统计
+_metrics: Dict[str, Dict[str, int]] = {}
+_lock = threading.Lock()
+
+
+def _record(key: str, field: str) -> None:
+    """累加指定服务商的统计项"""
+
+    with _lock:
+        stats = _metrics.setdefault(key, {"requests": 0, "connections": 0})
+        stats[field] += 1
+
+
+def _pool_options(key: str, asynchronous: bool) -> dict:
+    """
+    构造连接池参数，并通过 httpcore 的 trace 扩展统计新建连接数
+
+    :param key: 服务商键
+    :param asynchronous: 是否为异步客户端
+    :return: 传递给 httpx 客户端的参数
+    """
+
+    limits = httpx.Limits(
+        max_connections=MAX_CONNECTIONS,
+        max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=KEEPALIVE_EXPIRY
+    )
+
+    if asynchronous:
+        async def trace(event: str, info: dict) -> None:
+            if event == "connection.connect_tcp.complete":
+                _record(key, "connections")
+
+        async def on_request(request: httpx.Request) -> None:
+            _record(key, "requests")
+            request.extensions["trace"] = trace
+
+    else:
+        def trace(event: str, info: dict) -> None:
+            if event == "connection.connect_tcp.complete":
+                _record(key, "connections")
+
+        def on_request(request: httpx.Request) -> None:
+            _record(key, "requests")
+            request.extensions["trace"] = trace
+
+    return {"limits": limits, "http2": HTTP2, "event_hooks": {"request": [on_request]}}
+
+
+def get_openai_client(section: str, asynchronous: bool = True):
+    """
+    获取指定服务商（配置文件中的节点名，如 deepseek、siliconflow）的 OpenAI 兼容客户端，
+    同一服务商在进程生命周期内复用同一个连接池
+
+    :param section: 配置节点名称
+    :param asynchronous: True 返回 AsyncOpenAI，False 返回 OpenAI
+    :return: 客户端实例
+    """
+
+    with _lock:
+        client = _clients.get((section, asynchronous))
+
+    if client is not None:
+        return client
+
+    api_key = config.get_nested(section, "API_KEY", default="")
+    base_url = config.get_nested(section, "BASE_URL", default="")
+    options = _pool_options(section, asynchronous)
+
+    if asynchronous:
+        client = AsyncOpenAI(api_key=api_key, base_url=base_url, http_client=DefaultAsyncHttpxClient(**options))
+
+    else:
+        client = OpenAI(api_key=api_key, base_url=base_url, http_client=DefaultHttpxClient(**options))
+
+    with _lock:
+        # 并发创建时保留先注册的实例
+        client = _clients.setdefault((section, asynchronous), client)
+
+    logger.info(f"创建模型客户端: {section} (async={asynchronous}, http2={HTTP2})")
+    return client
+
+
+def get_ollama_client(host: Optional[str] = None, asynchronous: bool = True):
+    """
+    获取指定地址的 ollama 客户端，同一地址复用同一个连接池
+
+    :param host: ollama 服务地址，默认读取 client_set.OLLAMA_HOST 或 OLLAMA_HOST 环境变量
+    :param asynchronous: True 返回 AsyncClient，False 返回 Client
+    :return: 客户端实例
+    """
+
+    host = host or OLLAMA_HOST
+    key = f"ollama:{host or 'default'}"
+
+    with _lock:
+        client = _clients.get((key, asynchronous))
+
+    if client is not None:
+        return client
+
+    options = _pool_options(key, asynchronous)
+    client = AsyncClient(host=host, **options) if asynchronous else Client(host=host, **options)
+
+    with _lock:
+        client = _clients.setdefault((key, asynchronous), client)
+
+    logger.info(f"创建模型客户端: {key} (async={asynchronous}, http2={HTTP2})")
+    return client
+
+
+def get_client_metrics() -> Dict[str, Dict[str, int]]:
+    """
+    返回各服务商的连接复用统计
+
+    :return: {服务商键: {"requests": 请求数, "connections": 新建连接数, "reused": 复用连接的请求数}}
+    """
+
+    with _lock:
+        return {
+            key: {**stats, "reused": max(stats["requests"] - stats["connections"], 0)}
+            for key, stats in _metrics.items()
+        }
+
+
+async def close_clients() -> None:
+    """关闭所有已创建的客户端，在服务退出时调用"""
+
+    with _lock:
+        clients = list(_clients.items())
+        _clients.clear()
+
+    for (key, asynchronous), client in clients:
+        try:
+            if isinstance(client, AsyncOpenAI):
+                await client.close()
+
+            elif isinstance(client, OpenAI):
+                client.close()
+
+            # ollama 客户端未提供关闭方法，直接关闭其内部的 httpx 客户端
+            elif asynchronous:
+                await client._client.aclose()
+
+            else:
+                client._client.close()
+
+        except Exception as err:
+            logger.info(f"关闭模型客户端失败 {key}: {err}")
@@ -0,0 +1,203 @@
+#!/usr/bin/env python
+# _*_ coding: utf-8 _*_
+# @Time : 2026/10/18 下午7:05
+# @Author : Huzhaojun
+# @Version：V 1.0
+# @File : languages.py
+# @desc : 文件后缀到 Tree-sitter 语言的注册表，启动时加载一次，审查与思维导图共用
+
+import os
+import threading
+from json import dumps, loads
+from typing import Dict, Optional, Tuple
+
+from backend.core.logger import Config, setup_logger
+from backend.core.parser import CodeTree
+
+# 加载配置和安装记录器
+config = Config("./config.yaml")
+logger = setup_logger(config)
+
+# 用户自定义与补全的后缀表，格式 {后缀: 语言名称}
+LANGUAGE_FILE = "./language.json"
+# 对没有已知后缀的语言，启动时是否询问模型一次（结果保存到 LANGUAGE_FILE）
+ASK_MODEL = str(config.get_nested("language_set", "ASK_MODEL", default="False")).lower() == "true"
+
+# 常见语法仓库的后缀，每种语言的第一个后缀作为该语言的主后缀（Lizard 按后缀选择分析器）
+BUILTIN_EXTENSIONS: Dict[str, Tuple[str, ...]] = {
+    "python": ("py", "pyw", "pyi"),
+    "javascript": ("js", "mjs", "cjs", "jsx"),
+    "java": ("java",),
+    "cpp": ("cpp", "cc", "cxx", "hpp", "hh", "hxx", "h"),
+    "c_sharp": ("cs",),
+    "c": ("c",),
+    "typescript": ("ts",),
+    "tsx": ("tsx",),
+    "go": ("go",),
+    "rust": ("rs",),
+    "ruby": ("rb",),
+    "php": ("php",),
+    "kotlin": ("kt", "kts"),
+    "swift": ("swift",),
+    "scala": ("scala",),
+    "lua": ("lua",),
+    "bash": ("sh", "bash"),
+}
+
+# 后缀 -> 语言名称
+_extensions: Dict[str, str] = {}
+# 语言名称 -> 主后缀
+_primary: Dict[str, str] = {}
+_loaded = False
+_lock = threading.Lock()
+
+
+def _read_language_file() -> Dict[str, str]:
+    if not os.path.isfile(LANGUAGE_FILE):
+        return {}
+
+    try:
+        with open(LANGUAGE_FILE, "r", encoding="utf-8") as file:
+            data = loads(file.read() or "{}")
+
+        return {str(key).lower().lstrip("."): str(value) for key, value in data.items()}
+
+    except Exception as err:
+        logger.info(f"读取语言后缀表失败 {err}")
+        return {}
+
+
+def _ask_model(languages: list) -> Dict[str, str]:
+    """询问模型未知语言的后缀，一次请求返回全部结果"""
+
+    from backend.core.model import send_message
+
+    reply = send_message(message=f"请按顺序返回{'、'.join(languages)}语言的文件后缀名，不带点号且以空格分割，例如cpp py java",
+                         join=False, clean_data=False)
+    suffixes = str(reply.get("message", "")).split()
+    if len(suffixes) != len(languages):
+        logger.info(f"模型返回的后缀数量不符: {suffixes}")
+        return {}
+
+    return {suffix.lower().lstrip("."): language for suffix, language in zip(suffixes, languages)}
+
+
+def load_language_registry() -> Dict[str, str]:
+    """
+    构建后缀注册表，进程内只执行一次：内置后缀表 + language.json，只保留已加载语法的语言。
+    仍没有后缀的语言以语言名称作为后缀，开启 language_set.ASK_MODEL 时先询问模型一次并保存
+
+    :return: {后缀: 语言名称}
+    """
+
+    global _loaded
+
+    with _lock:
+        if _loaded:
+            return _extensions
+
+        grammars = list(CodeTree.load_languages())
+        # 没有任何语法时保留内置后缀，让审查结果中给出解析失败的原因
+        available = set(grammars) or set(BUILTIN_EXTENSIONS)
+
+        extensions: Dict[str, str] = {}
+        primary: Dict[str, str] = {}
+        for language, suffixes in BUILTIN_EXTENSIONS.items():
+            if language in available:
+                primary[language] = suffixes[0]
+                for suffix in suffixes:
+                    extensions[suffix] = language
+
+        saved = _read_language_file()
+        for suffix, language in saved.items():
+            if language in available:
+                extensions[suffix] = language
+                primary.setdefault(language, suffix)
+
+        missing = [language for language in grammars if language not in primary]
+        if missing and ASK_MODEL:
+            try:
+                asked = _ask_model(missing)
+                if asked:
+                    saved.update(asked)
+                    with open(LANGUAGE_FILE, "w", encoding="utf-8") as file:
+                        file.write(dumps(saved, ensure_ascii=False))
+
+                    logger.info(f"已保存模型返回的语言后缀: {asked}")
+
+                for suffix, language in asked.items():
+                    extensions.setdefault(suffix, language)
+                    primary.setdefault(language, suffix)
+
+            except Exception as err:
+                logger.info(f"询问语言后缀失败 {err}")
+
+        for language in grammars:
+            if language not in primary:
+                primary[language] = language
+                extensions.setdefault(language, language)
+
+        _extensions.clear()
+        _extensions.update(extensions)
+        _primary.clear()
+        _primary.update(primary)
+        _loaded = True
+        logger.info(f"语言后缀表加载完成: {len(extensions)} 个后缀, {len(primary)} 种语言")
+
+        return _extensions
+
+
+def language_for_path(file_path: str) -> Optional[str]:
+    """
+    根据文件后缀获取语言名称
+
+    :param file_path: 文件路径
+    :return: 语言名称，不支持时返回None
+    """
+
+    if not _loaded:
+        load_language_registry()
+
+    name = file_path.replace("\\", "/").rsplit("/", 1)[-1]
+    if "." not in name:
+        return None
+
+    return _extensions.get(name.rsplit(".", 1)[-1].lower())
+
+
+def resolve_language(language: str) -> str:
+    """
+    将后缀（py、cs）或语言名称统一为语言名称，无法识别时原样返回
+
+    :param language: 后缀或语言名称
+    :return: 语言名称
+    """
+
+    if not _loaded:
+        load_language_registry()
+
+    language = language.lower().lstrip(".")
+    if language in _primary:
+        return language
+
+    return _extensions.get(language, language)
+
+
+def extension_for(language: str) -> str:
+    """
+    获取语言的主后缀，供按后缀选择分析器的 Lizard 使用
+
+    :param language: 语言名称
+    :return: 后缀（不带点号），未知语言原样返回
+    """
+
+    if not _loaded:
+        load_language_registry()
+
+    return _primary.get(language, language)
+
+
+def is_supported(file_path: str) -> bool:
+    """文件是否属于已注册的语言"""
+
+    return language_for_path(file_path) is not None
@@ -0,0 +1,226 @@
+#!/usr/bin/env python
+# _*_ coding: utf-8 _*_
+# @Time : 2026/10/18 下午1:20
+# @Author : Huzhaojun
+# @Version：V 1.0
+# @File : mirror.py
+# @desc : 仓库本地镜像，维护每个仓库的裸镜像并直接从git对象库读取文件
+
+import os
+import re
+import base64
+import threading
+import subprocess
+from typing import Callable, Dict, List, Optional
+
+from backend.core.logger import Config, setup_logger
+
+# 加载配置和安装记录器
+config = Config("./config.yaml")
+logger = setup_logger(config)
+
+MIRROR_DIR = config.get_nested("github_set", "MIRROR_DIR", default="./backend/database/mirrors")
+GITHUB_TOKEN = config.get_nested("github_set", "token", default="")
+
+# 同一镜像的同步操作需要串行
+_locks: Dict[str, threading.Lock] = {}
+_locks_guard = threading.Lock()
+
+
+def is_local_repository(url: str) -> bool:
+    """判断是否为本地仓库（file:// 地址或本地路径）"""
+
+    return url.startswith("file://") or os.path.isdir(url)
+
+
+def local_path(url: str) -> str:
+    """file:// 地址转为本地路径"""
+
+    return url[len("file://"):] if url.startswith("file://") else url
+
+
+def mirror_path(url: str) -> str:
+    """
+    仓库对应的镜像目录，例如 https://github.com/owner/repo -> MIRROR_DIR/github.com_owner_repo.git
+
+    :param url: 仓库地址
+    :return: 镜像目录
+    """
+
+    name = re.sub(r"^[a-z]+://", "", url.rstrip("/"))
+    name = re.sub(r"\.git$", "", name)
+    name = re.sub(r"[^A-Za-z0-9._-]+", "_", name).strip("_")
+    return os.path.join(MIRROR_DIR, f"{name}.git")
+
+
+def git(args: List[str], git_dir: Optional[str] = None, input: Optional[bytes] = None) -> bytes:
+    """
+    执行git命令
+
+    :param args: git 参数
+    :param git_dir: 仓库目录（--git-dir）
+    :param input: 标准输入
+    :return: 标准输出
+    """
+
+    command = ["git"] + (["--git-dir", git_dir] if git_dir else []) + args
+    process = subprocess.run(command, input=input, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    if process.returncode != 0:
+        raise RuntimeError(f"git {' '.join(args[:2])} 失败: {process.stderr.decode('utf-8', 'replace').strip()}")
+
+    return process.stdout
+
+
+def is_valid_ref(ref: str) -> bool:
+    """
+    判断请求中传入的分支或提交是否为合法引用，避免以 - 开头的值被git当作选项解析
+
+    :param ref: 分支名、引用或提交sha
+    :return: 是否合法
+    """
+
+    if not ref or ref.startswith("-"):
+        return False
+
+    if re.fullmatch(r"[0-9a-fA-F]{4,40}", ref):
+        return True
+
+    process = subprocess.run(["git", "check-ref-format", "--allow-onelevel", ref],
+                             stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return process.returncode == 0
+
+
+def check_ref(ref: str) -> None:
+    """引用不合法时抛出ValueError"""
+
+    if not is_valid_ref(ref):
+        raise ValueError(f"无效的分支或提交: {ref}")
+
+
+def _auth_args(url: str) -> List[str]:
+    """访问GitHub时通过请求头传递token，避免写入镜像配置"""
+
+    if GITHUB_TOKEN and url.startswith("https://github.com/"):
+        credential = base64.b64encode(f"x-access-token:{GITHUB_TOKEN}".encode()).decode()
+        return ["-c", f"http.extraHeader=Authorization: Basic {credential}"]
+
+    return []
+
+
+def _lock(path: str) -> threading.Lock:
+    with _locks_guard:
+        return _locks.setdefault(path, threading.Lock())
+
+
+def sync_mirror(url: str, branch: str) -> str:
+    """
+    同步仓库镜像并返回可读取的git目录。
+    本地仓库直接使用其自身的git目录；远程仓库首次浅克隆指定分支，之后只拉取增量。
+
+    :param url: 仓库地址、file:// 地址或本地路径
+    :param branch: 分支
+    :return: git目录
+    """
+
+    check_ref(branch)
+
+    if is_local_repository(url):
+        return _local_git_dir(local_path(url))
+
+    path = mirror_path(url)
+    with _lock(path):
+        if not os.path.isdir(path):
+            os.makedirs(path, exist_ok=True)
+            git(["init", "--bare", "--quiet"], git_dir=path)
+            git(["remote", "add", "origin", url], git_dir=path)
+            logger.info(f"创建仓库镜像: {path}")
+
+        # 浅拉取指定分支，已有对象不会重复下载
+        git(_auth_args(url) + ["fetch", "--quiet", "--depth", "1", "--no-tags", "--end-of-options", "origin",
+                               f"+refs/heads/{branch}:refs/heads/{branch}"], git_dir=path)
+        logger.info(f"仓库镜像同步完成: {url} ({branch})")
+
+    return path
+
+
+def _local_git_dir(path: str) -> str:
+    """返回本地仓库（工作区或裸仓库）的git目录"""
+
+    dot_git = os.path.join(path, ".git")
+    return dot_git if os.path.exists(dot_git) else path
+
+
+def resolve_commit(git_dir: str, ref: str) -> str:
+    """解析引用对应的提交"""
+
+    check_ref(ref)
+    return git(["rev-parse", "--verify", "--end-of-options", f"{ref}^{{commit}}"], git_dir=git_dir).decode().strip()
+
+
+def read_files(git_dir: str, ref: str, select: Callable[[str], bool]) -> Dict[str, bytes]:
+    """
+    通过 ls-tree 列出文件，再用一次 cat-file --batch 读取全部内容
+
+    :param git_dir: git目录
+    :param ref: 提交或分支
+    :param select: 文件路径筛选函数
+    :return: {文件路径: 文件内容}
+    """
+
+    check_ref(ref)
+
+    entries = []
+    for line in git(["ls-tree", "-r", "-z", "--full-tree", "--end-of-options", ref], git_dir=git_dir).split(b"\0"):
+        if not line:
+            continue
+
+        meta, file_path = line.split(b"\t", 1)
+        _, object_type, sha = meta.split()
+        file_path = file_path.decode("utf-8", "replace")
+        if object_type == b"blob" and select(file_path):
+            entries.append((file_path, sha))
+
+    if not entries:
+        return {}
+
+    output = git(["cat-file", "--batch"], git_dir=git_dir, input=b"".join(sha + b"\n" for _, sha in entries))
+
+    files = {}
+    offset = 0
+    for file_path, _ in entries:
+        header_end = output.index(b"\n", offset)
+        size = int(output[offset:header_end].split()[2])
+        start = header_end + 1
+        files[file_path] = output[start:start + size]
+        # 内容之后还有一个换行符
+        offset = start + size + 1
+
+    return files
+
+
+def changed_paths(git_dir: str, base: str, head: str, url: Optional[str] = None) -> List[str]:
+    """
+    列出两个提交之间发生变化的文件（重命名视为删除和新增，两个路径都会返回）。
+    浅克隆的镜像中缺少基准提交时会先单独拉取该提交。
+
+    :param git_dir: git目录
+    :param base: 基准提交或引用
+    :param head: 目标提交或引用
+    :param url: 远程仓库地址，提供时允许拉取缺失的基准提交
+    :return: 变化的文件路径列表
+    """
+
+    check_ref(base)
+    check_ref(head)
+
+    try:
+        resolve_commit(git_dir, base)
+
+    except RuntimeError:
+        if not url:
+            raise
+
+        git(_auth_args(url) + ["fetch", "--quiet", "--depth", "1", "--no-tags", "--end-of-options", "origin", base], git_dir=git_dir)
+
+    output = git(["diff", "--name-only", "-z", "--no-renames", "--end-of-options", base, head], git_dir=git_dir)
+    return [item.decode("utf-8", "replace") for item in output.split(b"\0") if item]
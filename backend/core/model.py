@@ -10,12 +10,13 @@ import logging
 # 日志函数
 from backend.core.logger import setup_logger, Config
 from json import loads, JSONDecodeError
-from typing import Dict, Any, Optional
+from typing import Dict, Any, Optional, Callable, Awaitable
 import re
 
 import requests
-from openai import OpenAI
-from ollama import chat, ChatResponse
+from openai import AsyncOpenAI
+from ollama import ChatResponse
+from backend.core.clients import get_openai_client, get_ollama_client
 
 user_config = Config(r"./config.yaml")
 # user_config = Config("./config.yaml")
@@ -26,6 +27,22 @@ pattern = user_config.get_nested('model_set', "PATTERN")
 polling = bool(eval(user_config.get_nested("model_set", "POLLING", default=True)))
 max_retries = user_config.get_nested("model_set", "MAX_RETRIES", default=3)
 
+# 审查提示词版本，修改 create_prompt 的内容后需要递增，使旧的审查缓存失效
+PROMPT_VERSION = "1"
+
+
+def model_identity() -> str:
+    """
+    当前使用的模型标识，云端模式包含配置节点和具体模型名称
+
+    :return: 例如 local:qwen2.5:7b 或 cloud:deepseek:deepseek-reasoner
+    """
+
+    if pattern == "cloud":
+        return f"cloud:{model_name}:{user_config.get_nested(model_name, 'MODEL', default='deepseek-reasoner')}"
+
+    return f"{pattern}:{model_name}"
+
 
 def create_prompt(message: str) -> str:
     """
@@ -69,11 +86,8 @@ def send_message(message: str, join: bool = True, clean_data: bool = True) -> di
 
     if pattern == "cloud":
 
-        # 初始化OpenAI客户端
-        client = OpenAI(
-            api_key=user_config.get_nested(model_name, 'API_KEY', default=''),
-            base_url=user_config.get_nested(model_name, 'BASE_URL', default='')
-        )
+        # 复用该服务商的OpenAI客户端
+        client = get_openai_client(model_name, asynchronous=False)
 
         return get_general_api_response(client, model_name, message, join, clean_data)
 
@@ -97,6 +111,8 @@ def ollama_server(model_name: str, message: str, join: bool = True, clean_data:
     :return: dict(state: int, message: str)
     """
 
+    client = get_ollama_client(asynchronous=False)
+
     # 预创建prompt避免重复构建
     if join:
         prompt = create_prompt(message)
@@ -112,7 +128,7 @@ def ollama_server(model_name: str, message: str, join: bool = True, clean_data:
 
         try:
             # 非流式输出
-            response: ChatResponse = chat(model=model_name, messages=[
+            response: ChatResponse = client.chat(model=model_name, messages=[
                 {
                     "role": "user",
                     "content": prompt if attempt == 1 or not join else prompts
@@ -300,7 +316,7 @@ def get_general_api_response(client, model_name, message: str, join: bool = True
         logger.info(f"API 回复: {reply[:30]}")
 
         if not clean_data:
-            return reply
+            return return_template(200, reply)
 
         reply = clean_json_response(reply)
         logger.info("reply 前后缀清理成功")
@@ -315,29 +331,256 @@ def get_general_api_response(client, model_name, message: str, join: bool = True
             return extract_fallback_json(reply)
 
     except Exception as e:
-        error_information = str(e)
-        logger.error(f"API 调用失败 : {str(e)}", exc_info=True)
+        log_api_error(e)
 
-        if "real name verification" in error_information:
-            logger.error("错误：API 服务商反馈请完成实名认证后再使用！")
+        return return_template(state=500, message="服务请求不可用，请稍后再试")
 
-        elif "rate" in error_information:
-            logger.error("错误：API 服务商反馈当前访问 API 服务频次达到上限，请稍后再试！")
 
-        elif "paid" in error_information:
-            logger.error("错误：API 服务商反馈您正在使用付费模型，请先充值再使用或使用免费额度模型！")
+def log_api_error(e: Exception) -> None:
+    """
+    根据服务商返回的异常信息输出对应的错误提示
 
-        elif "Api key is invalid" in error_information:
-            logger.error("错误：API 服务商反馈 API KEY 不可用，请检查配置选项！")
+    :param e: 调用接口时抛出的异常
+    :return: None
+    """
 
-        elif "busy" in error_information:
-            logger.error("错误：API 服务商反馈服务器繁忙，请稍后再试！")
+    error_information = str(e)
+    logger.error(f"API 调用失败 : {str(e)}", exc_info=True)
+
+    if "real name verification" in error_information:
+        logger.error("错误：API 服务商反馈请完成实名认证后再使用！")
+
+    elif "rate" in error_information:
+        logger.error("错误：API 服务商反馈当前访问 API 服务频次达到上限，请稍后再试！")
+
+    elif "paid" in error_information:
+        logger.error("错误：API 服务商反馈您正在使用付费模型，请先充值再使用或使用免费额度模型！")
+
+    elif "Api key is invalid" in error_information:
+        logger.error("错误：API 服务商反馈 API KEY 不可用，请检查配置选项！")
+
+    elif "busy" in error_information:
+        logger.error("错误：API 服务商反馈服务器繁忙，请稍后再试！")
+
+    else:
+        logger.error("错误：" + str(e))
+
+
+async def async_send_message(message: str, join: bool = True, clean_data: bool = True) -> dict:
+    """
+    send_message 的异步版本，返回格式与 send_message 一致，调用期间不会阻塞事件循环
+
+    :param message: 用户消息
+    :param join: 是否拼接prompt
+    :param clean_data: 是否清理并解析JSON
+    :return: dict(state: int, message: str or dict)
+    """
+
+    if pattern == "cloud":
+
+        # 复用该服务商的OpenAI异步客户端
+        client = get_openai_client(model_name)
+
+        return await async_get_general_api_response(client, model_name, message, join, clean_data)
+
+    elif pattern == "local":
+        logger.info("本地ollama回复")
+
+        return await async_ollama_server(model_name=model_name, message=message, join=join, clean_data=clean_data)
+
+    else:
+        return return_template(state=500, message="配置文件错误，请假查配置选项")
+
+
+async def async_ollama_server(model_name: str, message: str, join: bool = True, clean_data: bool = True) -> Dict[str, Any]:
+    """
+    ollama_server 的异步版本，使用 ollama.AsyncClient
+
+    :param model_name: 调用的模型名称
+    :param message: 用户消息
+    :param join: 是否拼接prompt
+    :param clean_data: 是否清理并解析JSON
+    :return: dict(state: int, message: str)
+    """
+
+    client = get_ollama_client()
+
+    # 预创建prompt避免重复构建
+    if join:
+        prompt = create_prompt(message)
+        prompts = create_polling_prompt(message)
+
+    else:
+        prompt = message
+        prompts = message
+
+    # 多次轮询
+    for attempt in range(1, max_retries + 1):
+        logger.info(f"轮询 {attempt}: >>>")
+
+        try:
+            response: ChatResponse = await client.chat(model=model_name, messages=[
+                {
+                    "role": "user",
+                    "content": prompt if attempt == 1 or not join else prompts
+                },
+            ])
+
+            reply = response['message']['content'].strip()
+            if reply == "" or reply is None:
+                logger.info("API 返回内容为空")
+                if attempt == max_retries:
+                    return return_template(state=False, message="服务请求不可用，请检查ollama服务是否启动，请稍后再试")
+
+                continue
+
+            logger.info(f"API 回复: {reply[:30]}")
+
+            if not clean_data:
+                return return_template(200, reply)
+
+            # 清理代码块标记
+            clean_reply = clean_json_response(reply)
+            logger.info(f"API 返回内容处理结果: {clean_reply[:30]}")
+
+            try:
+                reply_json = loads(clean_reply)
+                return return_template(state=200, message=reply_json)
+
+            except JSONDecodeError as err:
+                logger.warning(f"JSON解析失败: reply: [{reply}] [error： {err}]")
+
+                # 最终尝试时使用宽松解析
+                if attempt == max_retries:
+                    return extract_fallback_json(clean_reply)
+
+        except Exception as err:
+            logger.error(f"请求异常: {err}")
+            if attempt == max_retries:
+                return return_template(state=500, message=f"服务请求失败: {str(err)}")
+
+
+async def async_get_general_api_response(client: AsyncOpenAI, model_name, message: str, join: bool = True, clean_data: bool = True) -> Dict:
+    """
+    get_general_api_response 的异步版本
+
+    :param client: AsyncOpenAI 客户端
+    :param model_name: 配置文件中的模型节点名称
+    :param message: 用户的消息或系统提示词
+    :param join: 是否拼接prompt
+    :param clean_data: 是否清理并解析JSON
+    :return: 返回一个dict对象
+    """
+
+    try:
+        logger.info(f"get {model_name} response")
+        messages_to_send = [{"role": "user", "content": create_prompt(message) if join else message}]
+
+        # 回复最大token
+        MAX_TOKEN = user_config.get_nested(model_name, "MAX_TOKEN", default=2000)
+        # 模型选择
+        MODEL = user_config.get_nested(model_name, "MODEL", default="deepseek-reasoner")
+
+        response = await client.chat.completions.create(
+            model=MODEL,
+            messages=messages_to_send,
+            max_tokens=MAX_TOKEN,
+            stream=False
+        )
+
+        if not response.choices:
+            logger.info("API 返回内容为空")
+            return return_template(state=False, message="服务请求不可用，请稍后再试")
+
+        reply = response.choices[0].message.content.strip()
+        logger.info(f"API 回复: {reply[:30]}")
+
+        if not clean_data:
+            return return_template(200, reply)
+
+        reply = clean_json_response(reply)
+        logger.info("reply 前后缀清理成功")
+
+        try:
+            reply_json = loads(reply)
+            return return_template(state=200, message=reply_json)
+
+        except ValueError as err:
+            logger.info(f"JSON解析失败: reply: [{reply}] [error： {err}]")
+
+            return extract_fallback_json(reply)
+
+    except Exception as e:
+        log_api_error(e)
+
+        return return_template(state=500, message="服务请求不可用，请稍后再试")
+
+
+async def async_stream_message(message: str, on_delta: Callable[[str], Awaitable[None]], join: bool = True,
+                               clean_data: bool = True) -> dict:
+    """
+    以流式方式调用模型，每收到一段回复内容就调用一次 on_delta，结束后按 async_send_message 的格式返回完整结果。
+    流式调用不做轮询重试。
+
+    :param message: 用户消息
+    :param on_delta: 接收增量文本的异步回调
+    :param join: 是否拼接prompt
+    :param clean_data: 是否清理并解析JSON
+    :return: dict(state: int, message: str or dict)
+    """
+
+    content = create_prompt(message) if join else message
+    chunks = []
+
+    try:
+        if pattern == "cloud":
+            client = get_openai_client(model_name)
+            stream = await client.chat.completions.create(
+                model=user_config.get_nested(model_name, "MODEL", default="deepseek-reasoner"),
+                messages=[{"role": "user", "content": content}],
+                max_tokens=user_config.get_nested(model_name, "MAX_TOKEN", default=2000),
+                stream=True
+            )
+
+            async for chunk in stream:
+                delta = chunk.choices[0].delta.content if chunk.choices else None
+                if delta:
+                    chunks.append(delta)
+                    await on_delta(delta)
+
+        elif pattern == "local":
+            client = get_ollama_client()
+            async for chunk in await client.chat(model=model_name, messages=[{"role": "user", "content": content}], stream=True):
+                delta = chunk['message']['content']
+                if delta:
+                    chunks.append(delta)
+                    await on_delta(delta)
 
         else:
-            logger.error("错误：" + str(e))
+            return return_template(state=500, message="配置文件错误，请假查配置选项")
+
+    except Exception as e:
+        log_api_error(e)
 
         return return_template(state=500, message="服务请求不可用，请稍后再试")
 
+    reply = "".join(chunks).strip()
+    if not reply:
+        logger.info("API 返回内容为空")
+        return return_template(state=False, message="服务请求不可用，请稍后再试")
+
+    if not clean_data:
+        return return_template(200, reply)
+
+    reply = clean_json_response(reply)
+    try:
+        return return_template(state=200, message=loads(reply))
+
+    except ValueError as err:
+        logger.info(f"JSON解析失败: reply: [{reply}] [error： {err}]")
+
+        return extract_fallback_json(reply)
+
 
 def get_deepseek_response(client, model_name, message: str) -> Dict:
     """
@@ -7,7 +7,114 @@
 # @desc : README.md
 
 import os
-from tree_sitter import Language, Parser
+import sys
+import threading
+from hashlib import sha256
+from typing import Dict, Iterator, List, Optional, Tuple, Union
+from tree_sitter import Language, Node, Parser, Tree
+
+from backend.core.logger import Config, setup_logger
+
+# 加载配置和安装记录器
+config = Config("./config.yaml")
+logger = setup_logger(config)
+
+# 语法仓库目录，每个语言一个 tree-sitter-xxx 子目录
+VENDOR_DIR = "./backend/core/vendor"
+# 编译产物与对应的源码哈希
+LIBRARY_PATH = "./backend/core/build/my-languages.so"
+LIBRARY_HASH_PATH = LIBRARY_PATH + ".sha256"
+VENDOR_PREFIX = "tree-sitter-"
+
+# 每个线程各自持有的 {语言名称: Parser}，Parser 不能在线程间共享
+_parsers = threading.local()
+_code_tree: Optional["CodeTree"] = None
+
+
+def vendor_languages(vendor_dir: str = VENDOR_DIR) -> List[str]:
+    """
+    列出已下载的语法仓库对应的语言名称，tree-sitter-c-sharp -> c_sharp
+
+    :param vendor_dir: 语法仓库目录
+    :return: 语言名称列表，目录不存在时返回空列表
+    """
+
+    if not os.path.isdir(vendor_dir):
+        return []
+
+    return sorted(
+        item[len(VENDOR_PREFIX):].replace("-", "_")
+        for item in os.listdir(vendor_dir)
+        if item.startswith(VENDOR_PREFIX) and os.path.isdir(os.path.join(vendor_dir, item, "src"))
+    )
+
+
+def grammar_source_paths(language: str, vendor_dir: str = VENDOR_DIR) -> List[str]:
+    """与 Language.build_library 一致，返回参与编译的源文件"""
+
+    src = os.path.join(vendor_dir, VENDOR_PREFIX + language.replace("_", "-"), "src")
+    paths = [os.path.join(src, "parser.c")]
+    for scanner in ("scanner.cc", "scanner.c"):
+        if os.path.exists(os.path.join(src, scanner)):
+            paths.append(os.path.join(src, scanner))
+            break
+
+    return paths
+
+
+def grammar_hash(languages: List[str], vendor_dir: str = VENDOR_DIR) -> str:
+    """
+    计算语法源码的内容哈希，语言列表或任一源文件变化时哈希随之变化
+
+    :param languages: 语言名称列表
+    :param vendor_dir: 语法仓库目录
+    :return: 十六进制哈希
+    """
+
+    digest = sha256(f"{sys.platform}\n".encode("utf-8"))
+    for language in languages:
+        digest.update(f"{language}\n".encode("utf-8"))
+        for source in grammar_source_paths(language, vendor_dir):
+            digest.update(os.path.basename(source).encode("utf-8"))
+            with open(source, "rb") as file:
+                for chunk in iter(lambda: file.read(1 << 20), b""):
+                    digest.update(chunk)
+
+    return digest.hexdigest()
+
+
+def build_language_library(force: bool = False) -> bool:
+    """
+    编译语言库，源码哈希与上次编译一致时跳过，可在部署时提前执行：
+        python -m backend.core.parser build
+
+    :param force: 忽略哈希强制重新编译
+    :return: 是否执行了编译
+    """
+
+    languages = vendor_languages()
+    if not languages:
+        logger.warning(f"未找到语法仓库，请按 README 将 tree-sitter 语言下载到 {VENDOR_DIR}")
+        return False
+
+    current = grammar_hash(languages)
+    if not force and os.path.exists(LIBRARY_PATH) and os.path.exists(LIBRARY_HASH_PATH):
+        with open(LIBRARY_HASH_PATH, "r", encoding="utf-8") as file:
+            if file.read().strip() == current:
+                return False
+
+    # build_library 按修改时间判断是否需要编译，删除旧文件保证按哈希结果重新编译
+    os.makedirs(os.path.dirname(LIBRARY_PATH), exist_ok=True)
+    if os.path.exists(LIBRARY_PATH):
+        os.remove(LIBRARY_PATH)
+
+    logger.info(f"编译语言库: {', '.join(languages)}")
+    Language.build_library(LIBRARY_PATH, [os.path.join(VENDOR_DIR, VENDOR_PREFIX + item.replace("_", "-")) for item in languages])
+
+    with open(LIBRARY_HASH_PATH, "w", encoding="utf-8") as file:
+        file.write(current)
+
+    return True
 
 
 class CodeTree:
@@ -21,66 +128,173 @@ class CodeTree:
     #     "javascript": ("javascript", "javascript")
     # }
 
-    _LANGUAGES = [i.lstrip('tree-sitter-').replace("-", "_") for i in os.listdir("./backend/core/vendor")]
+    _LANGUAGES: List[str] = []
+    name_mapping_table: Dict[str, Language] = {}
+    _load_lock = threading.Lock()
 
     def __init__(self):
         if not CodeTree._BUILT:
-            self.build_language_library()
-            # 初始化类属性
-            for item in CodeTree._LANGUAGES:
-                setattr(CodeTree, f"{item}_LANGUAGE",
-                        Language('./backend/core/build/my-languages.so', item))
-
-            # 构建统一的映射表
-            CodeTree.name_mapping_table = {
-                item: getattr(CodeTree, f"{item}_LANGUAGE")
-                for item in CodeTree._LANGUAGES
-            }
-
-            CodeTree._BUILT = True
+            CodeTree.load_languages()
 
         # 实例属性引用类属性
         self.name_mapping_table = CodeTree.name_mapping_table
         for item in CodeTree._LANGUAGES:
             setattr(self, f"{item}_LANGUAGE", getattr(CodeTree, f"{item}_LANGUAGE"))
 
+    @classmethod
+    def load_languages(cls) -> Dict[str, Language]:
+        """
+        加载语言库并注册全部语言，进程内只执行一次；语言库缺失或源码变化时先编译
+
+        :return: {语言名称: Language}
+        """
+
+        with cls._load_lock:
+            if cls._BUILT:
+                return cls.name_mapping_table
+
+            languages = vendor_languages()
+            try:
+                build_language_library()
+
+            except Exception as err:
+                logger.error(f"编译语言库失败: {err}")
+
+            table = {}
+            if os.path.exists(LIBRARY_PATH):
+                for item in languages:
+                    try:
+                        table[item] = Language(LIBRARY_PATH, item)
+
+                    except Exception as err:
+                        logger.error(f"加载语言 {item} 失败: {err}")
+
+            # 初始化类属性
+            for item, language in table.items():
+                setattr(cls, f"{item}_LANGUAGE", language)
+
+            # 构建统一的映射表
+            cls._LANGUAGES = list(table)
+            cls.name_mapping_table = table
+            cls._BUILT = True
+            logger.info(f"已加载语言: {', '.join(table) or '无'}")
+
+            return table
 
-    def build_language_library(self):
+    def build_language_library(self, force: bool = False) -> bool:
         """
         构建语言库， 动态生成语言映射表
         :return:
         """
 
-        Language.build_library(
-            './backend/core/build/my-languages.so',
-            [
-                f'./backend/core/vendor/tree-sitter-{item.replace("_", "-")}' for item in CodeTree._LANGUAGES
-            ]
-        )
+        return build_language_library(force)
+
+    @classmethod
+    def get_parser(cls, language: str) -> Parser:
+        """
+        获取当前线程中指定语言的 Parser，首次使用时创建并设置语言，之后复用
+
+        :param language: 语言名称
+        :return: Parser
+        """
+
+        pool = getattr(_parsers, "pool", None)
+        if pool is None:
+            pool = _parsers.pool = {}
+
+        parser = pool.get(language)
+        if parser is None:
+            if not cls._BUILT:
+                cls.load_languages()
+
+            if language not in cls.name_mapping_table:
+                raise ValueError(f"Unsupported language: {language}")
+
+            parser = pool[language] = Parser()
+            parser.set_language(cls.name_mapping_table[language])
+
+        return parser
+
+    @classmethod
+    def parse(cls, language: str, source: Union[str, bytes]) -> Tree:
+        """
+        使用当前线程复用的 Parser 解析源代码
+
+        :param language: 语言名称
+        :param source: 源代码，str 按 utf-8 编码
+        :return: 语法树
+        """
+
+        if isinstance(source, str):
+            source = source.encode("utf-8")
+
+        return cls.get_parser(language).parse(source)
 
-    def processing_coed(self, code_type: str, code: str):
+    def processing_coed(self, code_type: str, code: str, offsets_only: bool = False):
+        """
+        解析源代码并提取非注释token
+
+        :param code_type: 语言名称
+        :param code: 源代码
+        :param offsets_only: 只返回 (起始字节, 结束字节)，不生成token文本
+        :return: token文本列表或字节偏移列表
+        """
 
         if code_type not in self.name_mapping_table:
             raise ValueError(f"Unsupported language: {code_type}")
 
-        # 获取对应的语言逻辑方法
-        language = self.name_mapping_table[code_type]
-        # 初始化
-        code_parse = Parser()
-        # 指定方法类型
-        code_parse.set_language(language)
-        # 填入需要分析的源代码，按照utf-8编码转为字节码
-        tree = code_parse.parse(bytes(code, "utf-8"))
-
-        # 获取根节点
-        # root_node = tree.root_node
-        # 定位代码token
-        tokens_index = self.tree_to_token_index(tree.root_node)
-
-        # 获取对应代码划分
-        code_loc = code.split("\n")
-        # code_tokens = [self.index_to_code_token(x, code_loc) for x in tokens_index]
-        return [self.index_to_code_token(x, code_loc) for x in tokens_index]
+        # 按照utf-8编码转为字节码后解析，token直接从同一份字节中切取
+        source = code.encode("utf-8")
+        tree = self.parse(code_type, source)
+
+        return list(self.iter_tokens(tree.root_node, source, offsets_only))
+
+    @staticmethod
+    def iter_token_nodes(root_node) -> Iterator[Node]:
+        """
+        使用 TreeCursor 迭代遍历语法树，按源码顺序产出token节点：
+        跳过注释节点及其子树，叶子节点和字符串节点作为一个token。
+        不使用递归，深层嵌套的代码不会超出递归深度限制
+
+        :param root_node: 起始节点
+        :return: 节点生成器
+        """
+
+        cursor = root_node.walk()
+        while True:
+            node = cursor.node
+            node_type = node.type
+            if 'comment' not in node_type:
+                # 字符串整体作为一个token，不再进入子节点
+                if 'string' in node_type or not cursor.goto_first_child():
+                    yield node
+
+                else:
+                    continue
+
+            # 当前子树处理完毕，移动到下一个兄弟节点，没有则回到父节点继续
+            while not cursor.goto_next_sibling():
+                if not cursor.goto_parent():
+                    return
+
+    def iter_tokens(self, root_node, source: bytes, offsets_only: bool = False) -> Iterator[Union[str, Tuple[int, int]]]:
+        """
+        按字节偏移从源码中逐个产出token
+
+        :param root_node: 起始节点
+        :param source: 解析时使用的utf-8字节
+        :param offsets_only: 只产出 (起始字节, 结束字节)
+        :return: token文本或字节偏移的生成器
+        """
+
+        view = memoryview(source)
+        for node in self.iter_token_nodes(root_node):
+            start, end = node.start_byte, node.end_byte
+            if offsets_only:
+                yield start, end
+
+            else:
+                yield str(view[start:end], "utf-8", "replace")
 
     def tree_to_token_index(self, root_node) -> [((int, int), (int, int))]:
         """
@@ -89,16 +303,7 @@ class CodeTree:
         :return list[tuple[tuple[int,int], tuple[int, int]]]
         """
 
-        if 'comment' in root_node.type:
-            return []
-
-        if not root_node.children or 'string' in root_node.type:
-            return [(root_node.start_point, root_node.end_point)]
-
-        tokens = []
-        for child in root_node.children:
-            tokens.extend(self.tree_to_token_index(child))
-        return tokens
+        return [(node.start_point, node.end_point) for node in self.iter_token_nodes(root_node)]
 
     def index_to_code_token(self, index, code_lines):
         """
@@ -123,7 +328,29 @@ class CodeTree:
         return "\n".join(lines)
 
 
+def get_code_tree() -> CodeTree:
+    """获取进程内共享的 CodeTree，避免每个请求重新创建"""
+
+    global _code_tree
+    if _code_tree is None:
+        _code_tree = CodeTree()
+
+    return _code_tree
+
+
+def load_languages() -> None:
+    """服务启动时加载语言库，避免首个请求承担编译和加载耗时"""
+
+    CodeTree.load_languages()
+
+
 if __name__ == '__main__':
+    # python -m backend.core.parser build [--force] 只编译语言库
+    if len(sys.argv) > 1 and sys.argv[1] == "build":
+        built = build_language_library(force="--force" in sys.argv)
+        print(f"语言库{'已编译' if built else '无需编译'}: {LIBRARY_PATH}")
+        sys.exit(0)
+
     demo = CodeTree()
     code = """
 def fun():
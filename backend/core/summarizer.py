@@ -0,0 +1,200 @@
+#!/usr/bin/env python
+# _*_ coding: utf-8 _*_
+# @Time : 2026/10/18 下午7:40
+# @Author : Huzhaojun
+# @Version：V 1.0
+# @File : summarizer.py
+# @desc : 函数概括：多个函数合并到一次模型调用中，按函数体哈希缓存，批次之间有界并发
+
+import asyncio
+import re
+from hashlib import sha256
+from json import JSONDecodeError, loads
+from typing import Dict, List, Optional, Tuple
+
+from backend.core.logger import Config, setup_logger
+from backend.core.model import async_send_message, clean_json_response, model_identity
+from backend.database.review_cache import get_cached_summaries, save_cached_summaries
+
+# 加载配置和安装记录器
+config = Config("./config.yaml")
+logger = setup_logger(config)
+
+# 每次模型调用最多包含的函数数与代码字符数
+BATCH_SIZE = max(1, int(config.get_nested("mindmap_set", "SUMMARY_BATCH_SIZE", default=20)))
+BATCH_CHARS = max(1000, int(config.get_nested("mindmap_set", "SUMMARY_BATCH_CHARS", default=12000)))
+# 同时进行的模型调用数
+CONCURRENCY = max(1, int(config.get_nested("mindmap_set", "SUMMARY_CONCURRENCY", default=4)))
+# 单个函数超过该字符数时截断后再发送
+MAX_FUNCTION_CHARS = BATCH_CHARS
+
+# 概括提示词版本，修改提示词后需要递增，使旧的概括缓存失效
+SUMMARY_PROMPT_VERSION = "1"
+
+# 全进程共享的概括调用信号量，延迟到事件循环中创建，避免绑定到错误的循环
+_semaphore: Optional[asyncio.Semaphore] = None
+
+
+def get_summary_semaphore() -> asyncio.Semaphore:
+    """获取所有思维导图请求和节点详情请求共享的概括调用信号量"""
+
+    global _semaphore
+    if _semaphore is None:
+        _semaphore = asyncio.Semaphore(CONCURRENCY)
+
+    return _semaphore
+
+
+def summary_key(code: str, model: str) -> str:
+    """按提示词版本、模型和函数体计算概括缓存键"""
+
+    digest = sha256()
+    for part in (SUMMARY_PROMPT_VERSION, model, code):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+
+    return digest.hexdigest()
+
+
+def create_batch_prompt(functions: List[Tuple[str, str]]) -> str:
+    """
+    合成批量概括的提示词
+
+    :param functions: [(编号, 函数代码)]
+    :return: 提示词
+    """
+
+    parts = ["请简要描述下列每个函数的作用，每个80字以内。",
+             "必须返回一个严格的JSON对象，键为函数编号，值为描述字符串，不包含代码块标记或其他文本，例如 {\"f1\": \"...\", \"f2\": \"...\"}。"]
+    for number, code in functions:
+        parts.append(f"### {number}\n{code[:MAX_FUNCTION_CHARS]}")
+
+    return "\n\n".join(parts)
+
+
+def parse_batch_reply(reply: str) -> Dict[str, str]:
+    """解析批量概括的回复，回复中夹杂其他文本时提取其中的JSON对象"""
+
+    reply = clean_json_response(reply.strip())
+    try:
+        data = loads(reply)
+
+    except JSONDecodeError:
+        match = re.search(r"\{.*\}", reply, re.DOTALL)
+        if not match:
+            return {}
+
+        try:
+            data = loads(match.group(0))
+
+        except JSONDecodeError:
+            return {}
+
+    if not isinstance(data, dict):
+        return {}
+
+    return {str(key): str(value).strip() for key, value in data.items() if value}
+
+
+async def summarize_function(content: str) -> Optional[str]:
+    """
+    简单概括单个函数的作用
+
+    :param content: 函数内容
+    :return: 概括，模型调用失败时返回None
+    """
+
+    reply = await async_send_message(message=f"请简要描述函数作用，80字以内：{content[:MAX_FUNCTION_CHARS]}", join=False, clean_data=False)
+    if reply and reply.get("state") == 200 and reply.get("message"):
+        return str(reply["message"]).strip()
+
+    logger.info(f"函数概括失败: {reply}")
+    return None
+
+
+def make_batches(codes: List[str]) -> List[List[int]]:
+    """按函数数量和代码字符数将函数分组"""
+
+    batches: List[List[int]] = []
+    current: List[int] = []
+    size = 0
+    for index, code in enumerate(codes):
+        length = min(len(code), MAX_FUNCTION_CHARS)
+        if current and (len(current) >= BATCH_SIZE or size + length > BATCH_CHARS):
+            batches.append(current)
+            current, size = [], 0
+
+        current.append(index)
+        size += length
+
+    if current:
+        batches.append(current)
+
+    return batches
+
+
+async def summarize_functions(functions: List[Tuple[str, str]]) -> Dict[str, str]:
+    """
+    批量概括函数：函数体相同的只概括一次，已缓存的不再调用模型，
+    其余按批合并为一次模型调用，批量回复缺少的函数再单独概括
+
+    :param functions: [(节点id, 函数代码)]
+    :return: {节点id: 概括}，模型调用失败的函数为空字符串
+    """
+
+    if not functions:
+        return {}
+
+    model = model_identity()
+    semaphore = get_summary_semaphore()
+    loop = asyncio.get_running_loop()
+
+    # 缓存键 -> 函数代码，相同函数体只处理一次
+    codes: Dict[str, str] = {}
+    keys: Dict[str, str] = {}
+    for node_id, code in functions:
+        key = keys[node_id] = summary_key(code, model)
+        codes.setdefault(key, code)
+
+    # 缓存读写为阻塞的SQLite操作，放到线程中执行
+    summaries = await loop.run_in_executor(None, get_cached_summaries, list(codes))
+    pending = [key for key in codes if key not in summaries]
+    logger.info(f"函数概括: {len(functions)} 个函数, {len(codes)} 个不同函数体, 缓存命中 {len(summaries)}")
+
+    async def run_batch(batch: List[str]) -> Dict[str, str]:
+        numbered = {f"f{number}": key for number, key in enumerate(batch, start=1)}
+        result: Dict[str, str] = {}
+        # 批量调用本身失败时（服务不可用）不再逐个重试
+        retry_missing = len(batch) == 1
+
+        if len(batch) > 1:
+            async with semaphore:
+                reply = await async_send_message(create_batch_prompt([(number, codes[key]) for number, key in numbered.items()]),
+                                                 join=False, clean_data=False)
+
+            if reply and reply.get("state") == 200 and isinstance(reply.get("message"), str):
+                retry_missing = True
+                for number, summary in parse_batch_reply(reply["message"]).items():
+                    if number in numbered:
+                        result[numbered[number]] = summary
+
+        # 单个函数或批量回复中缺少的函数单独概括
+        for key in batch:
+            if retry_missing and key not in result:
+                async with semaphore:
+                    summary = await summarize_function(codes[key])
+
+                if summary:
+                    result[key] = summary
+
+        return result
+
+    key_batches = [[pending[index] for index in batch] for batch in make_batches([codes[key] for key in pending])]
+    generated: Dict[str, str] = {}
+    for result in await asyncio.gather(*(run_batch(batch) for batch in key_batches)):
+        generated.update(result)
+
+    await loop.run_in_executor(None, save_cached_summaries, model, generated)
+    summaries.update(generated)
+
+    return {node_id: summaries.get(key, "") for node_id, key in keys.items()}
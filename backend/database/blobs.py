@@ -0,0 +1,152 @@
+#!/usr/bin/env python
+# _*_ coding: utf-8 _*_
+# @Time : 2026/10/18 下午3:40
+# @Author : Huzhaojun
+# @Version：V 1.0
+# @File : blobs.py
+# @desc : 内容寻址的压缩存储，代码、优化代码、复杂度和思维导图按内容哈希去重后压缩保存
+
+import sqlite3
+import zlib
+from hashlib import sha256
+from json import dumps
+from typing import Dict, List, Optional, Tuple
+
+from backend.core.logger import Config, setup_logger
+
+# 加载配置和安装记录器
+config = Config("./config.yaml")
+logger = setup_logger(config)
+
+# 压缩算法 zstd zlib，zstd 依赖 zstandard 库，未安装时回退 zlib
+COMPRESSION = str(config.get_nested("database_set", "COMPRESSION", default="zstd")).lower()
+# 小于该字节数的内容不压缩
+MIN_COMPRESS_SIZE = 64
+
+try:
+    import zstandard
+
+except ImportError:
+    zstandard = None
+    if COMPRESSION == "zstd":
+        logger.info("未安装 zstandard，内容压缩使用 zlib (pip install zstandard 以启用 zstd)")
+        COMPRESSION = "zlib"
+
+
+def create_blob_table(conn: sqlite3.Connection) -> None:
+    """创建内容存储表"""
+
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS blobs (
+            hash TEXT PRIMARY KEY,
+            codec TEXT NOT NULL,
+            size INTEGER,
+            data BLOB NOT NULL
+        )
+    """)
+
+
+def compress(data: bytes) -> Tuple[str, bytes]:
+    """
+    压缩内容
+
+    :param data: 原始内容
+    :return: (压缩算法, 压缩后内容)
+    """
+
+    if len(data) < MIN_COMPRESS_SIZE:
+        return "raw", data
+
+    if COMPRESSION == "zstd":
+        return "zstd", zstandard.ZstdCompressor(level=3).compress(data)
+
+    return "zlib", zlib.compress(data, 6)
+
+
+def decompress(codec: str, data: bytes) -> bytes:
+    """按压缩算法还原内容"""
+
+    if codec == "raw":
+        return data
+
+    if codec == "zlib":
+        return zlib.decompress(data)
+
+    if codec == "zstd":
+        if zstandard is None:
+            raise RuntimeError("读取 zstd 压缩内容需要安装 zstandard")
+
+        return zstandard.ZstdDecompressor().decompress(data)
+
+    raise ValueError(f"未知的压缩算法: {codec}")
+
+
+def put_blob(conn: sqlite3.Connection, text: Optional[str]) -> Optional[str]:
+    """
+    保存文本内容，相同内容只保存一次
+
+    :param conn: 数据库连接（由调用方提交事务）
+    :param text: 文本内容，None 表示没有内容
+    :return: 内容哈希，text 为 None 时返回None
+    """
+
+    return put_blobs(conn, [text])[0]
+
+
+def put_blobs(conn: sqlite3.Connection, texts: List[Optional[str]]) -> List[Optional[str]]:
+    """
+    批量保存文本内容：一次查询已存在的哈希，只压缩并写入新内容
+
+    :param conn: 数据库连接（由调用方提交事务）
+    :param texts: 文本内容列表，None 表示没有内容
+    :return: 与 texts 一一对应的内容哈希
+    """
+
+    hashes: List[Optional[str]] = []
+    pending: Dict[str, bytes] = {}
+
+    for text in texts:
+        if text is None:
+            hashes.append(None)
+            continue
+
+        data = text.encode("utf-8")
+        digest = sha256(data).hexdigest()
+        hashes.append(digest)
+        pending[digest] = data
+
+    if not pending:
+        return hashes
+
+    # 已存在的内容跳过压缩
+    existing = {row[0] for row in conn.execute("SELECT hash FROM blobs WHERE hash IN (SELECT value FROM json_each(?))",
+                                               (dumps(list(pending)),))}
+    rows = []
+    for digest, data in pending.items():
+        if digest not in existing:
+            codec, payload = compress(data)
+            rows.append((digest, codec, len(data), payload))
+
+    conn.executemany("INSERT OR IGNORE INTO blobs (hash, codec, size, data) VALUES (?, ?, ?, ?)", rows)
+    return hashes
+
+
+def unblob(codec: Optional[str], data: Optional[bytes]) -> Optional[str]:
+    """
+    还原文本内容，注册为SQL函数 unblob(codec, data) 供查询使用
+
+    :param codec: 压缩算法
+    :param data: 压缩后内容
+    :return: 文本内容
+    """
+
+    if codec is None or data is None:
+        return None
+
+    return decompress(codec, data).decode("utf-8")
+
+
+def register_functions(conn: sqlite3.Connection) -> None:
+    """在连接上注册 unblob 函数"""
+
+    conn.create_function("unblob", 2, unblob, deterministic=True)
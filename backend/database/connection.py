@@ -0,0 +1,158 @@
+#!/usr/bin/env python
+# _*_ coding: utf-8 _*_
+# @Time : 2026/10/18 下午2:10
+# @Author : Huzhaojun
+# @Version：V 1.0
+# @File : connection.py
+# @desc : SQLite连接管理，每个数据库只初始化一次表结构，每个线程复用各自的连接
+
+import sqlite3
+import threading
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional
+
+from backend.core.logger import Config, setup_logger
+
+# 加载配置和安装记录器
+config = Config("./config.yaml")
+logger = setup_logger(config)
+
+# 连接参数
+WAL = str(config.get_nested("database_set", "WAL", default="True")).lower() == "true"
+SYNCHRONOUS = str(config.get_nested("database_set", "SYNCHRONOUS", default="NORMAL")).upper()
+BUSY_TIMEOUT = int(config.get_nested("database_set", "BUSY_TIMEOUT", default=5000))
+
+# 数据库路径 -> 表结构初始化函数
+_schemas: Dict[str, Callable[[sqlite3.Connection], None]] = {}
+# 数据库路径 -> 新建连接时执行的函数（注册SQL函数等）
+_hooks: Dict[str, Callable[[sqlite3.Connection], None]] = {}
+_initialized = set()
+# 所有线程创建的连接，服务退出时统一关闭
+_connections: List[sqlite3.Connection] = []
+# 关闭全部连接后递增，各线程据此丢弃已关闭的连接
+_generation = 0
+_lock = threading.Lock()
+_local = threading.local()
+
+
+def register_schema(path: str, init: Callable[[sqlite3.Connection], None],
+                    on_connect: Optional[Callable[[sqlite3.Connection], None]] = None) -> None:
+    """
+    注册数据库的表结构初始化函数，首次获取该数据库的连接时执行
+
+    :param path: 数据库路径
+    :param init: 接收连接并创建表、索引的函数
+    :param on_connect: 每个新连接创建后执行的函数
+    :return: None
+    """
+
+    _schemas[path] = init
+    if on_connect:
+        _hooks[path] = on_connect
+
+
+def _open(path: str) -> sqlite3.Connection:
+    """创建连接并设置 WAL、同步级别和忙等待时间"""
+
+    # 连接只在创建它的线程中使用，关闭时可能来自其他线程
+    conn = sqlite3.connect(path, timeout=BUSY_TIMEOUT / 1000, check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    conn.execute(f"PRAGMA busy_timeout={BUSY_TIMEOUT}")
+    if WAL:
+        conn.execute("PRAGMA journal_mode=WAL")
+
+    conn.execute(f"PRAGMA synchronous={SYNCHRONOUS}")
+    conn.execute("PRAGMA foreign_keys=ON")
+
+    hook = _hooks.get(path)
+    if hook:
+        hook(conn)
+
+    return conn
+
+
+def init_database(path: Optional[str] = None) -> None:
+    """
+    初始化数据库表结构，每个数据库在进程内只执行一次
+
+    :param path: 数据库路径，默认初始化所有已注册的数据库
+    :return: None
+    """
+
+    for db_path in ([path] if path else list(_schemas)):
+        with _lock:
+            if db_path in _initialized:
+                continue
+
+            conn = _open(db_path)
+            try:
+                init = _schemas.get(db_path)
+                if init:
+                    init(conn)
+                    conn.commit()
+
+                _initialized.add(db_path)
+                logger.info(f"数据库初始化完成: {db_path}")
+
+            finally:
+                conn.close()
+
+
+def get_connection(path: str) -> sqlite3.Connection:
+    """
+    获取当前线程的数据库连接，同一线程内复用
+
+    :param path: 数据库路径
+    :return: 数据库连接（row_factory 为 sqlite3.Row）
+    """
+
+    connections = getattr(_local, "connections", None)
+    if connections is None or getattr(_local, "generation", None) != _generation:
+        connections = _local.connections = {}
+        _local.generation = _generation
+
+    conn = connections.get(path)
+    if conn is None:
+        init_database(path)
+        conn = connections[path] = _open(path)
+        with _lock:
+            _connections.append(conn)
+
+    return conn
+
+
+@contextmanager
+def transaction(path: str) -> Iterator[sqlite3.Connection]:
+    """
+    在当前线程的连接上执行事务，正常退出时提交，异常时回滚
+
+    :param path: 数据库路径
+    :return: 数据库连接
+    """
+
+    conn = get_connection(path)
+    try:
+        yield conn
+        conn.commit()
+
+    except BaseException:
+        conn.rollback()
+        raise
+
+
+def close_connections() -> None:
+    """关闭所有线程创建的连接，在服务退出时调用"""
+
+    global _generation
+
+    with _lock:
+        connections = list(_connections)
+        _connections.clear()
+        _generation += 1
+
+    for conn in connections:
+        try:
+            conn.close()
+
+        except Exception as err:
+            logger.info(f"关闭数据库连接失败 {err}")
@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+# _*_ coding: utf-8 _*_
+# @Time : 2026/10/18 下午3:05
+# @Author : Huzhaojun
+# @Version：V 1.0
+# @File : maintenance.py
+# @desc : 数据库定期维护：按保留天数清理历史记录和已结束的审查任务、淘汰审查缓存，并在空闲页较多时执行 VACUUM
+
+import asyncio
+from datetime import datetime, timedelta
+from typing import Optional
+
+from backend.core.logger import Config, setup_logger
+from backend.database.connection import get_connection
+from backend.database.sqlite_db import DB_PATH, delete_reviews, prune_jobs, prune_orphans
+from backend.database.review_cache import CACHE_DB_PATH, prune_cache
+
+# 加载配置和安装记录器
+config = Config("./config.yaml")
+logger = setup_logger(config)
+
+# 历史记录保留天数，0 表示不清理
+RETENTION_DAYS = float(config.get_nested("database_set", "RETENTION_DAYS", default=0))
+# 已结束的后台审查任务保留天数，0 表示不清理
+JOB_RETENTION_DAYS = float(config.get_nested("job_set", "RETENTION_DAYS", default=7))
+# 维护间隔（小时），0 表示不执行
+MAINTENANCE_INTERVAL_HOURS = float(config.get_nested("database_set", "MAINTENANCE_INTERVAL_HOURS", default=24))
+# 空闲页占比超过该值时执行 VACUUM
+VACUUM_FREE_RATIO = 0.2
+
+_task: Optional[asyncio.Task] = None
+
+
+def vacuum_if_needed(path: str) -> bool:
+    """
+    空闲页占比超过阈值时执行 VACUUM 回收空间，并截断WAL文件
+
+    :param path: 数据库路径
+    :return: 是否执行了 VACUUM
+    """
+
+    conn = get_connection(path)
+    page_count = conn.execute("PRAGMA page_count").fetchone()[0]
+    freelist = conn.execute("PRAGMA freelist_count").fetchone()[0]
+
+    vacuumed = False
+    if page_count and freelist / page_count > VACUUM_FREE_RATIO:
+        conn.execute("VACUUM")
+        vacuumed = True
+        logger.info(f"数据库 VACUUM 完成: {path} (空闲页 {freelist}/{page_count})")
+
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    conn.execute("PRAGMA optimize")
+    return vacuumed
+
+
+def run_maintenance() -> dict:
+    """
+    执行一次维护
+
+    :return: {"reviews_removed": 清理的历史记录数, "jobs_removed": 清理的任务数, "orphans_removed": 清理的无引用运行和内容数,
+              "cache_removed": 淘汰的缓存数, "vacuumed": [执行了VACUUM的数据库]}
+    """
+
+    report = {"reviews_removed": 0, "jobs_removed": 0, "orphans_removed": {}, "cache_removed": 0, "vacuumed": []}
+
+    if RETENTION_DAYS > 0:
+        before = (datetime.now() - timedelta(days=RETENTION_DAYS)).isoformat()
+        report["reviews_removed"] = delete_reviews(before=before)
+
+    if JOB_RETENTION_DAYS > 0:
+        report["jobs_removed"] = prune_jobs((datetime.now() - timedelta(days=JOB_RETENTION_DAYS)).isoformat())
+
+    report["orphans_removed"] = prune_orphans()
+    report["cache_removed"] = prune_cache()
+
+    for path in (DB_PATH, CACHE_DB_PATH):
+        try:
+            if vacuum_if_needed(path):
+                report["vacuumed"].append(path)
+
+        except Exception as err:
+            logger.info(f"数据库维护失败 {path}: {err}")
+
+    logger.info(f"数据库维护完成: {report}")
+    return report
+
+
+async def _maintenance_loop():
+    loop = asyncio.get_running_loop()
+
+    while True:
+        try:
+            await loop.run_in_executor(None, run_maintenance)
+
+        except asyncio.CancelledError:
+            raise
+
+        except Exception as err:
+            logger.error(f"数据库维护异常: {err}")
+
+        await asyncio.sleep(MAINTENANCE_INTERVAL_HOURS * 3600)
+
+
+async def start_maintenance():
+    """启动定期维护任务，启动后立即执行一次"""
+
+    global _task
+
+    if MAINTENANCE_INTERVAL_HOURS > 0:
+        _task = asyncio.ensure_future(_maintenance_loop())
+
+
+async def stop_maintenance():
+    """停止定期维护任务"""
+
+    global _task
+
+    if _task:
+        _task.cancel()
+        await asyncio.gather(_task, return_exceptions=True)
+        _task = None
@@ -0,0 +1,330 @@
+#!/usr/bin/env python
+# _*_ coding: utf-8 _*_
+# @Time : 2026/10/18 上午11:05
+# @Author : Huzhaojun
+# @Version：V 1.0
+# @File : review_cache.py
+# @desc : 模型审查结果缓存，以代码内容、语言、提示词版本和模型名称的哈希作为键；同时保存解析与复杂度分析结果和函数概括
+
+import sqlite3
+import time
+from hashlib import sha256
+from json import dumps, loads
+from typing import Any, Dict, List, Optional, Tuple
+from backend.core.logger import Config, setup_logger
+from backend.database.connection import get_connection, register_schema
+
+
+config = Config("./config.yaml")
+logger = setup_logger(config)
+CACHE_DB_PATH = "./backend/database/review_cache.db"
+
+# 缓存配置
+CACHE_ENABLED = str(config.get_nested("cache_set", "ENABLED", default="True")).lower() == "true"
+MAX_ENTRIES = int(config.get_nested("cache_set", "MAX_ENTRIES", default=10000))
+MAX_AGE_DAYS = float(config.get_nested("cache_set", "MAX_AGE_DAYS", default=30))
+# 每写入多少条记录执行一次淘汰
+PRUNE_INTERVAL = 100
+
+_writes = 0
+
+
+def cache_key(code: str, language: str, prompt_version: str, model: str) -> str:
+    """
+    计算缓存键
+
+    :param code: 源代码
+    :param language: 语言
+    :param prompt_version: 提示词版本
+    :param model: 模型标识
+    :return: sha256 十六进制字符串
+    """
+
+    digest = sha256()
+    for part in (prompt_version, model, language, code):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+
+    return digest.hexdigest()
+
+
+def init_schema(conn: sqlite3.Connection) -> None:
+    """创建缓存表，由连接管理器在首次连接时执行一次"""
+
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS review_cache (
+            key TEXT PRIMARY KEY,
+            model TEXT,
+            language TEXT,
+            reply TEXT,
+            created REAL,
+            accessed REAL
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS analysis_cache (
+            key TEXT PRIMARY KEY,
+            language TEXT,
+            offsets TEXT,
+            complexity TEXT,
+            created REAL,
+            accessed REAL
+        )
+    """)
+
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS summary_cache (
+            key TEXT PRIMARY KEY,
+            model TEXT,
+            summary TEXT,
+            created REAL,
+            accessed REAL
+        )
+    """)
+
+
+register_schema(CACHE_DB_PATH, init_schema)
+
+
+def get_cached_review(key: str) -> Optional[dict]:
+    """
+    读取缓存的模型回复，命中时刷新访问时间
+
+    :param key: cache_key 生成的缓存键
+    :return: 模型回复的message字段，未命中返回None
+    """
+
+    if not CACHE_ENABLED:
+        return None
+
+    conn = None
+
+    try:
+        conn = get_connection(CACHE_DB_PATH)
+        row = conn.execute("SELECT reply, created FROM review_cache WHERE key=?", (key,)).fetchone()
+        if not row:
+            return None
+
+        # 过期记录视为未命中，由淘汰流程清理
+        if MAX_AGE_DAYS > 0 and time.time() - row[1] > MAX_AGE_DAYS * 86400:
+            return None
+
+        conn.execute("UPDATE review_cache SET accessed=? WHERE key=?", (time.time(), key))
+        conn.commit()
+        return loads(row[0])
+
+    except Exception as err:
+        logger.info(f"读取审查缓存失败 {err}")
+        if conn:
+            conn.rollback()
+        return None
+
+
+def save_cached_review(key: str, model: str, language: str, reply: dict) -> None:
+    """
+    写入模型回复缓存
+
+    :param key: cache_key 生成的缓存键
+    :param model: 模型标识
+    :param language: 语言
+    :param reply: 模型回复的message字段
+    :return: None
+    """
+
+    global _writes
+
+    if not CACHE_ENABLED:
+        return
+
+    conn = None
+
+    try:
+        conn = get_connection(CACHE_DB_PATH)
+        now = time.time()
+        conn.execute("""
+            INSERT OR REPLACE INTO review_cache (key, model, language, reply, created, accessed)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, (key, model, language, dumps(reply, ensure_ascii=False), now, now))
+        conn.commit()
+
+        _writes += 1
+        if _writes % PRUNE_INTERVAL == 0:
+            prune_cache(conn)
+
+    except Exception as err:
+        logger.info(f"写入审查缓存失败 {err}")
+        if conn:
+            conn.rollback()
+
+
+def get_cached_analysis(key: str) -> Dict[str, Any]:
+    """
+    读取缓存的解析与复杂度分析结果，命中时刷新访问时间
+
+    :param key: 内容与语言的哈希
+    :return: 包含 offsets、complexity 中已缓存的部分，未命中返回空字典
+    """
+
+    conn = None
+
+    try:
+        conn = get_connection(CACHE_DB_PATH)
+        row = conn.execute("SELECT offsets, complexity FROM analysis_cache WHERE key=?", (key,)).fetchone()
+        if not row:
+            return {}
+
+        conn.execute("UPDATE analysis_cache SET accessed=? WHERE key=?", (time.time(), key))
+        conn.commit()
+
+        cached = {}
+        if row[0] is not None:
+            cached["offsets"] = [tuple(item) for item in loads(row[0])]
+
+        if row[1] is not None:
+            cached["complexity"] = loads(row[1])
+
+        return cached
+
+    except Exception as err:
+        logger.info(f"读取分析缓存失败 {err}")
+        if conn:
+            conn.rollback()
+        return {}
+
+
+def save_cached_analysis(key: str, language: str, offsets: Optional[List[Tuple[int, int]]] = None,
+                         complexity: Optional[dict] = None) -> None:
+    """
+    写入解析与复杂度分析结果，只更新提供的部分
+
+    :param key: 内容与语言的哈希
+    :param language: 语言
+    :param offsets: token字节偏移
+    :param complexity: 复杂度数据
+    :return: None
+    """
+
+    conn = None
+
+    try:
+        conn = get_connection(CACHE_DB_PATH)
+        now = time.time()
+        conn.execute("""
+            INSERT INTO analysis_cache (key, language, offsets, complexity, created, accessed)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT(key) DO UPDATE SET
+                offsets=COALESCE(excluded.offsets, offsets),
+                complexity=COALESCE(excluded.complexity, complexity),
+                accessed=excluded.accessed
+        """, (key, language,
+              None if offsets is None else dumps(offsets),
+              None if complexity is None else dumps(complexity, ensure_ascii=False),
+              now, now))
+        conn.commit()
+
+    except Exception as err:
+        logger.info(f"写入分析缓存失败 {err}")
+        if conn:
+            conn.rollback()
+
+
+def get_cached_summaries(keys: List[str]) -> Dict[str, str]:
+    """
+    批量读取函数概括缓存，命中时刷新访问时间
+
+    :param keys: 概括缓存键
+    :return: {缓存键: 概括}，只包含命中的记录
+    """
+
+    if not CACHE_ENABLED or not keys:
+        return {}
+
+    conn = None
+
+    try:
+        conn = get_connection(CACHE_DB_PATH)
+        rows = conn.execute("""
+            SELECT key, summary FROM summary_cache
+            WHERE key IN (SELECT value FROM json_each(?)) AND created >= ?
+        """, (dumps(keys), time.time() - MAX_AGE_DAYS * 86400 if MAX_AGE_DAYS > 0 else 0)).fetchall()
+
+        found = {row[0]: row[1] for row in rows}
+        if found:
+            conn.execute("UPDATE summary_cache SET accessed=? WHERE key IN (SELECT value FROM json_each(?))",
+                         (time.time(), dumps(list(found))))
+            conn.commit()
+
+        return found
+
+    except Exception as err:
+        logger.info(f"读取概括缓存失败 {err}")
+        if conn:
+            conn.rollback()
+        return {}
+
+
+def save_cached_summaries(model: str, summaries: Dict[str, str]) -> None:
+    """
+    批量写入函数概括缓存
+
+    :param model: 模型标识
+    :param summaries: {缓存键: 概括}
+    :return: None
+    """
+
+    if not CACHE_ENABLED or not summaries:
+        return
+
+    conn = None
+
+    try:
+        conn = get_connection(CACHE_DB_PATH)
+        now = time.time()
+        conn.executemany("""
+            INSERT OR REPLACE INTO summary_cache (key, model, summary, created, accessed)
+            VALUES (?, ?, ?, ?, ?)
+        """, [(key, model, summary, now, now) for key, summary in summaries.items()])
+        conn.commit()
+
+    except Exception as err:
+        logger.info(f"写入概括缓存失败 {err}")
+        if conn:
+            conn.rollback()
+
+
+def prune_cache(conn: Optional[sqlite3.Connection] = None) -> int:
+    """
+    按存活时间和最大条目数淘汰审查缓存、分析缓存和概括缓存，超出条目数时优先淘汰最久未访问的记录
+
+    :param conn: 可复用的数据库连接，默认使用当前线程的连接
+    :return: 删除的记录数
+    """
+
+    removed = 0
+
+    try:
+        if conn is None:
+            conn = get_connection(CACHE_DB_PATH)
+
+        for table in ("review_cache", "analysis_cache", "summary_cache"):
+            if MAX_AGE_DAYS > 0:
+                removed += conn.execute(f"DELETE FROM {table} WHERE created < ?",
+                                        (time.time() - MAX_AGE_DAYS * 86400,)).rowcount
+
+            if MAX_ENTRIES > 0:
+                removed += conn.execute(f"""
+                    DELETE FROM {table} WHERE key IN (
+                        SELECT key FROM {table} ORDER BY accessed DESC LIMIT -1 OFFSET ?
+                    )
+                """, (MAX_ENTRIES,)).rowcount
+
+        conn.commit()
+        if removed:
+            logger.info(f"审查缓存淘汰 {removed} 条记录")
+
+    except Exception as err:
+        logger.info(f"审查缓存淘汰失败 {err}")
+        if conn:
+            conn.rollback()
+
+    return removed
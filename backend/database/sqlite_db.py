@@ -8,54 +8,505 @@
 
 
 import sqlite3
-from datetime import datetime
+from datetime import datetime, timedelta
 from json import dumps, loads
+from typing import Any, List, Optional, Tuple
 from backend.core.logger import Config, setup_logger
+from backend.database.connection import get_connection, transaction, register_schema
+from backend.database.blobs import create_blob_table, put_blob, put_blobs, register_functions
 
 
 config = Config("./config.yaml")
 logger = setup_logger(config)
 DB_PATH = "./backend/database/review_history.db"
 
+# 当前SQLite是否支持FTS5，不支持时全文检索退回 LIKE 匹配
+FTS_ENABLED = False
+
+# 历史记录查询的公共部分，一条历史记录对应 files 表中的一行，审查结果或思维导图挂在其下
+HISTORY_FROM = """
+    FROM files f
+    JOIN runs r ON r.id = f.run_id
+    LEFT JOIN reviews v ON v.file_id = f.id
+    LEFT JOIN mindmaps m ON m.file_id = f.id
+"""
+HISTORY_COLUMNS = """
+    f.id AS id, f.path AS file, f.language AS language, f.created AS timestamp,
+    r.github_url AS github_url, r.branch AS branch, r.commit_sha AS commit_sha,
+    v.issues AS issues, v.documentation AS documentation,
+    (SELECT unblob(codec, data) FROM blobs WHERE hash = f.code_hash) AS code,
+    (SELECT unblob(codec, data) FROM blobs WHERE hash = v.optimized_hash) AS optimized_code,
+    (SELECT unblob(codec, data) FROM blobs WHERE hash = v.complexity_hash) AS complexity,
+    (SELECT unblob(codec, data) FROM blobs WHERE hash = m.map_hash) AS map
+"""
+
+
+def init_schema(conn: sqlite3.Connection):
+    """
+    初始化审查历史数据库的全部表结构，由连接管理器在首次连接时执行一次。
+    旧版本单表结构的 reviews 会被迁移到新结构。
+
+    :param conn: 数据库连接
+    :return: None
+    """
+
+    # 迁移需要在同一个事务中完成，失败时整体回滚
+    conn.execute("BEGIN")
+    legacy = prepare_legacy_reviews(conn)
+
+    create_blob_table(conn)
+    create_history_tables(conn)
+    create_review_indexes(conn)
+
+    if legacy:
+        migrate_legacy_reviews(conn)
+
+    create_job_tables(conn)
+
+
+register_schema(DB_PATH, init_schema, register_functions)
+
+
+def create_history_tables(conn: sqlite3.Connection):
+    """
+    创建历史记录相关的数据表：
+        runs:     一次审查或思维导图生成
+        files:    一次运行中的文件，id 即历史记录的行标
+        reviews:  文件的审查结果
+        mindmaps: 思维导图
+        mindmap_graphs: 按需加载详情的思维导图的节点代码，由 mindmaps.graph_id 引用
+    代码、优化代码、复杂度、思维导图和节点代码以内容哈希引用 blobs 表
+
+    :param conn: 数据库连接
+    :return: None
+    """
+
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS runs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            kind TEXT NOT NULL,
+            github_url TEXT,
+            branch TEXT,
+            commit_sha TEXT,
+            created TEXT
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS files (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            run_id INTEGER NOT NULL REFERENCES runs (id) ON DELETE CASCADE,
+            path TEXT,
+            language TEXT,
+            code_hash TEXT,
+            created TEXT
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS reviews (
+            file_id INTEGER PRIMARY KEY REFERENCES files (id) ON DELETE CASCADE,
+            issues TEXT,
+            documentation TEXT,
+            optimized_hash TEXT,
+            complexity_hash TEXT
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS mindmaps (
+            file_id INTEGER PRIMARY KEY REFERENCES files (id) ON DELETE CASCADE,
+            map_hash TEXT,
+            graph_id TEXT
+        )
+    """)
+    # 早期版本的 mindmaps 表没有 graph_id 列
+    if "graph_id" not in [row[1] for row in conn.execute("PRAGMA table_info(mindmaps)").fetchall()]:
+        conn.execute("ALTER TABLE mindmaps ADD COLUMN graph_id TEXT")
+
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS mindmap_graphs (
+            id TEXT PRIMARY KEY,
+            nodes_hash TEXT,
+            created TEXT
+        )
+    """)
+
+
+def create_review_indexes(conn: sqlite3.Connection):
+    """
+    创建历史记录查询使用的索引，以及 issues、documentation 的 FTS5 全文索引（通过触发器与 reviews 表同步）
+
+    :param conn: 数据库连接
+    :return: None
+    """
+
+    global FTS_ENABLED
+
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_runs_repo ON runs (github_url, branch, id)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_files_run ON files (run_id)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_files_language ON files (language, id)")
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_files_created ON files (created)")
+
+    try:
+        exists = conn.execute("SELECT 1 FROM sqlite_master WHERE name='reviews_fts'").fetchone()
+        conn.execute("""
+            CREATE VIRTUAL TABLE IF NOT EXISTS reviews_fts
+            USING fts5(issues, documentation, content='reviews', content_rowid='file_id')
+        """)
+
+    except sqlite3.OperationalError as err:
+        logger.info(f"SQLite 不支持 FTS5，全文检索使用 LIKE 匹配: {err}")
+        FTS_ENABLED = False
+        return
+
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS reviews_fts_insert AFTER INSERT ON reviews BEGIN
+            INSERT INTO reviews_fts (rowid, issues, documentation) VALUES (new.file_id, new.issues, new.documentation);
+        END
+    """)
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS reviews_fts_delete AFTER DELETE ON reviews BEGIN
+            INSERT INTO reviews_fts (reviews_fts, rowid, issues, documentation) VALUES ('delete', old.file_id, old.issues, old.documentation);
+        END
+    """)
+    conn.execute("""
+        CREATE TRIGGER IF NOT EXISTS reviews_fts_update AFTER UPDATE ON reviews BEGIN
+            INSERT INTO reviews_fts (reviews_fts, rowid, issues, documentation) VALUES ('delete', old.file_id, old.issues, old.documentation);
+            INSERT INTO reviews_fts (rowid, issues, documentation) VALUES (new.file_id, new.issues, new.documentation);
+        END
+    """)
+
+    # 首次创建时为已有记录建立索引
+    if not exists:
+        conn.execute("INSERT INTO reviews_fts (reviews_fts) VALUES ('rebuild')")
+
+    FTS_ENABLED = True
+
+
+def prepare_legacy_reviews(conn: sqlite3.Connection) -> bool:
+    """
+    检测旧版本的单表 reviews（包含 code 列），存在时移除其索引和全文索引并重命名为 reviews_legacy
+
+    :param conn: 数据库连接
+    :return: 是否需要迁移
+    """
+
+    columns = [row[1] for row in conn.execute("PRAGMA table_info(reviews)").fetchall()]
+    if "code" not in columns:
+        return conn.execute("SELECT 1 FROM sqlite_master WHERE name='reviews_legacy'").fetchone() is not None
+
+    for trigger in ("reviews_fts_insert", "reviews_fts_delete", "reviews_fts_update"):
+        conn.execute(f"DROP TRIGGER IF EXISTS {trigger}")
+
+    conn.execute("DROP TABLE IF EXISTS reviews_fts")
+    for index in ("idx_reviews_repo", "idx_reviews_language", "idx_reviews_timestamp"):
+        conn.execute(f"DROP INDEX IF EXISTS {index}")
+
+    conn.execute("ALTER TABLE reviews RENAME TO reviews_legacy")
+    return True
+
+
+def migrate_legacy_reviews(conn: sqlite3.Connection):
+    """
+    将 reviews_legacy 中的记录迁移到新结构，行标保持不变。
+    相邻且仓库、分支、提交相同的审查记录归为同一次运行，每个思维导图单独作为一次运行。
+
+    :param conn: 数据库连接
+    :return: None
+    """
+
+    cursor = conn.execute("SELECT * FROM reviews_legacy ORDER BY id")
+    run_key, run_id, count = None, None, 0
+
+    for row in cursor.fetchall():
+        keys = row.keys()
+        is_map = row["map"] not in (None, "", '""')
+        kind = "mindmap" if is_map else "review"
+        commit_sha = (row["commit_sha"] if "commit_sha" in keys else "") or ""
+        key = (kind, row["github_url"], row["branch"], commit_sha)
+
+        if is_map or key != run_key:
+            run_id = insert_run(conn, kind, row["github_url"], row["branch"], commit_sha, row["timestamp"])
+            run_key = None if is_map else key
+
+        conn.execute("""
+            INSERT INTO files (id, run_id, path, language, code_hash, created) VALUES (?, ?, ?, ?, ?, ?)
+        """, (row["id"], run_id, row["file"], row["language"], put_blob(conn, row["code"] or ""), row["timestamp"]))
+
+        if is_map:
+            conn.execute("INSERT INTO mindmaps (file_id, map_hash) VALUES (?, ?)", (row["id"], put_blob(conn, row["map"])))
+
+        else:
+            conn.execute("""
+                INSERT INTO reviews (file_id, issues, documentation, optimized_hash, complexity_hash) VALUES (?, ?, ?, ?, ?)
+            """, (row["id"], row["issues"], row["documentation"],
+                  put_blob(conn, row["optimized_code"]), put_blob(conn, row["complexity"])))
+
+        count += 1
+
+    conn.execute("DROP TABLE reviews_legacy")
+    logger.info(f"历史记录迁移完成，共 {count} 条")
+
+
+def insert_run(conn: sqlite3.Connection, kind: str, github_url: Optional[str], branch: Optional[str],
+               commit_sha: Optional[str], created: Optional[str] = None) -> int:
+    """在给定连接上新建运行记录，返回运行id"""
+
+    return conn.execute("""
+        INSERT INTO runs (kind, github_url, branch, commit_sha, created) VALUES (?, ?, ?, ?, ?)
+    """, (kind, github_url, branch, commit_sha or "", created or str(datetime.now().isoformat()))).lastrowid
+
+
+def create_run(kind: str, github_url: Optional[str] = None, branch: Optional[str] = None,
+               commit_sha: Optional[str] = None) -> int:
+    """
+    新建一次运行，同一次审查的文件记录挂在同一个运行下
+
+    :param kind: review 或 mindmap
+    :param github_url: 仓库地址
+    :param branch: 分支
+    :param commit_sha: 提交
+    :return: 运行id
+    """
+
+    with transaction(DB_PATH) as conn:
+        return insert_run(conn, kind, github_url, branch, commit_sha)
+
+
+def insert_file(conn: sqlite3.Connection, run_id: int, results: dict) -> int:
+    """在给定连接上保存文件记录，返回文件id（即历史记录行标）"""
+
+    return conn.execute("""
+        INSERT INTO files (run_id, path, language, code_hash, created) VALUES (?, ?, ?, ?, ?)
+    """, (run_id, results.get("file", ""), results.get("language", ""), put_blob(conn, results.get("code") or ""),
+          str(datetime.now().isoformat()))).lastrowid
+
+
+def to_text(value: Any) -> str:
+    """审查结果中的字段可能是列表或字典，统一转为字符串保存"""
+
+    if value is None or isinstance(value, str):
+        return value or ""
+
+    return dumps(value, ensure_ascii=False)
+
+
+def fts_query(text: str) -> str:
+    """将用户输入转换为FTS5查询，每个词按短语匹配，避免特殊字符引起语法错误"""
+
+    return " ".join('"{}"'.format(word.replace('"', '""')) for word in text.split())
+
+
+def history_filters(github_url: Optional[str] = None, branch: Optional[str] = None, language: Optional[str] = None,
+                    file: Optional[str] = None, since: Optional[str] = None, until: Optional[str] = None,
+                    query: Optional[str] = None) -> Tuple[List[str], list]:
+    """
+    构造历史记录的筛选条件（files 表别名 f，runs 表别名 r）
+
+    :param github_url: 仓库地址
+    :param branch: 分支
+    :param language: 语言
+    :param file: 文件路径中包含的文本
+    :param since: 起始时间（ISO格式，包含）
+    :param until: 结束时间（ISO格式，不包含）
+    :param query: 在 issues、documentation 中全文检索的关键词
+    :return: (条件列表, 参数列表)
+    """
+
+    conditions, params = [], []
+
+    for column, value in (("r.github_url", github_url), ("r.branch", branch), ("f.language", language)):
+        if value:
+            conditions.append(f"{column} = ?")
+            params.append(value)
+
+    if file:
+        conditions.append("instr(f.path, ?) > 0")
+        params.append(file)
+
+    if since:
+        conditions.append("f.created >= ?")
+        params.append(since)
+
+    if until:
+        conditions.append("f.created < ?")
+        params.append(until)
+
+    if query and query.strip():
+        if FTS_ENABLED:
+            conditions.append("f.id IN (SELECT rowid FROM reviews_fts WHERE reviews_fts MATCH ?)")
+            params.append(fts_query(query))
+
+        else:
+            conditions.append("f.id IN (SELECT file_id FROM reviews WHERE issues LIKE ? OR documentation LIKE ?)")
+            params.extend([f"%{query.strip()}%"] * 2)
+
+    return conditions, params
+
 
 def delete_review(data_id: int):
     """
-    根据行标删除数据，并且自动恢复有序行标
+    根据行标删除数据，其余记录的行标保持不变
 
     :param data_id: 需要删除的行标
-    :return: 一个状态码？
+    :return: 是否删除成功
     """
 
     conn = None
 
     try:
-        conn = sqlite3.connect("./backend/database/review_history.db")
+        conn = get_connection(DB_PATH)
         c = conn.cursor()
-        # 删除
-        c.execute(f"""delete from reviews where id=?""", (data_id,))
+        # 删除，审查结果和思维导图随文件记录级联删除
+        c.execute("DELETE FROM files WHERE id=?", (data_id,))
 
         # 指向数据不存在
         if c.rowcount == 0:
             logger.info(f"未找到ID:{data_id} 的数据")
+            conn.rollback()
             return False
 
-        # 恢复有序
-        c.execute(f"""update reviews set id=id-1 where id > ?""", (data_id,))
-
         # 提交业务
         conn.commit()
         return True
 
     except Exception as err:
         logger.info(f"记录删除失败 {err}")
+        if conn:
+            conn.rollback()
         return False
 
-    finally:
-        if conn:
-            conn.close()
 
+def delete_reviews(ids: Optional[List[int]] = None, github_url: Optional[str] = None, branch: Optional[str] = None,
+                   before: Optional[str] = None) -> int:
+    """
+    批量删除历史记录，多个条件同时提供时取交集，在一个事务中完成
+
+    :param ids: 行标列表
+    :param github_url: 仓库地址
+    :param branch: 分支（需要与 github_url 一起使用）
+    :param before: 删除早于该时间（ISO格式）的记录
+    :return: 删除的记录数
+    """
+
+    conditions, params = history_filters(github_url=github_url, branch=branch if github_url else None, until=before)
+
+    if ids:
+        # 以JSON数组传参，不受SQLite参数个数上限限制
+        conditions.append("f.id IN (SELECT value FROM json_each(?))")
+        params.append(dumps([int(data_id) for data_id in ids]))
+
+    # 没有任何条件时拒绝执行，避免误删全部记录
+    if not conditions:
+        return 0
+
+    with transaction(DB_PATH) as conn:
+        removed = conn.execute(f"""
+            DELETE FROM files WHERE id IN (
+                SELECT f.id FROM files f JOIN runs r ON r.id = f.run_id WHERE {' AND '.join(conditions)}
+            )
+        """, params).rowcount
+
+    logger.info(f"批量删除记录 {removed} 条")
+    return removed
+
+
+def prune_orphans(min_age_hours: float = 24) -> dict:
+    """
+    清理没有文件记录的运行、不再被思维导图引用的节点代码和不再被引用的内容
+
+    :param min_age_hours: 只清理创建时间早于该小时数的运行，避免影响进行中的审查
+    :return: {"runs": 删除的运行数, "graphs": 删除的节点代码数, "blobs": 删除的内容数}
+    """
+
+    before = (datetime.now() - timedelta(hours=min_age_hours)).isoformat()
+
+    with transaction(DB_PATH) as conn:
+        runs = conn.execute("""
+            DELETE FROM runs WHERE created < ? AND NOT EXISTS (SELECT 1 FROM files WHERE files.run_id = runs.id)
+        """, (before,)).rowcount
+        # 节点代码只在引用它的思维导图记录被删除后清理
+        graphs = conn.execute("""
+            DELETE FROM mindmap_graphs WHERE created < ? AND id NOT IN (
+                SELECT graph_id FROM mindmaps WHERE graph_id IS NOT NULL
+            )
+        """, (before,)).rowcount
+        blobs = conn.execute("""
+            DELETE FROM blobs WHERE hash NOT IN (
+                SELECT code_hash FROM files WHERE code_hash IS NOT NULL
+                UNION SELECT optimized_hash FROM reviews WHERE optimized_hash IS NOT NULL
+                UNION SELECT complexity_hash FROM reviews WHERE complexity_hash IS NOT NULL
+                UNION SELECT map_hash FROM mindmaps WHERE map_hash IS NOT NULL
+                UNION SELECT nodes_hash FROM mindmap_graphs WHERE nodes_hash IS NOT NULL
+            )
+        """).rowcount
+
+    return {"runs": runs, "graphs": graphs, "blobs": blobs}
+
+
+def save_reviews(batch: List[Tuple[dict, Optional[int]]]) -> int:
+    """
+    在一个事务中批量保存多个文件的审查结果，文件、审查结果和内容均通过 executemany 写入
+
+    :param batch: [(审查结果, 所属运行id), ...]，结果格式见 save_review，运行id为空时为该结果新建运行
+    :return: 保存的记录数
+    """
+
+    if not batch:
+        return 0
+
+    timestamp = str(datetime.now().isoformat())
+    conn = get_connection(DB_PATH)
+    # 立即获取写锁，保证预分配的文件id不会与其他写入冲突
+    conn.execute("BEGIN IMMEDIATE")
 
-def save_review(results: dict):
+    try:
+        run_ids = [
+            run_id if run_id is not None else insert_run(conn, "review", results.get("github_url", ""),
+                                                         results.get("branch", ""), results.get("commit_sha"))
+            for results, run_id in batch
+        ]
+
+        complexities = []
+        for results, _ in batch:
+            # complexity 是一个字典，需要将他转为字符
+            try:
+                complexities.append(dumps(results.get("complexity", "")))
+
+            except Exception as err:
+                complexities.append("")
+                logger.info(f"complexity 转换json失败")
+
+        count = len(batch)
+        hashes = put_blobs(conn, [results.get("code") or "" for results, _ in batch]
+                           + [to_text(results.get("optimized_code", "")) for results, _ in batch]
+                           + complexities)
+        code_hashes, optimized_hashes, complexity_hashes = hashes[:count], hashes[count:2 * count], hashes[2 * count:]
+
+        row = conn.execute("SELECT seq FROM sqlite_sequence WHERE name='files'").fetchone()
+        first_id = (row[0] if row else 0) + 1
+        file_ids = list(range(first_id, first_id + count))
+
+        conn.executemany("""
+            INSERT INTO files (id, run_id, path, language, code_hash, created) VALUES (?, ?, ?, ?, ?, ?)
+        """, [(file_id, run_id, results.get("file", ""), results.get("language", ""), code_hash, timestamp)
+              for file_id, run_id, (results, _), code_hash in zip(file_ids, run_ids, batch, code_hashes)])
+        conn.executemany("""
+            INSERT INTO reviews (file_id, issues, documentation, optimized_hash, complexity_hash) VALUES (?, ?, ?, ?, ?)
+        """, [(file_id, to_text(results.get("issues", "")), to_text(results.get("documentation", "")),
+               optimized_hash, complexity_hash)
+              for file_id, (results, _), optimized_hash, complexity_hash
+              in zip(file_ids, batch, optimized_hashes, complexity_hashes)])
+
+        conn.commit()
+
+    except BaseException:
+        conn.rollback()
+        raise
+
+    logger.info(f"批量保存审查记录 {count} 条")
+    return count
+
+
+def save_review(results: dict, run_id: Optional[int] = None):
     """
     保存代码审查结果到数据库。
 
@@ -67,143 +518,110 @@ def save_review(results: dict):
         documentation:   相关文档说明
         github_url:      GitHub 仓库 URL（可选）
         branch:          分支名称（可选，默认为 main）
+        commit_sha:      审查时分支指向的提交（可选）
+    :param run_id:      所属运行，为空时新建一次运行
     :return:                None
     """
 
-    conn = None
-
     try:
-        conn = sqlite3.connect("./backend/database/review_history.db")
-        c = conn.cursor()
-        c.execute("""
-            CREATE TABLE IF NOT EXISTS reviews (
-                id INTEGER PRIMARY KEY,
-                file TEXT,
-                language TEXT,
-                code TEXT,
-                issues TEXT,
-                optimized_code TEXT,
-                documentation TEXT,
-                complexity TEXT,
-                timestamp TEXT,
-                github_url TEXT,
-                branch TEXT,
-                map TEXT
-            )
-        """)
+        save_reviews([(results, run_id)])
+        logger.info("记录保存成功")
 
-        # 使用ISO格式存储时间
-        timestamp = str(datetime.now().isoformat())
+    except Exception as e:
+        logger.error(f"记录保存失败: {str(e)}")
 
-        # complexity 是一个字典，需要将他转为字符
-        try:
-            complexity = dumps(results.get("complexity", ""))
 
-        except Exception as err:
-            complexity = ""
-            logger.info(f"complexity 转换json失败")
+def save_map(results: dict):
+    """
+    保存思维导图，每个思维导图单独作为一次运行
 
-        try:
-            map = dumps(results.get("map", ""))
+    :param results: 包含 file、language、code、github_url、branch、map
+    :return: None
+    """
 
-        except Exception as err:
-            map = ""
-            logger.info(f"map 转换json失败")
+    graph_id = results["map"].get("graph_id") if isinstance(results.get("map"), dict) else None
 
+    try:
+        map = dumps(results.get("map", ""), ensure_ascii=False)
 
-        # logger.info(f"issues: {issues}")
-        # issues_json = dumps(issues, ensure_ascii=False)
+    except Exception as err:
+        map = ""
+        logger.info(f"map 转换json失败")
 
-        c.execute("""
-            INSERT INTO reviews (file, language, code, issues, optimized_code, documentation, complexity, timestamp, github_url, branch, map)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        """, (results.get("file", ""), results.get("language", ""),
-              results.get("code", ""), results.get("issues", ""),
-              results.get("optimized_code", ""), results.get("documentation", ""),
-              complexity, timestamp,
-              results.get("github_url", ""), results.get("branch", ""), map
-              )
-                  )
+    try:
+        with transaction(DB_PATH) as conn:
+            run_id = insert_run(conn, "mindmap", results.get("github_url", ""), results.get("branch", ""),
+                                results.get("commit_sha"))
+            file_id = insert_file(conn, run_id, results)
+            conn.execute("INSERT INTO mindmaps (file_id, map_hash, graph_id) VALUES (?, ?, ?)",
+                         (file_id, put_blob(conn, map), graph_id))
 
-        conn.commit()
         logger.info("记录保存成功")
 
     except Exception as e:
         logger.error(f"记录保存失败: {str(e)}")
 
-    finally:
-        if conn:
-            conn.close()
 
+def save_graph(graph_id: str, nodes: dict) -> None:
+    """
+    保存按需加载详情的思维导图的节点代码，内容去重压缩后保存在 blobs 表，
+    保留到引用它的思维导图记录被删除为止，不受缓存配置影响
 
-def save_map(results: dict):
+    :param graph_id: 图id
+    :param nodes: {节点id: {"label", "kind", "code"}}
+    :return: None
     """
-    保存已经处理的节点， 暂时使用，可能合并两个保存函数
-    :param results:
-    :return:
+
+    with transaction(DB_PATH) as conn:
+        conn.execute("INSERT OR REPLACE INTO mindmap_graphs (id, nodes_hash, created) VALUES (?, ?, ?)",
+                     (graph_id, put_blob(conn, dumps(nodes, ensure_ascii=False)), str(datetime.now().isoformat())))
+
+
+def get_graph(graph_id: str) -> Optional[dict]:
     """
+    读取思维导图的节点代码
 
-    conn = None
-    try:
-        conn = sqlite3.connect("./backend/database/review_history.db")
-        c = conn.cursor()
-        c.execute("""
-                CREATE TABLE IF NOT EXISTS reviews (
-                    id INTEGER PRIMARY KEY,
-                    file TEXT,
-                    language TEXT,
-                    code TEXT,
-                    issues TEXT,
-                    optimized_code TEXT,
-                    documentation TEXT,
-                    complexity TEXT,
-                    timestamp TEXT,
-                    github_url TEXT,
-                    branch TEXT,
-                    map TEXT
-                )
-            """)
-
-        # 使用ISO格式存储时间
-        timestamp = str(datetime.now().isoformat())
-        map = ""
-        # complexity 是一个字典，需要将他转为字符
-        try:
-            complexity = dumps(results.get("complexity", ""))
-
-        except Exception as err:
-            complexity = ""
-            logger.info(f"complexity 转换json失败")
-
-        try:
-            map = dumps(results.get("map", ""))
-
-        except Exception as err:
-            logger.info(f"map 转换json失败")
-
-        # logger.info(f"issues: {issues}")
-        # issues_json = dumps(issues, ensure_ascii=False)
-
-        c.execute("""
-                INSERT INTO reviews (file, language, code, issues, optimized_code, documentation, complexity, timestamp, github_url, branch, map)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """, (results.get("file", ""), results.get("language", ""),
-                  results.get("code", ""), results.get("issues", ""),
-                  results.get("optimized_code", ""), results.get("documentation", ""),
-                  complexity, timestamp,
-                  results.get("github_url", ""), results.get("branch", ""), map
-                  )
-            )
+    :param graph_id: 图id
+    :return: {节点id: {"label", "kind", "code"}}，不存在时返回None
+    """
 
-        conn.commit()
-        logger.info("记录保存成功")
+    conn = get_connection(DB_PATH)
+    row = conn.execute("""
+        SELECT (SELECT unblob(codec, data) FROM blobs WHERE hash = g.nodes_hash) FROM mindmap_graphs g WHERE g.id=?
+    """, (graph_id,)).fetchone()
 
-    except Exception as e:
-        logger.error(f"记录保存失败: {str(e)}")
+    return loads(row[0]) if row and row[0] else None
 
-    finally:
-        if conn:
-            conn.close()
+
+def history_record(row: sqlite3.Row) -> dict:
+    """
+    将历史记录查询（HISTORY_COLUMNS）的一行转换为历史记录格式，字段说明见 get_reviews
+
+    :param row: 查询结果行
+    :return: 历史记录字典
+    """
+
+    # 空字段的取值与旧版本单表结构保持一致：审查记录的 map 与思维导图的 complexity 为空字符串
+    is_review = row["issues"] is not None
+
+    return {
+        "id": str(row["id"]),
+        "file": row["file"] or "unknown",
+        "timestamp": row["timestamp"],
+        "code": row["code"] or "",
+        # "results": row["issues"],  # issues 映射到 results
+        "results": [{
+            # "file": row["file"] or "unknown",
+            "language": row["language"] or "",
+            "issues": row["issues"] or "",
+            "optimized_code": row["optimized_code"] or "",
+            "documentation": row["documentation"] or "",
+            "complexity": loads(row["complexity"]) if row["complexity"] else ({} if is_review else "")
+        }],
+        "github_url": row["github_url"] or "",
+        "branch": row["branch"] or "main",
+        "map": loads(row["map"]) if row["map"] else ("" if is_review else {})
+    }
 
 
 def get_reviews():
@@ -230,35 +648,15 @@ def get_reviews():
     """
 
     try:
-        with sqlite3.connect(DB_PATH) as conn:
-            conn.row_factory = sqlite3.Row  # 启用行工厂
-            cursor = conn.cursor()
-            cursor.execute("SELECT id, file, language, code, issues, optimized_code, documentation, complexity, timestamp, github_url, branch, map FROM reviews")
-
-            history = []
-            for row in cursor.fetchall():
-                history.append({
-                    "id": str(row["id"]),
-                    "file": row["file"] or "unknown",
-                    "timestamp": row["timestamp"],
-                    "code": row["code"],
-                    # "results": row["issues"],  # issues 映射到 results
-                    "results": [{
-                        # "file": row["file"] or "unknown",
-                        "language": row["language"] or "",
-                        "issues": row["issues"] or "",
-                        "optimized_code": row["optimized_code"] or "",
-                        "documentation": row["documentation"] or "",
-                        "complexity": loads(row["complexity"]) if row["complexity"] else {}
-                    }],
-                    "github_url": row["github_url"] or "",
-                    "branch": row["branch"] or "main",
-                    "map": loads(row["map"]) if row["map"] else {}
-                })
-
-            logger.info(f"Retrieved {len(history)} review records from database")
-
-            return history
+        conn = get_connection(DB_PATH)
+        cursor = conn.cursor()
+        cursor.execute(f"SELECT {HISTORY_COLUMNS} {HISTORY_FROM} ORDER BY f.id")
+
+        history = [history_record(row) for row in cursor.fetchall()]
+
+        logger.info(f"Retrieved {len(history)} review records from database")
+
+        return history
 
     except sqlite3.Error as e:
         logger.error(f"数据库发生错误: {str(e)}")
@@ -266,8 +664,330 @@ def get_reviews():
     except Exception as e:
         logger.error(f"意料以外的异常: {str(e)}")
 
-    finally:
-        if conn:
-            conn.close()
-
     return []
+
+
+def get_review_summaries(limit: int = 50, cursor: Optional[int] = None, **filters) -> dict:
+    """
+    按id倒序分页获取历史记录摘要，只读取轻量字段。
+    使用键集分页（WHERE id < cursor），翻页开销与所在页数无关。
+
+    :param limit: 每页条数
+    :param cursor: 上一页返回的 next_cursor，为空时从最新记录开始
+    :param filters: 筛选条件，参数见 history_filters
+    :return: {
+        "items": [{"id": str, "file": str, "language": str, "timestamp": str, "github_url": str, "branch": str}, ...],
+        "next_cursor": 下一页游标，没有更多记录时为None
+    }
+    """
+
+    try:
+        conn = get_connection(DB_PATH)
+        conditions, params = history_filters(**filters)
+        if cursor is not None:
+            conditions.append("f.id < ?")
+            params.append(cursor)
+
+        condition = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        rows = conn.execute(f"""
+            SELECT f.id AS id, f.path AS file, f.language AS language, f.created AS timestamp, r.github_url AS github_url, r.branch AS branch
+            FROM files f JOIN runs r ON r.id = f.run_id
+            {condition} ORDER BY f.id DESC LIMIT ?
+        """, params + [limit + 1]).fetchall()
+
+        items = [{
+            "id": str(row["id"]),
+            "file": row["file"] or "unknown",
+            "language": row["language"] or "",
+            "timestamp": row["timestamp"],
+            "github_url": row["github_url"] or "",
+            "branch": row["branch"] or "main"
+        } for row in rows[:limit]]
+
+        # 多取一条用于判断是否还有下一页
+        next_cursor = items[-1]["id"] if len(rows) > limit else None
+        return {"items": items, "next_cursor": next_cursor}
+
+    except Exception as err:
+        logger.error(f"查询历史记录摘要失败: {str(err)}")
+        return {"items": [], "next_cursor": None}
+
+
+def get_review_detail(review_id: int) -> Optional[dict]:
+    """
+    获取单条历史记录的完整内容
+
+    :param review_id: 记录id
+    :return: 与 get_reviews 中单条记录相同的格式，不存在时返回None
+    """
+
+    try:
+        conn = get_connection(DB_PATH)
+        row = conn.execute(f"SELECT {HISTORY_COLUMNS} {HISTORY_FROM} WHERE f.id=?", (review_id,)).fetchone()
+        return history_record(row) if row else None
+
+    except Exception as err:
+        logger.error(f"查询历史记录失败 {review_id}: {str(err)}")
+        return None
+
+
+def get_last_reviewed_commit(github_url: str, branch: str):
+    """
+    查询仓库分支最近一次审查时记录的提交
+
+    :param github_url: 仓库地址
+    :param branch: 分支
+    :return: 提交sha，没有记录时返回None
+    """
+
+    try:
+        conn = get_connection(DB_PATH)
+        row = conn.execute("""
+            SELECT commit_sha FROM runs
+            WHERE kind='review' AND github_url=? AND branch=? AND commit_sha IS NOT NULL AND commit_sha != ''
+                  AND EXISTS (SELECT 1 FROM files WHERE files.run_id = runs.id)
+            ORDER BY id DESC LIMIT 1
+        """, (github_url, branch)).fetchone()
+        return row[0] if row else None
+
+    except Exception as err:
+        logger.info(f"查询最近审查提交失败 {err}")
+        return None
+
+
+def get_latest_file_reviews(github_url: str, branch: str) -> dict:
+    """
+    查询仓库分支中每个文件最近一次带提交记录的审查结果，用于增量审查时沿用未变化文件的结果
+
+    :param github_url: 仓库地址
+    :param branch: 分支
+    :return: {文件路径: 审查结果}，结果格式与 /api/review 中单个文件相同
+    """
+
+    try:
+        conn = get_connection(DB_PATH)
+        rows = conn.execute(f"""
+            SELECT {HISTORY_COLUMNS} {HISTORY_FROM}
+            WHERE f.id IN (
+                SELECT MAX(f.id) FROM files f JOIN runs r ON r.id = f.run_id
+                WHERE r.kind='review' AND r.github_url=? AND r.branch=? AND r.commit_sha IS NOT NULL AND r.commit_sha != ''
+                GROUP BY f.path
+            )
+        """, (github_url, branch)).fetchall()
+
+        return {
+            row["file"]: {
+                "file": row["file"],
+                "language": row["language"] or "",
+                "code": row["code"] or "",
+                "issues": row["issues"] or "",
+                "optimized_code": row["optimized_code"] or "",
+                "documentation": row["documentation"] or "",
+                "complexity": loads(row["complexity"]) if row["complexity"] else {},
+                "github_url": row["github_url"],
+                "branch": row["branch"],
+                "commit_sha": row["commit_sha"]
+            }
+            for row in rows
+        }
+
+    except Exception as err:
+        logger.info(f"查询历史审查结果失败 {err}")
+        return {}
+
+
+def create_job_tables(conn: sqlite3.Connection):
+    """
+    创建审查任务相关的数据表
+
+    :param conn: 数据库连接
+    :return: None
+    """
+
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS review_jobs (
+            id TEXT PRIMARY KEY,
+            status TEXT,
+            github_url TEXT,
+            branch TEXT,
+            path TEXT,
+            code TEXT,
+            bypass_cache INTEGER,
+            total INTEGER,
+            completed INTEGER,
+            error TEXT,
+            created TEXT,
+            updated TEXT
+        )
+    """)
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS review_job_files (
+            job_id TEXT,
+            idx INTEGER,
+            file TEXT,
+            language TEXT,
+            code TEXT,
+            status TEXT,
+            result TEXT,
+            PRIMARY KEY (job_id, idx)
+        )
+    """)
+
+
+def create_job(job: dict):
+    """
+    新建审查任务
+
+    :param job: 包含 id、github_url、branch、path、code、bypass_cache
+    :return: None
+    """
+
+    with transaction(DB_PATH) as conn:
+        timestamp = str(datetime.now().isoformat())
+        conn.execute("""
+            INSERT INTO review_jobs (id, status, github_url, branch, path, code, bypass_cache, total, completed, error, created, updated)
+            VALUES (?, 'queued', ?, ?, ?, ?, ?, 0, 0, '', ?, ?)
+        """, (job["id"], job.get("github_url"), job.get("branch", "main"), job.get("path", ""), job.get("code"),
+              int(bool(job.get("bypass_cache"))), timestamp, timestamp))
+
+
+def get_job(job_id: str):
+    """
+    获取审查任务
+
+    :param job_id: 任务id
+    :return: 任务字典，不存在返回None
+    """
+
+    conn = get_connection(DB_PATH)
+    row = conn.execute("SELECT * FROM review_jobs WHERE id=?", (job_id,)).fetchone()
+    return dict(row) if row else None
+
+
+def find_active_job(github_url: str, branch: str, path: str):
+    """
+    查找同一仓库、分支和路径下尚未结束的任务，避免客户端重试时重复审查
+
+    :return: 任务id，不存在返回None
+    """
+
+    conn = get_connection(DB_PATH)
+    row = conn.execute("""
+        SELECT id FROM review_jobs
+        WHERE github_url=? AND branch=? AND path=? AND status IN ('queued', 'running')
+        ORDER BY created DESC LIMIT 1
+    """, (github_url, branch, path)).fetchone()
+    return row[0] if row else None
+
+
+def get_unfinished_jobs() -> list:
+    """
+    获取未完成的任务id，服务重启后用于恢复执行
+
+    :return: 按创建时间排序的任务id列表
+    """
+
+    conn = get_connection(DB_PATH)
+    rows = conn.execute("SELECT id FROM review_jobs WHERE status IN ('queued', 'running') ORDER BY created").fetchall()
+    return [row[0] for row in rows]
+
+
+def update_job(job_id: str, **fields):
+    """
+    更新任务状态字段（status、total、completed、error）
+
+    :param job_id: 任务id
+    :param fields: 需要更新的字段
+    :return: None
+    """
+
+    allowed = {"status", "total", "completed", "error"}
+    columns = [key for key in fields if key in allowed]
+    with transaction(DB_PATH) as conn:
+        assignments = ", ".join(f"{key}=?" for key in columns + ["updated"])
+        conn.execute(f"UPDATE review_jobs SET {assignments} WHERE id=?",
+                     [fields[key] for key in columns] + [str(datetime.now().isoformat()), job_id])
+
+
+def save_job_files(job_id: str, code_files: dict):
+    """
+    保存任务需要审查的文件列表
+
+    :param job_id: 任务id
+    :param code_files: {文件路径: {"language": str, "code": str}}
+    :return: None
+    """
+
+    with transaction(DB_PATH) as conn:
+        conn.executemany("""
+            INSERT OR IGNORE INTO review_job_files (job_id, idx, file, language, code, status, result)
+            VALUES (?, ?, ?, ?, ?, 'pending', '')
+        """, [(job_id, idx, file_path, file_data["language"], file_data["code"])
+              for idx, (file_path, file_data) in enumerate(code_files.items())])
+        conn.execute("UPDATE review_jobs SET total=?, updated=? WHERE id=?",
+                     (len(code_files), str(datetime.now().isoformat()), job_id))
+
+
+def get_job_files(job_id: str, with_code: bool = True) -> list:
+    """
+    获取任务的文件列表
+
+    :param job_id: 任务id
+    :param with_code: 是否包含源代码
+    :return: 按文件顺序排列的字典列表，result 已反序列化
+    """
+
+    conn = get_connection(DB_PATH)
+    columns = "idx, file, language, status, result" + (", code" if with_code else "")
+    rows = conn.execute(f"SELECT {columns} FROM review_job_files WHERE job_id=? ORDER BY idx", (job_id,)).fetchall()
+
+    files = []
+    for row in rows:
+        item = dict(row)
+        item["result"] = loads(row["result"]) if row["result"] else None
+        files.append(item)
+
+    return files
+
+
+def prune_jobs(before: str) -> int:
+    """
+    删除在指定时间之前结束的任务及其文件（审查结果已另外保存到历史记录）
+
+    :param before: ISO格式时间，最后更新早于该时间的已完成或失败任务会被删除
+    :return: 删除的任务数
+    """
+
+    with transaction(DB_PATH) as conn:
+        conn.execute("""
+            DELETE FROM review_job_files WHERE job_id IN (
+                SELECT id FROM review_jobs WHERE status IN ('completed', 'failed') AND updated < ?
+            )
+        """, (before,))
+        removed = conn.execute("DELETE FROM review_jobs WHERE status IN ('completed', 'failed') AND updated < ?",
+                               (before,)).rowcount
+
+    if removed:
+        logger.info(f"清理已结束的审查任务 {removed} 个")
+
+    return removed
+
+
+def save_job_file_result(job_id: str, idx: int, result: dict):
+    """
+    保存单个文件的审查结果并累加任务进度
+
+    :param job_id: 任务id
+    :param idx: 文件序号
+    :param result: 审查结果
+    :return: None
+    """
+
+    with transaction(DB_PATH) as conn:
+        conn.execute("UPDATE review_job_files SET status='done', result=? WHERE job_id=? AND idx=?",
+                     (dumps(result, ensure_ascii=False), job_id, idx))
+        conn.execute("""
+            UPDATE review_jobs SET updated=?,
+                completed=(SELECT COUNT(*) FROM review_job_files WHERE job_id=? AND status='done')
+            WHERE id=?
+        """, (str(datetime.now().isoformat()), job_id, job_id))
@@ -0,0 +1,149 @@
+#!/usr/bin/env python
+# _*_ coding: utf-8 _*_
+# @Time : 2026/10/18 下午4:20
+# @Author : Huzhaojun
+# @Version：V 1.0
+# @File : writer.py
+# @desc : 审查记录的后台批量写入，请求处理只负责入队，由独立线程按条数或时间间隔合并为单个事务写入
+
+import queue
+import threading
+import time
+from typing import List, Optional, Tuple
+
+from backend.core.logger import Config, setup_logger
+from backend.database.sqlite_db import save_review, save_reviews
+
+# 加载配置和安装记录器
+config = Config("./config.yaml")
+logger = setup_logger(config)
+
+# 单个事务最多写入的记录数
+BATCH_SIZE = max(1, int(config.get_nested("database_set", "WRITE_BATCH_SIZE", default=100)))
+# 收到第一条记录后最长等待多久写入（毫秒）
+FLUSH_INTERVAL = float(config.get_nested("database_set", "WRITE_FLUSH_MS", default=200)) / 1000
+
+# 队列元素：(审查结果, 运行id)；threading.Event 表示刷新请求；None 表示退出
+_queue: "queue.Queue" = queue.Queue()
+_thread: Optional[threading.Thread] = None
+_thread_lock = threading.Lock()
+
+
+def _write(batch: List[Tuple[dict, Optional[int]]]) -> None:
+    try:
+        save_reviews(batch)
+
+    except Exception as err:
+        logger.error(f"批量保存审查记录失败 ({len(batch)} 条): {err}")
+        if len(batch) > 1:
+            # 整个事务已回滚，逐条重新保存，只丢失出错的记录
+            for results, run_id in batch:
+                save_review(results, run_id)
+
+
+def _run() -> None:
+    """写入线程：凑满 BATCH_SIZE 条或等待 FLUSH_INTERVAL 后写入一批"""
+
+    while True:
+        item = _queue.get()
+        batch: List[Tuple[dict, Optional[int]]] = []
+        waiters: List[threading.Event] = []
+        stop = False
+        deadline = time.monotonic() + FLUSH_INTERVAL
+
+        while True:
+            if item is None:
+                stop = True
+
+            elif isinstance(item, threading.Event):
+                waiters.append(item)
+
+            else:
+                batch.append(item)
+
+            # 收到刷新或退出请求时立即写入
+            if stop or waiters or len(batch) >= BATCH_SIZE:
+                break
+
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+
+            try:
+                item = _queue.get(timeout=remaining)
+
+            except queue.Empty:
+                break
+
+        # 退出前写完队列中剩余的记录
+        if stop:
+            while True:
+                try:
+                    item = _queue.get_nowait()
+
+                except queue.Empty:
+                    break
+
+                if isinstance(item, threading.Event):
+                    waiters.append(item)
+
+                elif item is not None:
+                    batch.append(item)
+
+        for start in range(0, len(batch), BATCH_SIZE):
+            _write(batch[start:start + BATCH_SIZE])
+
+        for waiter in waiters:
+            waiter.set()
+
+        if stop:
+            return
+
+
+def _ensure_thread() -> None:
+    global _thread
+
+    with _thread_lock:
+        if _thread is None or not _thread.is_alive():
+            _thread = threading.Thread(target=_run, name="review-writer", daemon=True)
+            _thread.start()
+
+
+def submit_review(results: dict, run_id: Optional[int] = None) -> None:
+    """
+    提交一条审查记录，立即返回，由写入线程批量保存
+
+    :param results: 审查结果，格式见 sqlite_db.save_review
+    :param run_id: 所属运行
+    :return: None
+    """
+
+    _ensure_thread()
+    _queue.put((results, run_id))
+
+
+def flush_writes(timeout: Optional[float] = None) -> bool:
+    """
+    等待调用前提交的记录全部写入
+
+    :param timeout: 最长等待秒数
+    :return: 是否在超时前完成
+    """
+
+    _ensure_thread()
+    done = threading.Event()
+    _queue.put(done)
+    return done.wait(timeout)
+
+
+def stop_writer() -> None:
+    """写完剩余记录并停止写入线程，在服务退出时调用"""
+
+    global _thread
+
+    with _thread_lock:
+        thread, _thread = _thread, None
+
+    if thread is not None and thread.is_alive():
+        _queue.put(None)
+        thread.join()
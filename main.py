@@ -16,8 +16,15 @@ from fastapi.responses import JSONResponse, FileResponse
 from fastapi.staticfiles import StaticFiles
 
 # 本地模块导入
-from backend.api import review, github, history, mindmap, deleteHistory
+from backend.api import review, github, history, mindmap, deleteHistory, jobs
 from backend.core.logger import Config, setup_logger
+from backend.core.clients import get_client_metrics, close_clients
+from backend.core.parser import load_languages
+from backend.core.languages import load_language_registry
+from backend.core.analysis import start_process_pool, close_process_pool
+from backend.database.connection import init_database, close_connections
+from backend.database.maintenance import start_maintenance, stop_maintenance
+from backend.database.writer import stop_writer
 # from socket import gethostname, gethostbyname_ex, getaddrinfo    # 获取ip地址
 import ipaddress
 import socket
@@ -194,6 +201,19 @@ app.add_middleware(
     allow_headers=["*"],
 
 )
+# 启动时加载语言库和后缀表、启动分析进程池、初始化数据库表结构，并开始定期维护
+app.add_event_handler("startup", load_languages)
+app.add_event_handler("startup", load_language_registry)
+app.add_event_handler("startup", start_process_pool)
+app.add_event_handler("startup", init_database)
+app.add_event_handler("startup", start_maintenance)
+# 退出时写完待保存的记录，关闭分析进程池、模型客户端连接池和数据库连接
+app.add_event_handler("shutdown", stop_maintenance)
+app.add_event_handler("shutdown", stop_writer)
+app.add_event_handler("shutdown", close_process_pool)
+app.add_event_handler("shutdown", close_clients)
+app.add_event_handler("shutdown", close_connections)
+
 # https://github.com/Ashisheng2005/Live2dTK
 # 包含API路由器
 # 重构
@@ -206,6 +226,8 @@ app.include_router(history)
 app.include_router(mindmap)
 # 删除记录节点
 app.include_router(deleteHistory)
+# 后台审查任务
+app.include_router(jobs)
 
 if mode.lower() == "test":
     logger.info(f"当前模式： Test")
@@ -254,7 +276,7 @@ async def health_check():
     返回：包含状态和消息的字典。
     """
     logger.info("请求运行状况检查")
-    return {"status": "healthy", "message": "API is running"}
+    return {"status": "healthy", "message": "API is running", "model_clients": get_client_metrics()}
 
 
 if __name__ == "__main__":
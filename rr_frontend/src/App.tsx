@@ -56,6 +56,7 @@ interface MindmapEdge {
 interface MindmapResponse {
   nodes: MindmapNode[];
   edges: MindmapEdge[];
+  graph_id?: string;
 }
 
 const App: React.FC = () => {
@@ -203,7 +204,7 @@ const App: React.FC = () => {
       const response = await fetch('/api/mindmap/', {
         method: 'POST',
         headers: { 'Content-Type': 'application/json', 'Access-Control-Allow-Origin': '*' },
-        body: JSON.stringify({ files: fileList, github_url: githubUrl, branch })
+        body: JSON.stringify({ files: fileList, github_url: githubUrl, branch, lazy: true })
       });
       const data: MindmapResponse = await response.json();
       if (response.ok) {
@@ -3,6 +3,7 @@ export function renderMindmap(
   data: {
     nodes: Array<{ id: string | number; label: string; details: string; code: string }>;
     edges: Array<{ from_: string | number; to: string | number }>;
+    graph_id?: string;
   },
   containerId: string,
   detailsId: string
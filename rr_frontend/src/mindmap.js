@@ -82,17 +82,41 @@ export function renderMindmap(data, containerId, detailsId) {
     const network = new Network(container, { nodes, edges }, options);
     network.stabilize();
 
+    const showNode = node => {
+      detailsDiv.innerHTML = `
+        <h3 class="text-lg font-bold text-gray-200">${node.label}</h3>
+        <p class="text-gray-300">${node.details}</p>
+        <pre class="bg-gray-900 p-2 rounded text-gray-200 text-sm overflow-auto">${node.code.slice(0, 200)}...</pre>
+      `;
+    };
+
     // 点击事件
     network.on('click', params => {
       if (params.nodes.length > 0) {
         const nodeId = params.nodes[0];
         const node = nodeMap.get(nodeId);
-        if (node) {
-          detailsDiv.innerHTML = `
-            <h3 class="text-lg font-bold text-gray-200">${node.label}</h3>
-            <p class="text-gray-300">${node.details}</p>
-            <pre class="bg-gray-900 p-2 rounded text-gray-200 text-sm overflow-auto">${node.code.slice(0, 200)}...</pre>
-          `;
+        if (!node) {
+          return;
+        }
+
+        // 只返回图结构时，节点的代码与概括在首次点击时获取
+        if (data.graph_id && !node.code && !node.loaded) {
+          detailsDiv.innerHTML = `<h3 class="text-lg font-bold text-gray-200">${node.label}</h3><p class="text-gray-400">加载中...</p>`;
+          fetch(`/api/mindmap/node?graph_id=${encodeURIComponent(data.graph_id)}&node_id=${encodeURIComponent(node.id)}`)
+            .then(res => res.ok ? res.json() : Promise.reject(new Error(`HTTP ${res.status}`)))
+            .then(details => {
+              node.details = details.details;
+              node.code = details.code;
+              node.loaded = true;
+              nodes.update({ id: node.id, title: node.details });
+              showNode(node);
+            })
+            .catch(e => {
+              console.error('获取节点详情失败:', e);
+              detailsDiv.innerHTML = '<p class="text-gray-400">获取节点详情失败</p>';
+            });
+        } else {
+          showNode(node);
         }
       } else {
         detailsDiv.innerHTML = '<p class="text-gray-400">点击节点查看详情</p>';